@@ -0,0 +1,32 @@
+"""
+Operaciones de administración por HTTP.
+
+Las rutas que borran en lote o recorren los buckets (por ahora las de imágenes huérfanas)
+piden la cabecera `X-Admin-Token` con el valor de ADMIN_TOKEN. Sin ADMIN_TOKEN configurado
+quedan deshabilitadas por HTTP y solo se usan desde consola (python -m supa.recolector).
+
+Uso en una ruta:
+    @router.post("/...", dependencies=[Depends(requiere_admin)])
+"""
+import os
+import secrets
+
+from fastapi import Header
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+class AccesoDenegado(Exception):
+    def __init__(self, estado: int, detalle: str):
+        super().__init__(detalle)
+        self.estado = estado
+        self.detalle = detalle
+
+
+def requiere_admin(x_admin_token: str | None = Header(None)):
+    """Dependencia: deja pasar solo con X-Admin-Token igual a ADMIN_TOKEN (main.py responde el error)."""
+    if not ADMIN_TOKEN:
+        raise AccesoDenegado(403, "Operación de administración deshabilitada: configura ADMIN_TOKEN")
+    # compare_digest: el tiempo de la comparación no dice cuántos caracteres coinciden
+    if not x_admin_token or not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise AccesoDenegado(401, "Falta X-Admin-Token o no es válido")
@@ -0,0 +1,265 @@
+"""
+Control de admisión para escrituras y subidas (middleware ASGI).
+
+Las rutas que escriben no tienen autenticación: una ráfaga de subidas o de formularios
+ocupa las 5 conexiones del pool de db.py y las lecturas se quedan esperando. Antes de
+leer el cuerpo de la petición se aplican dos límites por clase de ruta:
+
+- cubeta de fichas por cliente: `tasa` peticiones por segundo con ráfagas de hasta `rafaga`;
+  si no quedan fichas se responde 429 con Retry-After
+- concurrencia: como mucho `concurrentes` peticiones de la clase a la vez. Con modo "cola"
+  las demás esperan turno (hasta `cola_max` y `espera_max` segundos); con modo "descartar"
+  se rechazan enseguida. En ambos casos el rechazo es un 503 con Retry-After
+
+GET, HEAD y OPTIONS no pasan por aquí: las lecturas no compiten con las escrituras
+por los cupos y conservan conexiones libres en el pool.
+"""
+import asyncio
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from starlette.responses import JSONResponse
+
+# Cuántos clientes recuerda cada cubeta; los menos recientes se olvidan (vuelven con la cubeta llena)
+MAX_CLIENTES = int(os.getenv("ADMISION_MAX_CLIENTES", "10000"))
+
+# Detrás de un proxy todas las peticiones llegan desde su IP: usar X-Forwarded-For
+CONFIAR_PROXY = os.getenv("ADMISION_CONFIAR_PROXY", "0") == "1"
+
+MODOS = ("cola", "descartar")
+
+METODOS_LECTURA = ("GET", "HEAD", "OPTIONS")
+
+
+class Rechazo(Exception):
+    def __init__(self, estado: int, detalle: str, reintentar: float):
+        super().__init__(detalle)
+        self.estado = estado
+        self.detalle = detalle
+        self.reintentar = reintentar
+
+
+# ---------------------------
+# CUBETA DE FICHAS POR CLIENTE
+# ---------------------------
+class Cubetas:
+    def __init__(self, tasa: float, rafaga: int, max_clientes: int = MAX_CLIENTES):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.max_clientes = max_clientes
+        # cliente -> (fichas, última recarga)
+        self._cubetas: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def tomar(self, cliente: str) -> float:
+        """Consume una ficha del cliente. Devuelve 0 si había, o los segundos hasta la próxima."""
+        ahora = time.monotonic()
+        with self._lock:
+            fichas, ultima = self._cubetas.pop(cliente, (self.rafaga, ahora))
+            fichas = min(self.rafaga, fichas + (ahora - ultima) * self.tasa)
+            if fichas >= 1:
+                fichas -= 1
+                espera = 0.0
+            else:
+                espera = (1 - fichas) / self.tasa
+            self._cubetas[cliente] = (fichas, ahora)
+            while len(self._cubetas) > self.max_clientes:
+                self._cubetas.popitem(last=False)
+            return espera
+
+    @property
+    def clientes(self) -> int:
+        return len(self._cubetas)
+
+
+# ---------------------------
+# LÍMITE DE CONCURRENCIA
+# ---------------------------
+class Compuerta:
+    """
+    Semáforo con cola acotada. Cada espera es un Future propio, así no queda atado al
+    event loop en que se creó la compuerta (TestClient y loadtest arrancan loops nuevos).
+    """
+
+    def __init__(self, concurrentes: int, cola_max: int, espera_max: float, modo: str):
+        if modo not in MODOS:
+            raise ValueError(f"ADMISION_MODO debe ser uno de {MODOS}, no {modo!r}")
+        self.concurrentes = concurrentes
+        self.cola_max = cola_max
+        self.espera_max = espera_max
+        self.modo = modo
+        self._activas = 0
+        self._esperando: deque[asyncio.Future] = deque()
+
+    async def entrar(self):
+        if self._activas < self.concurrentes and not self._esperando:
+            self._activas += 1
+            return
+        if self.modo == "descartar" or len(self._esperando) >= self.cola_max:
+            raise Rechazo(503, "Demasiadas escrituras en curso, intenta de nuevo en unos segundos", 1)
+
+        turno = asyncio.get_running_loop().create_future()
+        self._esperando.append(turno)
+        try:
+            await asyncio.wait_for(turno, self.espera_max)
+        except asyncio.TimeoutError:
+            raise Rechazo(503, "Servidor ocupado, intenta de nuevo en unos segundos", 5)
+        finally:
+            if turno in self._esperando:
+                self._esperando.remove(turno)
+            elif turno.done() and not turno.cancelled() and asyncio.current_task().cancelling():
+                # Nos cedieron el cupo justo cuando se cancelaba la espera: devolverlo
+                self.salir()
+
+    def salir(self):
+        # El cupo pasa directo al primero que sigue esperando; si no hay nadie, se libera
+        while self._esperando:
+            turno = self._esperando.popleft()
+            if not turno.done():
+                turno.set_result(None)
+                return
+        self._activas -= 1
+
+    @property
+    def activas(self) -> int:
+        return self._activas
+
+    @property
+    def en_cola(self) -> int:
+        return len(self._esperando)
+
+
+class ClaseAdmision:
+    def __init__(self, nombre: str, tasa: float, rafaga: int, concurrentes: int,
+                 cola_max: int, espera_max: float, modo: str):
+        self.nombre = nombre
+        self.cubetas = Cubetas(tasa, rafaga)
+        self.compuerta = Compuerta(concurrentes, cola_max, espera_max, modo)
+
+        # Métricas
+        self._admitidas = 0
+        self._limitadas = 0
+        self._descartadas = 0
+        self._espera_total = 0.0
+        self._espera_max_vista = 0.0
+
+    async def admitir(self, cliente: str):
+        espera = self.cubetas.tomar(cliente)
+        if espera:
+            self._limitadas += 1
+            raise Rechazo(429, "Demasiadas peticiones, espera antes de reintentar", espera)
+        inicio = time.perf_counter()
+        try:
+            await self.compuerta.entrar()
+        except Rechazo:
+            self._descartadas += 1
+            raise
+        espera = time.perf_counter() - inicio
+        self._admitidas += 1
+        self._espera_total += espera
+        self._espera_max_vista = max(self._espera_max_vista, espera)
+
+    def metricas(self) -> dict:
+        compuerta = self.compuerta
+        return {
+            "tasa": self.cubetas.tasa,
+            "rafaga": self.cubetas.rafaga,
+            "concurrentes": compuerta.concurrentes,
+            "cola_max": compuerta.cola_max,
+            "modo": compuerta.modo,
+            "activas": compuerta.activas,
+            "en_cola": compuerta.en_cola,
+            "clientes": self.cubetas.clientes,
+            "admitidas": self._admitidas,
+            "limitadas": self._limitadas,
+            "descartadas": self._descartadas,
+            "espera_promedio_ms": (self._espera_total / self._admitidas * 1000) if self._admitidas else 0.0,
+            "espera_max_ms": self._espera_max_vista * 1000,
+        }
+
+
+# ---------------------------
+# CLASES GLOBALES
+# ---------------------------
+# "subidas": POST /imagenes/upload y crear/editar de ítems, categorías, ubicaciones e
+#   interacciones, que reciben la imagen en el mismo formulario (lento, ocupa un hilo de
+#   subidas y ancho de banda)
+# "escrituras": el resto de POST/PUT/PATCH/DELETE; menos cupos que conexiones en el pool
+#   de db.py, para que siempre quede alguna para las lecturas
+MODO = os.getenv("ADMISION_MODO", "cola")
+
+CLASES = {
+    "subidas": ClaseAdmision(
+        "subidas",
+        tasa=float(os.getenv("ADMISION_SUBIDAS_TASA", "1")),
+        rafaga=int(os.getenv("ADMISION_SUBIDAS_RAFAGA", "5")),
+        concurrentes=int(os.getenv("ADMISION_SUBIDAS_CONCURRENTES", "2")),
+        cola_max=int(os.getenv("ADMISION_SUBIDAS_COLA", "8")),
+        espera_max=float(os.getenv("ADMISION_SUBIDAS_ESPERA", "10")),
+        modo=MODO,
+    ),
+    "escrituras": ClaseAdmision(
+        "escrituras",
+        tasa=float(os.getenv("ADMISION_ESCRITURAS_TASA", "5")),
+        rafaga=int(os.getenv("ADMISION_ESCRITURAS_RAFAGA", "20")),
+        concurrentes=int(os.getenv("ADMISION_ESCRITURAS_CONCURRENTES", "3")),
+        cola_max=int(os.getenv("ADMISION_ESCRITURAS_COLA", "32")),
+        espera_max=float(os.getenv("ADMISION_ESCRITURAS_ESPERA", "5")),
+        modo=MODO,
+    ),
+}
+
+# POST /imagenes/upload, POST /<entidad>/ (crear) y PUT /<entidad>/<id> (editar)
+RUTAS_SUBIDA = re.compile(r"^/(imagenes/upload|(items|categorias|ubicaciones|interacciones)(/\d+)?)/?$")
+METODOS_SUBIDA = ("POST", "PUT")
+
+
+def clase_de(metodo: str, ruta: str) -> ClaseAdmision | None:
+    if metodo in METODOS_LECTURA:
+        return None
+    if metodo in METODOS_SUBIDA and RUTAS_SUBIDA.match(ruta):
+        return CLASES["subidas"]
+    return CLASES["escrituras"]
+
+
+def cliente_de(scope: dict) -> str:
+    if CONFIAR_PROXY:
+        for clave, valor in scope["headers"]:
+            if clave == b"x-forwarded-for":
+                return valor.decode("latin-1").split(",")[0].strip()
+    cliente = scope.get("client")
+    return cliente[0] if cliente else "desconocido"
+
+
+class Admision:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        clase = clase_de(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if clase is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await clase.admitir(cliente_de(scope))
+        except Rechazo as r:
+            respuesta = JSONResponse(
+                {"detail": r.detalle},
+                status_code=r.estado,
+                headers={"Retry-After": str(max(1, math.ceil(r.reintentar)))},
+            )
+            await respuesta(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            clase.compuerta.salir()
+
+
+def metricas() -> dict:
+    return {nombre: c.metricas() for nombre, c in CLASES.items()}
@@ -0,0 +1,234 @@
+"""
+Archivado de filas eliminadas hace tiempo.
+
+El soft delete solo pone activo=False, así que las tablas y las de enlace crecen para
+siempre y cada consulta de activos tiene que saltar filas muertas. Este job mueve a la
+tabla Archivado las filas eliminadas hace más de ARCHIVO_RETENCION_DIAS días, y sus enlaces
+a EnlaceArchivado. Trabaja en lotes, cada uno en su propia transacción.
+
+restaurar_* de crud.py sigue funcionando: si la fila no está en su tabla, la trae del
+archivo con desarchivar(). Sus enlaces vuelven cuando el otro extremo también está activo.
+
+Ids: un id archivado no se puede volver a usar, o desarchivar() traería otra fila. Las
+tablas nuevas tienen AUTOINCREMENT en SQLite (secuencia en Postgres); en las creadas antes,
+SQLite da max(id) + 1, así que la fila con el id más alto de cada tabla no se archiva.
+
+Este job corre en su propio proceso: sube las generaciones de la caché de lo que archiva,
+y los workers de la app lo notan y reconstruyen sus índices en memoria (cache.Vigencia).
+
+Uso:
+    python -m archivo              # solo reporte (dry-run)
+    python -m archivo --ejecutar   # archiva de verdad
+"""
+import argparse
+import datetime
+import json
+import os
+
+from sqlalchemy import delete, func, update
+from sqlmodel import Session, select
+
+import crud
+from cache import cache
+from models import (
+    Archivado, EnlaceArchivado, Item, Categoria, Ubicacion, Interaccion,
+    ItemCategoriaLink, ItemLocationLink, ItemInteraccionLink,
+)
+
+RETENCION_DIAS = int(os.getenv("ARCHIVO_RETENCION_DIAS", "90"))
+
+# Filas por transacción
+LOTE = 500
+
+MODELOS = {"item": Item, "categoria": Categoria, "ubicacion": Ubicacion, "interaccion": Interaccion}
+
+# tipo de nodo -> (tabla de enlace, columna del nodo)
+ENLACES = {
+    "categoria": (ItemCategoriaLink, "categoria_id"),
+    "ubicacion": (ItemLocationLink, "ubicacion_id"),
+    "interaccion": (ItemInteraccionLink, "interaccion_id"),
+}
+
+
+def _condiciones_enlace(entidad: str, ids: list[int]):
+    """(tipo, tabla, columna, condición) de los enlaces que tocan a esas filas."""
+    for tipo, (link, columna) in ENLACES.items():
+        if entidad == "item":
+            yield tipo, link, columna, link.item_id.in_(ids)
+        elif entidad == tipo:
+            yield tipo, link, columna, getattr(link, columna).in_(ids)
+
+
+def _anotar_items(session: Session, item_ids: set[int]):
+    # Los ítems que ganan o pierden enlaces cambian sus *_ids: va al feed y a los índices
+    for item_id in sorted(item_ids):
+        item = session.get(Item, item_id)
+        if item is not None:
+            crud.anotar_cambio(session, "item", "actualizar", item)
+
+
+# ---------------------------
+# ARCHIVAR
+# ---------------------------
+def fechar_eliminados(session: Session) -> int:
+    """Las filas eliminadas antes de existir fecha_eliminacion empiezan a contar la retención ahora."""
+    ahora = datetime.datetime.utcnow()
+    total = 0
+    for modelo in MODELOS.values():
+        resultado = session.execute(
+            update(modelo)
+            .where(modelo.activo == False, modelo.fecha_eliminacion == None)
+            .values(fecha_eliminacion=ahora)
+        )
+        total += resultado.rowcount
+    session.commit()
+    return total
+
+
+def _vencidas(modelo, antes_de: datetime.datetime):
+    return select(modelo).where(
+        modelo.activo == False,
+        modelo.fecha_eliminacion <= antes_de,
+        modelo.id < select(func.max(modelo.id)).scalar_subquery(),
+    )
+
+
+def archivar_lote(session: Session, entidad: str, antes_de: datetime.datetime, lote: int = LOTE) -> int:
+    """Mueve al archivo hasta `lote` filas eliminadas antes de `antes_de`, con sus enlaces."""
+    modelo = MODELOS[entidad]
+    # FOR UPDATE: un restaurar_* en paralelo espera a que termine el lote (SQLite no lo necesita)
+    filas = session.exec(_vencidas(modelo, antes_de).order_by(modelo.id).limit(lote).with_for_update()).all()
+    if not filas:
+        return 0
+    ids = [f.id for f in filas]
+
+    for fila in filas:
+        datos = {campo: getattr(fila, campo) for campo in modelo.model_fields}
+        session.add(Archivado(
+            entidad=entidad,
+            entidad_id=fila.id,
+            datos=json.dumps(datos, default=datetime.datetime.isoformat),
+            fecha_eliminacion=fila.fecha_eliminacion,
+        ))
+    afectados = set()
+    for tipo, link, columna, condicion in _condiciones_enlace(entidad, ids):
+        for item_id, otro_id in session.execute(select(link.item_id, getattr(link, columna)).where(condicion)):
+            session.add(EnlaceArchivado(tipo=tipo, item_id=item_id, otro_id=otro_id))
+            afectados.add(item_id)
+        session.execute(delete(link).where(condicion))
+    session.execute(delete(modelo).where(modelo.id.in_(ids)).execution_options(synchronize_session=False))
+    if entidad != "item":
+        _anotar_items(session, afectados)
+    crud.confirmar_cambios(session)
+    # Las filas archivadas no generan eventos: que los workers lo noten por la generación
+    cache.invalidar(entidad)
+    session.expunge_all()
+    return len(ids)
+
+
+def archivar(
+    session: Session,
+    retencion_dias: int = RETENCION_DIAS,
+    lote: int = LOTE,
+    dry_run: bool = True,
+) -> dict:
+    antes_de = datetime.datetime.utcnow() - datetime.timedelta(days=retencion_dias)
+    reporte = {"dry_run": dry_run, "retencion_dias": retencion_dias, "entidades": {}}
+    if not dry_run:
+        reporte["fechados"] = fechar_eliminados(session)
+
+    for entidad, modelo in MODELOS.items():
+        if dry_run:
+            vencidas = session.exec(select(func.count()).select_from(_vencidas(modelo, antes_de).subquery())).one()
+            reporte["entidades"][entidad] = {"vencidas": vencidas, "archivadas": 0}
+            continue
+        archivadas = 0
+        while n := archivar_lote(session, entidad, antes_de, lote):
+            archivadas += n
+        reporte["entidades"][entidad] = {"vencidas": archivadas, "archivadas": archivadas}
+    return reporte
+
+
+# ---------------------------
+# LEER Y RESTAURAR
+# ---------------------------
+def _desde_archivo(entidad: str, archivado: Archivado):
+    datos = json.loads(archivado.datos)
+    if datos.get("fecha_eliminacion"):
+        datos["fecha_eliminacion"] = datetime.datetime.fromisoformat(datos["fecha_eliminacion"])
+    return MODELOS[entidad](**datos)
+
+
+def listar_archivados(session: Session, entidad: str) -> list:
+    """Filas archivadas como instancias del modelo (sin sesión), para las listas de eliminados."""
+    archivados = session.exec(
+        select(Archivado).where(Archivado.entidad == entidad).order_by(Archivado.entidad_id)
+    ).all()
+    return [_desde_archivo(entidad, a) for a in archivados]
+
+
+def enlaces_archivados(session: Session, tipo: str, item_ids: list[int]) -> dict[int, list[int]]:
+    """item_id -> ids de nodos del `tipo` cuyos enlaces están en el archivo."""
+    enlaces: dict[int, list[int]] = {}
+    if not item_ids:
+        return enlaces
+    for item_id, otro_id in session.exec(
+        select(EnlaceArchivado.item_id, EnlaceArchivado.otro_id)
+        .where(EnlaceArchivado.tipo == tipo, EnlaceArchivado.item_id.in_(item_ids))
+    ):
+        enlaces.setdefault(item_id, []).append(otro_id)
+    return enlaces
+
+
+def desarchivar(session: Session, entidad: str, entidad_id: int):
+    """
+    Devuelve la fila archivada a su tabla, sin hacer commit (lo hace restaurar_*).
+    Devuelve la instancia, o None si no estaba en el archivo.
+    """
+    archivado = session.exec(
+        select(Archivado).where(Archivado.entidad == entidad, Archivado.entidad_id == entidad_id)
+    ).first()
+    if not archivado:
+        return None
+    obj = _desde_archivo(entidad, archivado)
+    session.add(obj)
+    session.delete(archivado)
+    session.flush()
+
+    if entidad == "item":
+        pendientes = session.exec(select(EnlaceArchivado).where(EnlaceArchivado.item_id == entidad_id)).all()
+    else:
+        pendientes = session.exec(
+            select(EnlaceArchivado).where(EnlaceArchivado.tipo == entidad, EnlaceArchivado.otro_id == entidad_id)
+        ).all()
+    afectados = set()
+    for enlace in pendientes:
+        otro = session.get(MODELOS[enlace.tipo], enlace.otro_id) if entidad == "item" else session.get(Item, enlace.item_id)
+        if otro is None:
+            continue  # el otro extremo sigue archivado: el enlace vuelve cuando se restaure
+        link, columna = ENLACES[enlace.tipo]
+        session.add(link(item_id=enlace.item_id, **{columna: enlace.otro_id}))
+        session.delete(enlace)
+        afectados.add(enlace.item_id)
+    session.flush()
+    if entidad != "item":
+        _anotar_items(session, afectados)
+    return obj
+
+
+def main():
+    from db import engine
+
+    parser = argparse.ArgumentParser(description="Archiva las filas eliminadas hace más que la retención")
+    parser.add_argument("--ejecutar", action="store_true", help="archivar de verdad (por defecto solo reporta)")
+    parser.add_argument("--dias", type=int, default=RETENCION_DIAS, help="días desde el soft delete")
+    parser.add_argument("--lote", type=int, default=LOTE, help="filas por transacción")
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        reporte = archivar(session, retencion_dias=args.dias, lote=args.lote, dry_run=not args.ejecutar)
+    print(json.dumps(reporte, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
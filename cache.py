@@ -0,0 +1,450 @@
+"""
+Caché de lecturas del catálogo, compartida entre los workers de uvicorn/gunicorn.
+
+Con varios workers, un dict en memoria queda duplicado en cada proceso y solo se
+entera de las escrituras hechas en el suyo. Por eso la caché va en un backend
+intercambiable, elegido con CACHE_BACKEND:
+
+- "compartida" (defecto): archivo SQLite en /dev/shm (memoria compartida), lo abren todos los workers.
+  Va en un directorio propio del usuario (modo 0700): los valores se leen con pickle y otro
+  usuario de la máquina no debe poder crear ni cambiar el archivo
+- "redis": un servidor Redis o compatible (Valkey, KeyDB...) en CACHE_REDIS_URL; requiere el paquete redis
+- "local": dict dentro del proceso, solo sirve con un único worker
+- "ninguna": sin caché
+
+Invalidación: cada entidad tiene un número de generación guardado en el backend. Las
+entradas recuerdan las generaciones con que se calcularon y dejan de valer cuando alguna
+cambia. crud.py publica cada escritura confirmada en el bus (eventos.py) y este módulo
+sube la generación de esa entidad; como el contador está en el backend compartido,
+todos los workers lo ven en su siguiente lectura. Los índices en memoria usan los mismos
+contadores para notar las escrituras de otros procesos (Vigencia).
+"""
+import abc
+import functools
+import logging
+import os
+import pickle
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import tareas
+from db import LEER_PRIMARIA_SEGUNDOS, engine
+from eventos import Evento, suscribir
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "compartida")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", "2000"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+_DIR_COMPARTIDO = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def directorio_privado(base: str = _DIR_COMPARTIDO) -> str:
+    """
+    <base>/blasphemous-<uid>, creado con modo 0700. /dev/shm y /tmp son de todos: si el
+    directorio ya existe y es de otro usuario, un enlace o lo pueden abrir otros, se rechaza.
+    """
+    uid = os.getuid() if hasattr(os, "getuid") else None
+    ruta = os.path.join(base, f"blasphemous-{uid}" if uid is not None else "blasphemous")
+    try:
+        os.mkdir(ruta, 0o700)
+    except FileExistsError:
+        pass
+    if uid is not None:
+        info = os.lstat(ruta)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != uid or info.st_mode & 0o077:
+            raise RuntimeError(
+                f"{ruta} no es un directorio privado de este usuario (dueño {info.st_uid}, "
+                f"modo {stat.filemode(info.st_mode)}); bórralo o indica otra ruta"
+            )
+    return ruta
+
+
+CACHE_RUTA = os.getenv("CACHE_RUTA") or os.path.join(directorio_privado(), "cache.db")
+
+
+# ---------------------------
+# BACKENDS
+# 🔹 Guardan bytes (pickle) y los contadores de generación por entidad
+# ---------------------------
+class BackendCache(abc.ABC):
+    nombre = "base"
+
+    @abc.abstractmethod
+    def leer(self, clave: str) -> tuple[str, bytes] | None:
+        """(generaciones, valor) si la entrada existe y no venció."""
+
+    @abc.abstractmethod
+    def escribir(self, clave: str, generaciones: str, valor: bytes, ttl: int):
+        ...
+
+    @abc.abstractmethod
+    def generaciones(self, entidades: tuple[str, ...]) -> str:
+        """Las generaciones actuales de esas entidades, como texto comparable ("3.0.12")."""
+
+    @abc.abstractmethod
+    def invalidar(self, entidad: str):
+        ...
+
+    @abc.abstractmethod
+    def vaciar(self):
+        ...
+
+
+class CacheLocal(BackendCache):
+    nombre = "local"
+
+    def __init__(self, max_entradas: int = CACHE_MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._entradas: OrderedDict[str, tuple[str, float, bytes]] = OrderedDict()
+        self._generaciones: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def leer(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[1] < time.time():
+                return None
+            self._entradas.move_to_end(clave)
+            return entrada[0], entrada[2]
+
+    def escribir(self, clave, generaciones, valor, ttl):
+        with self._lock:
+            self._entradas[clave] = (generaciones, time.time() + ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def generaciones(self, entidades):
+        with self._lock:
+            return ".".join(str(self._generaciones.get(e, 0)) for e in entidades)
+
+    def invalidar(self, entidad):
+        with self._lock:
+            self._generaciones[entidad] = self._generaciones.get(entidad, 0) + 1
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+            for entidad in self._generaciones:
+                self._generaciones[entidad] += 1
+
+
+class CacheCompartida(BackendCache):
+    """
+    SQLite en un archivo de /dev/shm: vive en RAM y lo comparten todos los procesos
+    del mismo usuario. Una conexión por hilo; WAL deja leer mientras otro escribe.
+    """
+    nombre = "compartida"
+
+    def __init__(self, ruta: str = CACHE_RUTA, max_entradas: int = CACHE_MAX_ENTRADAS):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self._local = threading.local()
+        self._escrituras = 0
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entrada (
+                clave TEXT PRIMARY KEY,
+                generaciones TEXT NOT NULL,
+                expira REAL NOT NULL,
+                valor BLOB NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS generacion (entidad TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_entrada_expira ON entrada (expira)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Es una caché en RAM: si se corta la luz no hay nada que proteger
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def leer(self, clave):
+        fila = self._conn().execute(
+            "SELECT generaciones, valor FROM entrada WHERE clave = ? AND expira >= ?", (clave, time.time())
+        ).fetchone()
+        return (fila[0], fila[1]) if fila else None
+
+    def escribir(self, clave, generaciones, valor, ttl):
+        conn = self._conn()
+        ahora = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO entrada (clave, generaciones, expira, valor) VALUES (?, ?, ?, ?)",
+            (clave, generaciones, ahora + ttl, valor)
+        )
+        self._escrituras += 1
+        if self._escrituras % 100 == 0:
+            # De vez en cuando: sacar lo vencido y, si sigue grande, lo que vence antes
+            conn.execute("DELETE FROM entrada WHERE expira < ?", (ahora,))
+            conn.execute(
+                "DELETE FROM entrada WHERE clave IN "
+                "(SELECT clave FROM entrada ORDER BY expira DESC LIMIT -1 OFFSET ?)",
+                (self.max_entradas,)
+            )
+
+    def generaciones(self, entidades):
+        marcas = ",".join("?" * len(entidades))
+        actuales = dict(self._conn().execute(
+            f"SELECT entidad, valor FROM generacion WHERE entidad IN ({marcas})", entidades
+        ).fetchall())
+        return ".".join(str(actuales.get(e, 0)) for e in entidades)
+
+    def invalidar(self, entidad):
+        self._conn().execute(
+            "INSERT INTO generacion (entidad, valor) VALUES (?, 1) "
+            "ON CONFLICT (entidad) DO UPDATE SET valor = valor + 1",
+            (entidad,)
+        )
+
+    def vaciar(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM entrada")
+        conn.execute("UPDATE generacion SET valor = valor + 1")
+
+
+class CacheRedis(BackendCache):
+    """Redis o cualquier servidor que hable su protocolo (Valkey, KeyDB, un redis-server local)."""
+    nombre = "redis"
+    PREFIJO = "blasphemous:cache:"
+
+    def __init__(self, url: str = CACHE_REDIS_URL):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis requiere el paquete redis (pip install redis)") from e
+        self._redis = redis.Redis.from_url(url)
+
+    def leer(self, clave):
+        valor = self._redis.get(self.PREFIJO + "e:" + clave)
+        if valor is None:
+            return None
+        generaciones, _, datos = valor.partition(b"|")
+        return generaciones.decode(), datos
+
+    def escribir(self, clave, generaciones, valor, ttl):
+        # Redis se encarga del vencimiento y de desalojar (maxmemory-policy)
+        self._redis.set(self.PREFIJO + "e:" + clave, generaciones.encode() + b"|" + valor, ex=ttl)
+
+    def generaciones(self, entidades):
+        actuales = self._redis.mget([self.PREFIJO + "g:" + e for e in entidades])
+        return ".".join((v or b"0").decode() for v in actuales)
+
+    def invalidar(self, entidad):
+        self._redis.incr(self.PREFIJO + "g:" + entidad)
+
+    def vaciar(self):
+        for clave in self._redis.scan_iter(self.PREFIJO + "*"):
+            if clave.startswith((self.PREFIJO + "g:").encode()):
+                self._redis.incr(clave)
+            else:
+                self._redis.delete(clave)
+
+
+def crear_backend(nombre: str = CACHE_BACKEND) -> BackendCache | None:
+    if nombre == "ninguna":
+        return None
+    if nombre == "local":
+        return CacheLocal()
+    if nombre == "redis":
+        return CacheRedis()
+    return CacheCompartida()
+
+
+# ---------------------------
+# CACHÉ DEL CATÁLOGO
+# ---------------------------
+class Cache:
+    def __init__(self, backend: BackendCache | None, ttl: int = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+        self._errores = 0
+        # Cuántas veces subió este proceso la generación de cada entidad (ver Vigencia)
+        self._propias: dict[str, int] = {}
+
+    def _contar(self, campo: str):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def obtener(self, clave: str, entidades: tuple[str, ...], calcular: Callable, ttl: int | None = None):
+        """
+        Devuelve el valor guardado si sus generaciones siguen vigentes; si no, lo calcula
+        y lo guarda. Si el backend falla se calcula directo: la caché nunca tumba una lectura.
+        """
+        if self.backend is None:
+            return calcular()
+        try:
+            # Las generaciones se leen antes de calcular: si alguien escribe en el medio,
+            # el valor queda guardado con las viejas y no se vuelve a servir
+            generaciones = self.backend.generaciones(entidades)
+            guardado = self.backend.leer(clave)
+        except Exception:
+            logger.exception("Caché %s no disponible", self.backend.nombre)
+            self._contar("_errores")
+            return calcular()
+
+        if guardado is not None and guardado[0] == generaciones:
+            self._contar("_aciertos")
+            return pickle.loads(guardado[1])
+
+        self._contar("_fallos")
+        valor = calcular()
+        try:
+            self.backend.escribir(clave, generaciones, pickle.dumps(valor), ttl or self.ttl)
+        except Exception:
+            logger.exception("No se pudo guardar %s en la caché", clave)
+            self._contar("_errores")
+        return valor
+
+    def revision(self, entidades: tuple[str, ...]) -> str | None:
+        """Generaciones actuales de esas entidades; None sin backend o si el backend falla."""
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.generaciones(entidades)
+        except Exception:
+            logger.exception("Caché %s no disponible", self.backend.nombre)
+            self._contar("_errores")
+            return None
+
+    def estado(self, entidades: tuple[str, ...]) -> tuple[tuple[int, ...], tuple[int, ...]] | None:
+        """(generaciones compartidas, cuántas de esas subidas hizo este proceso); None sin backend."""
+        # Primero las compartidas: si este proceso escribe en el medio, sobra una subida
+        # propia y a lo sumo se reconstruye un índice de más
+        revision = self.revision(entidades)
+        if revision is None:
+            return None
+        with self._lock:
+            propias = tuple(self._propias.get(e, 0) for e in entidades)
+        return tuple(map(int, revision.split("."))), propias
+
+    def invalidar(self, entidad: str):
+        if self.backend is not None:
+            self.backend.invalidar(entidad)
+            with self._lock:
+                self._propias[entidad] = self._propias.get(entidad, 0) + 1
+
+    def vaciar(self):
+        if self.backend is not None:
+            self.backend.vaciar()
+
+    def metricas(self) -> dict:
+        with self._lock:
+            total = self._aciertos + self._fallos
+            return {
+                "backend": self.backend.nombre if self.backend else "ninguna",
+                "aciertos": self._aciertos,
+                "fallos": self._fallos,
+                "errores": self._errores,
+                "tasa_aciertos": (self._aciertos / total) if total else 0.0,
+            }
+
+    # ---------------------------
+    # SUSCRIPTOR DEL BUS
+    # ---------------------------
+    def al_evento(self, evento: Evento):
+        self.invalidar(evento.entidad)
+        # Rellenar las listas en segundo plano; varias escrituras seguidas se juntan en una
+        tareas.cola.encolar("calentar_cache", clave="calentar_cache", reemplazar=True)
+
+
+cache = Cache(crear_backend())
+suscribir(cache.al_evento)
+
+
+# ---------------------------
+# VIGENCIA DE LOS ÍNDICES EN MEMORIA
+# ---------------------------
+class Vigencia:
+    """
+    Los índices de indices/ se mantienen con los eventos de su propio proceso: no se
+    enteran de lo que escriben otros workers. Pero toda escritura sube la generación
+    compartida de su entidad. Si desde que se armó el índice las generaciones subieron
+    más veces de las que las subió este proceso, escribió alguien más.
+    """
+
+    def __init__(self, entidades: tuple[str, ...]):
+        self.entidades = entidades
+        self._base = None
+        self._pedida = 0.0
+
+    def marcar(self):
+        """
+        Antes de leer la base para armar el índice: lo escrito en el medio lo deja viejo.
+        Devuelve la marca que se pasa a fijar() cuando el índice nuevo reemplaza al anterior.
+        """
+        return cache.estado(self.entidades)
+
+    def fijar(self, marca):
+        """Con el índice nuevo ya en uso: hasta ahora vigente() seguía mirando al anterior."""
+        self._base = marca
+
+    def vigente(self) -> bool:
+        """False si otro proceso escribió después de marcar(). Sin caché no hay forma de saberlo: True."""
+        actual = cache.estado(self.entidades) if self._base is not None else None
+        if actual is None:
+            return True
+        (generaciones, propias), (base_generaciones, base_propias) = actual, self._base
+        return all(
+            g - g0 <= p - p0 for g, g0, p, p0 in zip(generaciones, base_generaciones, propias, base_propias)
+        )
+
+    def revisar(self) -> bool:
+        """vigente(); si no, pide la reconstrucción en segundo plano (calentar_cache)."""
+        if self.vigente():
+            return True
+        # Una vez por segundo como mucho: varias lecturas seguidas no encolan varias reconstrucciones
+        ahora = time.monotonic()
+        if ahora - self._pedida > 1:
+            self._pedida = ahora
+            tareas.cola.encolar("calentar_cache", clave="calentar_cache", reemplazar=True)
+        return False
+
+
+def catalogo(*entidades: str):
+    """
+    Decorador para lecturas de crud.py con la forma fn(session, *args). La clave es el
+    nombre de la función con sus argumentos y de dónde se leyó (primaria o réplica); el
+    valor se invalida cuando cambia cualquiera de las `entidades`.
+    """
+    def decorar(fn):
+        @functools.wraps(fn)
+        def envuelta(session, *args):
+            primaria = session.get_bind() is engine
+            # Lo leído de una réplica puede ser anterior a la última escritura aunque se guarde
+            # con la generación nueva: va en otra clave, para que quien tiene la cookie de
+            # lectura en primaria (ver db.py) no lo reciba, y dura lo mismo que esa cookie
+            clave = fn.__name__ + repr(args) + ("" if primaria else "@replica")
+            ttl = None if primaria else LEER_PRIMARIA_SEGUNDOS
+            return cache.obtener(clave, entidades, lambda: fn(session, *args), ttl)
+
+        envuelta.sin_cache = fn
+        return envuelta
+
+    return decorar
+
+
+@tareas.registrar_calentador
+def calentar_listas():
+    import crud
+    from sqlmodel import Session
+
+    with Session(engine) as session:
+        crud.list_categorias(session)
+        crud.list_ubicaciones(session)
+        crud.list_interacciones(session)
+        crud.listar_items(session)
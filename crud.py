@@ -1,7 +1,150 @@
+import datetime
+import json
 from sqlmodel import Session, select
-from models import Item, Categoria, Ubicacion, Interaccion, ItemLocationLink, ItemInteraccionLink, ItemCategoriaLink
+from sqlalchemy import Integer, String, cast, exists, func, inspect, literal, union_all, update
+from models import Item, Categoria, Ubicacion, Interaccion, ItemLocationLink, ItemInteraccionLink, ItemCategoriaLink, Cambio
 from schemas import ItemCreate, ItemUpdate
 from typing import List, Optional
+from sqlalchemy.orm import raiseload
+import tareas
+from eventos import Evento, publicar
+from indices.bitmap import indice_bitmap, a_ids, desde_ids
+from archivo import desarchivar, enlaces_archivados, listar_archivados
+from cache import catalogo
+from proyecciones import FilaItem, consulta_items, filas_items, proyectar_items
+
+
+# Estrategia explícita para las lecturas que devuelven objetos ORM: ninguna relación se
+# carga sola. Si una plantilla o ruta toca c.items, falla en vez de hacer una consulta por fila
+SIN_RELACIONES = raiseload("*")
+
+
+MODELOS = {
+    "item": Item,
+    "categoria": Categoria,
+    "ubicacion": Ubicacion,
+    "interaccion": Interaccion,
+}
+
+
+def ids_enlaces(session: Session, item_id: int) -> dict:
+    return {
+        "categoria_ids": list(session.exec(
+            select(ItemCategoriaLink.categoria_id).where(ItemCategoriaLink.item_id == item_id))),
+        "ubicacion_ids": list(session.exec(
+            select(ItemLocationLink.ubicacion_id).where(ItemLocationLink.item_id == item_id))),
+        "interaccion_ids": list(session.exec(
+            select(ItemInteraccionLink.interaccion_id).where(ItemInteraccionLink.item_id == item_id))),
+    }
+
+
+def anotar_cambio(session: Session, entidad: str, accion: str, obj):
+    """
+    Anota el cambio en la tabla Cambio dentro de la transacción en curso.
+    Se publica para los índices en memoria (ver eventos.py) en confirmar_cambios.
+    """
+    session.flush()
+    datos = {campo: getattr(obj, campo) for campo in type(obj).model_fields}
+    if entidad == "item":
+        datos.update(ids_enlaces(session, obj.id))
+    cambio = Cambio(
+        entidad=entidad,
+        entidad_id=obj.id,
+        accion=accion,
+        version=datos.get("version"),
+        datos=json.dumps(datos, default=datetime.datetime.isoformat),
+    )
+    session.add(cambio)
+    session.flush()
+    session.info.setdefault("eventos", []).append(Evento(entidad, accion, datos["id"], datos, cambio.id))
+
+
+def confirmar_cambios(session: Session):
+    session.commit()
+    for evento in session.info.pop("eventos", []):
+        publicar(evento)
+
+
+def _confirmar(session: Session, entidad: str, accion: str, obj):
+    """Anota el cambio, hace commit y lo publica."""
+    anotar_cambio(session, entidad, accion, obj)
+    confirmar_cambios(session)
+
+
+class ConflictoVersion(Exception):
+    """Otra escritura cambió la fila después de que el cliente la leyó (main.py responde 409)."""
+
+    def __init__(self, entidad: str, entidad_id: int, esperada: int, actual: int | None):
+        super().__init__(f"{entidad} {entidad_id}: se esperaba la versión {esperada} y está en {actual}")
+        self.entidad = entidad
+        self.id = entidad_id
+        self.esperada = esperada
+        self.actual = actual
+
+
+def _guardar_con_version(session: Session, entidad: str, obj, version: int | None = None):
+    """
+    Escribe los cambios pendientes de `obj` con un solo
+    UPDATE ... SET ..., version = version + 1 WHERE id = ? AND version = ?
+    (compare-and-swap: no bloquea la fila). `version` es la que vio el cliente;
+    si no la manda, se usa la que se acaba de leer. No hace commit.
+    """
+    modelo = type(obj)
+    estado = inspect(obj)
+    cambios = {}
+    for columna in estado.mapper.column_attrs:
+        historia = estado.attrs[columna.key].history
+        if historia.added:
+            cambios[columna.key] = historia.added[0]
+    obj_id = obj.id
+    esperada = obj.version if version is None else version
+
+    # Los cambios van en el UPDATE de abajo, no en el flush del ORM
+    session.expire(obj)
+    resultado = session.execute(
+        update(modelo)
+        .where(modelo.id == obj_id, modelo.version == esperada)
+        .values(**cambios, version=esperada + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if resultado.rowcount != 1:
+        session.rollback()
+        actual = session.exec(select(modelo.version).where(modelo.id == obj_id)).first()
+        raise ConflictoVersion(entidad, obj_id, esperada, actual)
+
+
+def _imagen_reemplazada(anterior: str | None, nueva: str | None):
+    # La imagen anterior queda sin uso: se borra del bucket en segundo plano
+    if anterior and anterior != nueva:
+        tareas.cola.encolar("borrar_imagen", {"url": anterior})
+
+
+INTENTOS_ASIGNAR_IMAGEN = 3
+
+
+def asignar_imagen(session: Session, entidad: str, entidad_id: int, imagen_url: str | None) -> bool:
+    """
+    Asigna la imagen ya procesada a la entidad (la usa la cola de tareas).
+    Funciona también con entidades eliminadas, para no perder la imagen al restaurarlas.
+    """
+    # Mismo UPDATE con versión que las ediciones: sube `version` y no pisa una edición que
+    # llegó entre la lectura y la escritura. Sin versión del cliente, ante un conflicto se
+    # relee la fila y se reintenta (la imagen no depende de los otros campos)
+    for intento in range(INTENTOS_ASIGNAR_IMAGEN):
+        obj = session.get(MODELOS[entidad], entidad_id, populate_existing=True)
+        if not obj:
+            return False
+        anterior = obj.imagen_url
+        obj.imagen_url = imagen_url
+        try:
+            _guardar_con_version(session, entidad, obj)
+        except ConflictoVersion:
+            if intento == INTENTOS_ASIGNAR_IMAGEN - 1:
+                raise
+            continue
+        _confirmar(session, entidad, "actualizar", obj)
+        _imagen_reemplazada(anterior, imagen_url)
+        return True
 
 
 def create_categoria(
@@ -16,22 +159,25 @@ def create_categoria(
         imagen_url=imagen_url
     )
     session.add(cat)
-    session.commit()
+    _confirmar(session, "categoria", "crear", cat)
     session.refresh(cat)
     return cat
 
 
 
+@catalogo("categoria")
 def list_categorias(session: Session):
     # ✅ Solo las categorías activas
-    return session.exec(select(Categoria).where(Categoria.activo == True)).all()
+    return session.exec(select(Categoria).where(Categoria.activo == True).options(SIN_RELACIONES)).all()
 
 
+@catalogo("categoria")
 def get_categoria(session: Session, categoria_id: int) -> Categoria | None:
     # ✅ Solo categorías activas
     return session.exec(
         select(Categoria)
         .where(Categoria.id == categoria_id, Categoria.activo == True)
+        .options(SIN_RELACIONES)
     ).first()
 
 
@@ -40,12 +186,14 @@ def update_categoria(
     categoria_id: int,
     nombre: str | None = None,
     descripcion: str | None = None,
-    imagen_url: str | None = None
+    imagen_url: str | None = None,
+    version: int | None = None
 ) -> Categoria | None:
 
     categoria = session.get(Categoria, categoria_id)
     if not categoria or not categoria.activo:
         return None
+    imagen_anterior = categoria.imagen_url
 
     if nombre is not None:
         categoria.nombre = nombre
@@ -61,9 +209,10 @@ def update_categoria(
     elif imagen_url is not None:
         categoria.imagen_url = imagen_url
 
-    session.add(categoria)
-    session.commit()
+    _guardar_con_version(session, "categoria", categoria, version)
+    _confirmar(session, "categoria", "actualizar", categoria)
     session.refresh(categoria)
+    _imagen_reemplazada(imagen_anterior, categoria.imagen_url)
     return categoria
 
 
@@ -74,23 +223,30 @@ def delete_categoria(session: Session, categoria_id: int) -> bool:
     if not categoria or not categoria.activo:
         return False
     categoria.activo = False
+    categoria.fecha_eliminacion = datetime.datetime.utcnow()
+    categoria.version += 1
     session.add(categoria)
-    session.commit()
+    _confirmar(session, "categoria", "eliminar", categoria)
     return True
 
 
 # ✅ Nuevo: restaurar una categoría
 def restaurar_categoria(session: Session, categoria_id: int) -> bool:
-    categoria = session.get(Categoria, categoria_id)
+    # Si ya se archivó (ver archivo.py) vuelve desde el archivo
+    categoria = session.get(Categoria, categoria_id) or desarchivar(session, "categoria", categoria_id)
     if not categoria:
         return False
     categoria.activo = True
+    categoria.fecha_eliminacion = None
+    categoria.version += 1
     session.add(categoria)
-    session.commit()
+    _confirmar(session, "categoria", "restaurar", categoria)
     return True
 
 def listar_categorias_eliminadas(session: Session):
-    return session.exec(select(Categoria).where(Categoria.activo == False)).all()
+    # ✅ Incluye las archivadas, que también se pueden restaurar
+    eliminadas = session.exec(select(Categoria).where(Categoria.activo == False).options(SIN_RELACIONES)).all()
+    return list(eliminadas) + listar_archivados(session, "categoria")
 
 
 # --- Ubicaciones
@@ -111,21 +267,24 @@ def create_ubicacion(
     )
 
     session.add(u)
-    session.commit()
+    _confirmar(session, "ubicacion", "crear", u)
     session.refresh(u)
     return u
 
 
+@catalogo("ubicacion")
 def list_ubicaciones(session: Session):
     # ✅ Solo ubicaciones activas
-    return session.exec(select(Ubicacion).where(Ubicacion.activo == True)).all()
+    return session.exec(select(Ubicacion).where(Ubicacion.activo == True).options(SIN_RELACIONES)).all()
 
 
+@catalogo("ubicacion")
 def get_ubicacion(session: Session, ubicacion_id: int):
     # ✅ Ignora las inactivas
     return session.exec(
         select(Ubicacion)
         .where(Ubicacion.id == ubicacion_id, Ubicacion.activo == True)
+        .options(SIN_RELACIONES)
     ).first()
 
 
@@ -135,11 +294,13 @@ def update_ubicacion(
     nombre: str | None,
     tipo: str | None,
     descripcion: str | None,
-    imagen_url: str | None = None   # <--- agregado
+    imagen_url: str | None = None,   # <--- agregado
+    version: int | None = None
 ):
     u = session.get(Ubicacion, ubicacion_id)
     if not u or not u.activo:
         return None
+    imagen_anterior = u.imagen_url
 
     if nombre is not None:
         u.nombre = nombre
@@ -159,9 +320,10 @@ def update_ubicacion(
     elif imagen_url is not None:
         u.imagen_url = imagen_url
 
-    session.add(u)
-    session.commit()
+    _guardar_con_version(session, "ubicacion", u, version)
+    _confirmar(session, "ubicacion", "actualizar", u)
     session.refresh(u)
+    _imagen_reemplazada(imagen_anterior, u.imagen_url)
     return u
 
 
@@ -171,23 +333,30 @@ def delete_ubicacion(session: Session, ubicacion_id: int):
     if not u or not u.activo:
         return False
     u.activo = False
+    u.fecha_eliminacion = datetime.datetime.utcnow()
+    u.version += 1
     session.add(u)
-    session.commit()
+    _confirmar(session, "ubicacion", "eliminar", u)
     return True
 
 
 # ✅ Nuevo: restaurar una ubicación
 def restaurar_ubicacion(session: Session, ubicacion_id: int) -> bool:
-    u = session.get(Ubicacion, ubicacion_id)
+    # Si ya se archivó (ver archivo.py) vuelve desde el archivo
+    u = session.get(Ubicacion, ubicacion_id) or desarchivar(session, "ubicacion", ubicacion_id)
     if not u:
         return False
     u.activo = True
+    u.fecha_eliminacion = None
+    u.version += 1
     session.add(u)
-    session.commit()
+    _confirmar(session, "ubicacion", "restaurar", u)
     return True
 
 def listar_ubicaciones_eliminadas(session: Session):
-    return session.exec(select(Ubicacion).where(Ubicacion.activo == False)).all()
+    # ✅ Incluye las archivadas, que también se pueden restaurar
+    eliminadas = session.exec(select(Ubicacion).where(Ubicacion.activo == False).options(SIN_RELACIONES)).all()
+    return list(eliminadas) + listar_archivados(session, "ubicacion")
 
 
 # --- Interacciones
@@ -202,20 +371,23 @@ def create_interaccion(
         imagen_url=imagen_url
     )
     session.add(i)
-    session.commit()
+    _confirmar(session, "interaccion", "crear", i)
     session.refresh(i)
     return i
 
+@catalogo("interaccion")
 def list_interacciones(session: Session):
     # ✅ Solo interacciones activas
-    return session.exec(select(Interaccion).where(Interaccion.activo == True)).all()
+    return session.exec(select(Interaccion).where(Interaccion.activo == True).options(SIN_RELACIONES)).all()
 
 
+@catalogo("interaccion")
 def get_interaccion(session: Session, interaccion_id: int):
     # ✅ Ignora las inactivas
     return session.exec(
         select(Interaccion)
         .where(Interaccion.id == interaccion_id, Interaccion.activo == True)
+        .options(SIN_RELACIONES)
     ).first()
 
 
@@ -223,12 +395,14 @@ def update_interaccion(
     session: Session,
     interaccion_id: int,
     descripcion: str | None = None,
-    imagen_url: str | None = None
+    imagen_url: str | None = None,
+    version: int | None = None
 ) -> Interaccion | None:
 
     i = session.get(Interaccion, interaccion_id)
     if not i or not i.activo:
         return None
+    imagen_anterior = i.imagen_url
 
     if descripcion is not None:
         i.descripcion = descripcion
@@ -241,9 +415,10 @@ def update_interaccion(
     elif imagen_url is not None:
         i.imagen_url = imagen_url
 
-    session.add(i)
-    session.commit()
+    _guardar_con_version(session, "interaccion", i, version)
+    _confirmar(session, "interaccion", "actualizar", i)
     session.refresh(i)
+    _imagen_reemplazada(imagen_anterior, i.imagen_url)
     return i
 
 
@@ -253,23 +428,30 @@ def delete_interaccion(session: Session, interaccion_id: int):
     if not i or not i.activo:
         return False
     i.activo = False
+    i.fecha_eliminacion = datetime.datetime.utcnow()
+    i.version += 1
     session.add(i)
-    session.commit()
+    _confirmar(session, "interaccion", "eliminar", i)
     return True
 
 
 # ✅ Nuevo: restaurar interacción
 def restaurar_interaccion(session: Session, interaccion_id: int) -> bool:
-    i = session.get(Interaccion, interaccion_id)
+    # Si ya se archivó (ver archivo.py) vuelve desde el archivo
+    i = session.get(Interaccion, interaccion_id) or desarchivar(session, "interaccion", interaccion_id)
     if not i:
         return False
     i.activo = True
+    i.fecha_eliminacion = None
+    i.version += 1
     session.add(i)
-    session.commit()
+    _confirmar(session, "interaccion", "restaurar", i)
     return True
 
 def listar_interacciones_eliminadas(session: Session):
-    return session.exec(select(Interaccion).where(Interaccion.activo == False)).all()
+    # ✅ Incluye las archivadas, que también se pueden restaurar
+    eliminadas = session.exec(select(Interaccion).where(Interaccion.activo == False).options(SIN_RELACIONES)).all()
+    return list(eliminadas) + listar_archivados(session, "interaccion")
 
 
 # --- Items
@@ -283,8 +465,7 @@ def crear_item(session: Session, data: ItemCreate, imagen_url: str | None = None
         imagen_url = imagen_url
     )
     session.add(item)
-    session.commit()
-    session.refresh(item)
+    session.flush()  # asigna item.id; los enlaces y el registro de cambios van en la misma transacción
 
     # asociar categorías usando link table
     for cid in data.categoria_ids:
@@ -301,61 +482,21 @@ def crear_item(session: Session, data: ItemCreate, imagen_url: str | None = None
         if session.get(Interaccion, iid):
             session.add(ItemInteraccionLink(item_id=item.id, interaccion_id=iid))
 
-    session.commit()
+    _confirmar(session, "item", "crear", item)
     session.refresh(item)
     return item
 
-def listar_items(session: Session):
-    items = session.exec(
-        select(Item)
-        .where(Item.activo == True)  # ✅ solo activos
-        .options(
-            selectinload(Item.categorias),
-            selectinload(Item.ubicaciones),
-            selectinload(Item.interacciones)
-        )
-    ).all()
-
-    # ✅ Convertir relaciones a listas de IDs
-    result = []
-    for it in items:
-        result.append({
-            "id": it.id,
-            "nombre": it.nombre,
-            "descripcion": it.descripcion,
-            "costo": it.costo,
-            "indispensable": it.indispensable,
-            "imagen_url": it.imagen_url,
-            "categoria_ids": [c.id for c in it.categorias],
-            "ubicacion_ids": [u.id for u in it.ubicaciones],
-            "interaccion_ids": [i.id for i in it.interacciones]
-        })
-    return result
-
-
-def get_item(session: Session, item_id: int):
-    item = session.exec(
-        select(Item)
-        .where(Item.id == item_id, Item.activo == True)
-        .options(
-            selectinload(Item.categorias),
-    selectinload(Item.ubicaciones),
-            selectinload(Item.interacciones)
-        )
-    ).first()
-    if not item:
-        return None
-    return {
-        "id": item.id,
-        "nombre": item.nombre,
-        "descripcion": item.descripcion,
-        "costo": item.costo,
-        "indispensable": item.indispensable,
-        "imagen_url": item.imagen_url,
-        "categoria_ids": [c.id for c in item.categorias],
-        "ubicacion_ids": [u.id for u in item.ubicaciones],
-        "interaccion_ids": [i.id for i in item.interacciones]
-    }
+@catalogo("item")
+def listar_items(session: Session) -> List[FilaItem]:
+    # ✅ Solo activos; columnas y ids de enlaces en una consulta, sin objetos ORM (ver proyecciones.py)
+    return proyectar_items(session, Item.activo == True)
+
+
+@catalogo("item")
+def get_item(session: Session, item_id: int) -> Optional[dict]:
+    # Un solo ítem: como dict, que es lo que esperan las plantillas de detalle (|tojson)
+    filas = proyectar_items(session, Item.id == item_id, Item.activo == True)
+    return filas[0].a_dict() if filas else None
 
 
 
@@ -364,12 +505,14 @@ def update_item(
     session: Session,
     item_id: int,
     data: ItemUpdate,
-    imagen_url: str | None = None
+    imagen_url: str | None = None,
+    version: int | None = None
 ) -> Item | None:
 
     item = session.get(Item, item_id)
     if not item:
         return None
+    imagen_anterior = item.imagen_url
 
     # ------------------------
     # CAMPOS SIMPLES
@@ -400,40 +543,40 @@ def update_item(
     elif imagen_url is not None:
         item.imagen_url = imagen_url
 
-    session.add(item)
-    session.commit()
-    session.refresh(item)
+    # Columnas y enlaces se confirman juntos: cambiar solo los enlaces también sube la versión
+    _guardar_con_version(session, "item", item, version)
 
     # ------------------------
     # RELACIONES MUCHOS-A-MUCHOS
     # ------------------------
     # Categorías
     if data.categoria_ids is not None:
-        session.query(ItemCategoriaLink).filter(ItemCategoriaLink.item_id == item.id).delete()
+        session.query(ItemCategoriaLink).filter(ItemCategoriaLink.item_id == item_id).delete()
         for cid in data.categoria_ids:
             if session.get(Categoria, cid):
-                session.add(ItemCategoriaLink(item_id=item.id, categoria_id=cid))
+                session.add(ItemCategoriaLink(item_id=item_id, categoria_id=cid))
 
     # Ubicaciones
     if data.ubicacion_ids is not None:
         # Caso 1: [] → borrar todas
-        session.query(ItemLocationLink).filter(ItemLocationLink.item_id == item.id).delete()
+        session.query(ItemLocationLink).filter(ItemLocationLink.item_id == item_id).delete()
 
         # Caso 2: [1,2...] → agregar nuevas
         for uid in data.ubicacion_ids:
             if session.get(Ubicacion, uid):
-                session.add(ItemLocationLink(item_id=item.id, ubicacion_id=uid))
+                session.add(ItemLocationLink(item_id=item_id, ubicacion_id=uid))
 
     # Interacciones
     if data.interaccion_ids is not None:
-        session.query(ItemInteraccionLink).filter(ItemInteraccionLink.item_id == item.id).delete()
+        session.query(ItemInteraccionLink).filter(ItemInteraccionLink.item_id == item_id).delete()
 
         for iid in data.interaccion_ids:
             if session.get(Interaccion, iid):
-                session.add(ItemInteraccionLink(item_id=item.id, interaccion_id=iid))
+                session.add(ItemInteraccionLink(item_id=item_id, interaccion_id=iid))
 
-    session.commit()
+    _confirmar(session, "item", "actualizar", item)
     session.refresh(item)
+    _imagen_reemplazada(imagen_anterior, item.imagen_url)
     return item
 
 
@@ -441,99 +584,303 @@ def delete_item(session: Session, item_id: int) -> bool:
     it = session.get(Item, item_id)
     if not it:
         return False
+    if it.activo:
+        it.fecha_eliminacion = datetime.datetime.utcnow()
     it.activo = False  # ✅ marcar como inactivo
+    it.version += 1
     session.add(it)
-    session.commit()
+    _confirmar(session, "item", "eliminar", it)
     return True
 
 def restaurar_item(session: Session, item_id: int) -> bool:
-    it = session.get(Item, item_id)
+    # Si ya se archivó (ver archivo.py) vuelve desde el archivo
+    it = session.get(Item, item_id) or desarchivar(session, "item", item_id)
     if not it:
         return False
     it.activo = True
+    it.fecha_eliminacion = None
+    it.version += 1
     session.add(it)
-    session.commit()
+    _confirmar(session, "item", "restaurar", it)
     return True
 
-def listar_items_eliminados(session: Session):
-    items = session.exec(select(Item).where(Item.activo == False)).all()
-    return [
-        {
-            "id": it.id,
-            "nombre": it.nombre,
-            "descripcion": it.descripcion,
-            "costo": it.costo,
-            "indispensable": it.indispensable,
-            "categoria_ids": [c.id for c in it.categorias],
-            "imagen_url": it.imagen_url,
-        }
-        for it in items
+def listar_items_eliminados(session: Session) -> List[FilaItem]:
+    # ✅ Misma proyección que listar_items: los ids de enlaces vienen en la consulta, sin un lazy load por ítem
+    filas = proyectar_items(session, Item.activo == False)
+    archivados = listar_archivados(session, "item")
+    ids = [it.id for it in archivados]
+    enlaces = {tipo: enlaces_archivados(session, tipo, ids) for tipo in ("categoria", "ubicacion", "interaccion")}
+    return filas + [
+        FilaItem(
+            id=it.id,
+            nombre=it.nombre,
+            descripcion=it.descripcion,
+            costo=it.costo,
+            indispensable=it.indispensable,
+            version=it.version,
+            imagen_url=it.imagen_url,
+            categoria_ids=enlaces["categoria"].get(it.id, []),
+            ubicacion_ids=enlaces["ubicacion"].get(it.id, []),
+            interaccion_ids=enlaces["interaccion"].get(it.id, []),
+        )
+        for it in archivados
     ]
 
 
+def _condiciones_busqueda(
+    categoria_id: Optional[int] = None,
+    ubicacion_id: Optional[int] = None,
+    interaccion_id: Optional[int] = None,
+    indispensable: Optional[bool] = None,
+    nombre: Optional[str] = None,
+    costo_min: Optional[int] = None,
+    costo_max: Optional[int] = None
+) -> list:
+    # Filtros de la búsqueda como condiciones SQL (se comparten con las facetas)
+    condiciones = [Item.activo == True]
+
+    if categoria_id is not None:
+        condiciones.append(exists().where(
+            ItemCategoriaLink.item_id == Item.id, ItemCategoriaLink.categoria_id == categoria_id))
+
+    if ubicacion_id is not None:
+        condiciones.append(exists().where(
+            ItemLocationLink.item_id == Item.id, ItemLocationLink.ubicacion_id == ubicacion_id))
+
+    if interaccion_id is not None:
+        condiciones.append(exists().where(
+            ItemInteraccionLink.item_id == Item.id, ItemInteraccionLink.interaccion_id == interaccion_id))
+
+    if indispensable is not None:
+        condiciones.append(Item.indispensable == indispensable)
+
+    condiciones.extend(_condiciones_columnas(nombre, costo_min, costo_max))
+    return condiciones
+
+
+def _condiciones_columnas(
+    nombre: Optional[str] = None,
+    costo_min: Optional[int] = None,
+    costo_max: Optional[int] = None
+) -> list:
+    # Filtros sobre columnas de Item que el índice de bitmaps no cubre
+    condiciones = []
+    if nombre:
+        condiciones.append(Item.nombre.ilike(f"%{nombre}%"))
+    if costo_min is not None:
+        condiciones.append(Item.costo >= costo_min)
+    if costo_max is not None:
+        condiciones.append(Item.costo <= costo_max)
+    return condiciones
+
+
+# Claves de orden de la búsqueda; "-costo" es descendente. El id desempata para que las páginas no se solapen
+ORDENES = {"id": Item.id, "costo": Item.costo, "nombre": Item.nombre}
+
+
+def _orden_busqueda(orden: str) -> list:
+    descendente = orden.startswith("-")
+    clave = orden.lstrip("-")
+    columnas = [ORDENES[clave]] if clave == "id" else [ORDENES[clave], Item.id]
+    columnas = [c.desc() if descendente else c.asc() for c in columnas]
+    if clave != "id":
+        # Los ítems sin costo van al final en ambas direcciones y en cualquier base de datos
+        columnas[0] = columnas[0].nulls_last()
+    return columnas
+
+
+# Ids por consulta IN al cargar los ítems que encontró el índice de bitmaps
+LOTE_IDS = 500
+
+
+def _bits_busqueda(
+    session: Session,
+    categoria_id: Optional[int] = None,
+    ubicacion_id: Optional[int] = None,
+    interaccion_id: Optional[int] = None,
+    indispensable: Optional[bool] = None,
+    nombre: Optional[str] = None,
+    costo_min: Optional[int] = None,
+    costo_max: Optional[int] = None
+) -> Optional[int]:
+    # Bitmap de los ítems que coinciden, o None si el índice no está construido o se quedó
+    # atrás de las escrituras de otro worker
+    if not indice_bitmap.listo or not indice_bitmap.al_dia():
+        return None
+    bits = indice_bitmap.filtrar(categoria_id, ubicacion_id, interaccion_id, indispensable)
+    columnas = _condiciones_columnas(nombre, costo_min, costo_max)
+    if columnas and bits:
+        # El texto libre y el rango de costo no están en el índice: se resuelven en SQL y se intersectan
+        bits &= desde_ids(session.exec(select(Item.id).where(Item.activo == True, *columnas)))
+    return bits
+
+
 def buscar_items(
     session: Session,
     categoria_id: Optional[int] = None,
     ubicacion_id: Optional[int] = None,
     indispensable: Optional[bool] = None,
-    nombre: Optional[str] = None
-) -> List[dict]:
-    # Cargar relaciones many-to-many eficientemente
-    query = select(Item).options(
-        selectinload(Item.categorias),
-        selectinload(Item.ubicaciones),
-        selectinload(Item.interacciones)
+    nombre: Optional[str] = None,
+    interaccion_id: Optional[int] = None,
+    costo_min: Optional[int] = None,
+    costo_max: Optional[int] = None,
+    orden: str = "id",
+    limite: Optional[int] = None,
+    offset: int = 0
+) -> List[FilaItem]:
+    """
+    Ítems activos que cumplen los filtros, ordenados por `orden` ("id", "costo", "nombre",
+    con "-" delante para descendente) y paginados con `limite`/`offset`.
+    """
+    filtros = (categoria_id, ubicacion_id, interaccion_id, indispensable, nombre, costo_min, costo_max)
+
+    bits = _bits_busqueda(session, *filtros) if orden.lstrip("-") == "id" else None
+    if bits is not None:
+        # ✅ El índice de bitmaps ya sabe qué ítems coinciden y en orden de id: se pagina la lista
+        # de ids y solo se leen esos, por lotes. activo se vuelve a mirar en la base por si
+        # otro worker eliminó el ítem y este índice todavía no se enteró
+        ids = a_ids(bits)
+        if orden.startswith("-"):
+            ids.reverse()
+        ids = ids[offset:offset + limite if limite is not None else None]
+        por_id = {}
+        for inicio in range(0, len(ids), LOTE_IDS):
+            lote = ids[inicio:inicio + LOTE_IDS]
+            por_id.update((f.id, f) for f in filas_items(session, consulta_items(session).where(Item.id.in_(lote), Item.activo == True)))
+        return [por_id[i] for i in ids if i in por_id]
+
+    # ✅ Los filtros, el orden y la página se resuelven en la base de datos (con los índices de Item);
+    # los ids de enlaces vienen agregados en la misma consulta (ver proyecciones.py)
+    query = (
+        consulta_items(session)
+        .where(*_condiciones_busqueda(*filtros))
+        .order_by(*_orden_busqueda(orden))
+        .offset(offset)
+        .limit(limite)
     )
+    return filas_items(session, query)
 
-    # Filtros básicos
-    items = session.exec(query).all()
 
-    # Filtrado por categoría
-    if categoria_id is not None:
-        items = [it for it in items if any(c.id == categoria_id for c in it.categorias)]
+def contar_items(
+    session: Session,
+    categoria_id: Optional[int] = None,
+    ubicacion_id: Optional[int] = None,
+    indispensable: Optional[bool] = None,
+    nombre: Optional[str] = None,
+    interaccion_id: Optional[int] = None,
+    costo_min: Optional[int] = None,
+    costo_max: Optional[int] = None
+) -> int:
+    # Total de resultados de la búsqueda, para paginar
+    filtros = (categoria_id, ubicacion_id, interaccion_id, indispensable, nombre, costo_min, costo_max)
+    bits = _bits_busqueda(session, *filtros)
+    if bits is not None:
+        return bits.bit_count()
+    return session.exec(select(func.count()).select_from(Item).where(*_condiciones_busqueda(*filtros))).one()
+
+
+def facetas_items(
+    session: Session,
+    categoria_id: Optional[int] = None,
+    ubicacion_id: Optional[int] = None,
+    indispensable: Optional[bool] = None,
+    nombre: Optional[str] = None,
+    interaccion_id: Optional[int] = None,
+    costo_min: Optional[int] = None,
+    costo_max: Optional[int] = None
+) -> dict:
+    """
+    Conteo de ítems por categoría, ubicación, interacción e indispensable
+    dentro de los resultados de la búsqueda. Con el índice de bitmaps listo se cuenta
+    en memoria; si no, en una sola consulta (UNION ALL de GROUP BY).
+
+    Devuelve {"categoria": [{"id", "nombre", "total"}, ...], "ubicacion": [...],
+              "interaccion": [...], "indispensable": [...]}
+    """
+    filtros = (categoria_id, ubicacion_id, interaccion_id, indispensable, nombre, costo_min, costo_max)
+    bits = _bits_busqueda(session, *filtros)
+    if bits is not None:
+        return indice_bitmap.facetas(bits)
+
+    filtrados = (
+        select(Item.id)
+        .where(*_condiciones_busqueda(*filtros))
+        .cte("filtrados")
+    )
 
-    # Filtrado por indispensable
-    if indispensable is not None:
-        items = [it for it in items if it.indispensable == indispensable]
+    def por_enlace(faceta, link, link_item, link_otro, modelo, etiqueta):
+        return (
+            select(
+                literal(faceta).label("faceta"),
+                modelo.id.label("valor"),
+                etiqueta.label("nombre"),
+                func.count().label("total"),
+            )
+            .select_from(link)
+            .join(filtrados, filtrados.c.id == link_item)
+            .join(modelo, modelo.id == link_otro)
+            .where(modelo.activo == True)
+            .group_by(modelo.id, etiqueta)
+        )
 
-    # Filtrado por nombre
-    if nombre is not None:
-        items = [it for it in items if nombre.lower() in it.nombre.lower()]
+    consulta = union_all(
+        por_enlace("categoria", ItemCategoriaLink, ItemCategoriaLink.item_id, ItemCategoriaLink.categoria_id,
+                   Categoria, Categoria.nombre),
+        por_enlace("ubicacion", ItemLocationLink, ItemLocationLink.item_id, ItemLocationLink.ubicacion_id,
+                   Ubicacion, Ubicacion.nombre),
+        por_enlace("interaccion", ItemInteraccionLink, ItemInteraccionLink.item_id, ItemInteraccionLink.interaccion_id,
+                   Interaccion, Interaccion.descripcion),
+        select(
+            literal("indispensable").label("faceta"),
+            cast(Item.indispensable, Integer).label("valor"),
+            literal(None, String).label("nombre"),
+            func.count().label("total"),
+        )
+        .join(filtrados, filtrados.c.id == Item.id)
+        .group_by(Item.indispensable),
+    )
 
-    # Filtrado por ubicación
-    if ubicacion_id is not None:
-        items = [it for it in items if any(u.id == ubicacion_id for u in it.ubicaciones)]
-
-    # Convertir los resultados en un formato amigable
-    results = []
-    for it in items:
-        results.append({
-            "id": it.id,
-            "nombre": it.nombre,
-            "descripcion": it.descripcion,
-            "costo": it.costo,
-            "indispensable": it.indispensable,
-            "categoria_ids": [c.id for c in it.categorias],  # <-- cambio aplicado
-            "imagen_url": it.imagen_url,
-            "ubicacion_ids": [u.id for u in it.ubicaciones],
-            "interaccion_ids": [i.id for i in it.interacciones],
-        })
-
-    return results
+    facetas = {"categoria": [], "ubicacion": [], "interaccion": [], "indispensable": []}
+    for faceta, valor, etiqueta, total in session.exec(consulta):
+        if faceta == "indispensable":
+            valor = bool(valor)
+            etiqueta = "Sí" if valor else "No"
+        facetas[faceta].append({"id": valor, "nombre": etiqueta, "total": total})
+
+    for valores in facetas.values():
+        valores.sort(key=lambda v: (-v["total"], str(v["nombre"])))
+    return facetas
+
+
+def listar_cambios(session: Session, desde: int = 0, limite: int = 500, hasta: datetime.datetime | None = None) -> List[Cambio]:
+    # ✅ Cambios con cursor > desde, en orden; `hasta` deja afuera los más recientes
+    query = select(Cambio).where(Cambio.id > desde)
+    if hasta is not None:
+        query = query.where(Cambio.fecha <= hasta)
+    return session.exec(query.order_by(Cambio.id).limit(limite)).all()
+
+
+def ultimo_cambio(session: Session, hasta: datetime.datetime | None = None) -> int:
+    query = select(func.max(Cambio.id))
+    if hasta is not None:
+        query = query.where(Cambio.fecha <= hasta)
+    return session.exec(query).one() or 0
 
 
 from sqlalchemy.orm import selectinload
 from sqlmodel import select
 from models import Item
 
+@catalogo("item", "categoria", "ubicacion", "interaccion")
 def get_item_detallado(session: Session, item_id: int):
     stmt = (
         select(Item)
         .where(Item.id == item_id)
         .options(
-            selectinload(Item.categorias),
-            selectinload(Item.ubicaciones),
-            selectinload(Item.interacciones)
+            selectinload(Item.categorias).options(SIN_RELACIONES),
+            selectinload(Item.ubicaciones).options(SIN_RELACIONES),
+            selectinload(Item.interacciones).options(SIN_RELACIONES),
+            SIN_RELACIONES,
         )
     )
 
@@ -548,6 +895,7 @@ def get_item_detallado(session: Session, item_id: int):
         "descripcion": item.descripcion,
         "costo": item.costo,
         "indispensable": item.indispensable,
+        "version": item.version,
         "imagen_url": item.imagen_url,
         "categorias": [
             {
@@ -1,8 +1,17 @@
 # db.py
+import itertools
+import logging
 import os
+import time
 from contextlib import asynccontextmanager
+from fastapi import Request
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import raiseload
 from sqlmodel import SQLModel, create_engine, Session, select
 
+logger = logging.getLogger(__name__)
+
 # 1) Tomar la URL desde la variable de entorno (Render) o usar SQLite local si no existe
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
@@ -10,18 +19,128 @@ if not DATABASE_URL:
 
 # 2) Crear el engine (echo=True para ver queries en logs; puedes poner False en prod si quieres menos ruido)
 #engine = create_engine(DATABASE_URL, echo=True)
-engine = create_engine(DATABASE_URL,echo=True,
+# DB_ECHO=0 silencia el log de queries (útil en pruebas de carga)
+engine = create_engine(DATABASE_URL,echo=os.getenv("DB_ECHO", "1") == "1",
     pool_size=5,       # máximo de conexiones activas en el pool
     max_overflow=0,    # no permitir conexiones extras temporales
     pool_timeout=30,   # espera hasta 30s por una conexión libre
     pool_recycle=1800  # recicla conexiones abiertas por más de 30min
 )
 
+# Modo guardia contra N+1 (DB_SIN_LAZY=1, para desarrollo y pruebas): en las sesiones de
+# las peticiones ninguna relación se carga sola, así una plantilla o ruta que recorra
+# it.categorias sin carga explícita falla en vez de hacer una consulta por fila
+DB_SIN_LAZY = os.getenv("DB_SIN_LAZY", "0") == "1"
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _prohibir_lazy(estado):
+    if (
+        estado.session.info.get("sin_lazy")
+        and estado.is_select
+        and not estado.is_column_load
+        and not estado.is_relationship_load
+    ):
+        # El comodín no pisa los selectinload(...) explícitos de la consulta
+        estado.statement = estado.statement.options(raiseload("*"))
+
+
 # 3) Dependencia para obtener sesión
 def get_session():
     with Session(engine) as session:
+        session.info["sin_lazy"] = DB_SIN_LAZY
         yield session
 
+
+# ---------------------------
+# RÉPLICAS DE LECTURA
+# ---------------------------
+# DATABASE_REPLICA_URLS="postgresql://...replica1,postgresql://...replica2"
+# Las rutas GET leen de las réplicas (por turnos); las escrituras siguen en `engine`.
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+
+# Cada cuánto se vuelve a comprobar una réplica (sana o caída), en segundos
+REPLICA_CHEQUEO = float(os.getenv("REPLICA_CHEQUEO", "10"))
+
+# Tras una escritura, el mismo cliente lee de la primaria durante este tiempo
+# (más que el retraso de replicación esperado) para ver sus propios cambios
+COOKIE_PRIMARIA = "leer_primaria"
+LEER_PRIMARIA_SEGUNDOS = int(os.getenv("LEER_PRIMARIA_SEGUNDOS", "5"))
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = create_engine(url, echo=engine.echo,
+            pool_size=5,
+            max_overflow=0,
+            pool_timeout=30,
+            pool_recycle=1800
+        )
+        self.sana = True
+        self.revisada = 0.0
+
+    def revisar(self) -> bool:
+        """SELECT 1 contra la réplica si pasó REPLICA_CHEQUEO desde la última vez."""
+        ahora = time.monotonic()
+        if ahora - self.revisada < REPLICA_CHEQUEO:
+            return self.sana
+        self.revisada = ahora
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            self.sana = True
+        except Exception:
+            logger.warning("Réplica de lectura caída: %s", self.engine.url.render_as_string(hide_password=True))
+            self.sana = False
+        return self.sana
+
+    def marcar_caida(self):
+        self.sana = False
+        self.revisada = time.monotonic()
+
+
+replicas = [Replica(url) for url in DATABASE_REPLICA_URLS]
+_turno = itertools.count()
+
+
+def elegir_replica() -> Replica | None:
+    """Siguiente réplica sana por turnos, o None si no hay ninguna."""
+    if not replicas:
+        return None
+    inicio = next(_turno)
+    for i in range(len(replicas)):
+        replica = replicas[(inicio + i) % len(replicas)]
+        if replica.revisar():
+            return replica
+    return None
+
+
+def get_read_session(request: Request):
+    """
+    Dependencia para rutas de solo lectura: usa una réplica, salvo que no haya
+    ninguna sana o que el cliente haya escrito hace poco (cookie COOKIE_PRIMARIA).
+    """
+    replica = None if request.cookies.get(COOKIE_PRIMARIA) else elegir_replica()
+    if replica is None:
+        yield from get_session()
+        return
+    with Session(replica.engine) as session:
+        session.info["sin_lazy"] = DB_SIN_LAZY
+        try:
+            yield session
+        except OperationalError:
+            # Se cayó a mitad de la petición: que la siguiente elija otra
+            replica.marcar_caida()
+            raise
+
+
+def marcar_escritura(response):
+    """Fija la cookie de lectura en primaria en la respuesta a una escritura."""
+    if replicas:
+        response.set_cookie(COOKIE_PRIMARIA, "1", max_age=LEER_PRIMARIA_SEGUNDOS, httponly=True, samesite="lax")
+    return response
+
 # 4) Lifespan: crear tablas al iniciar la app (no hace seed ni inserciones)
 @asynccontextmanager
 async def create_tables(app):
@@ -31,4 +150,39 @@ async def create_tables(app):
     No inserta datos de ejemplo (seed) — eso se hace manualmente si lo deseas.
     """
     SQLModel.metadata.create_all(engine)
+    agregar_columnas_faltantes()
+    crear_indices_faltantes()
     yield
+
+
+def agregar_columnas_faltantes():
+    """
+    create_all no modifica tablas existentes: agrega con ALTER TABLE las columnas
+    nuevas de los modelos (deben tener server_default si son NOT NULL).
+    """
+    existentes = inspect(engine)
+    with engine.begin() as conn:
+        for tabla in SQLModel.metadata.sorted_tables:
+            if not existentes.has_table(tabla.name):
+                continue
+            columnas = {c["name"] for c in existentes.get_columns(tabla.name)}
+            for columna in tabla.columns:
+                if columna.name in columnas:
+                    continue
+                ddl = f"ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {columna.type.compile(engine.dialect)}"
+                if columna.server_default is not None:
+                    ddl += f" DEFAULT {columna.server_default.arg}"
+                if not columna.nullable:
+                    ddl += " NOT NULL"
+                logger.info("Migración: %s", ddl)
+                conn.execute(text(ddl))
+
+
+def crear_indices_faltantes():
+    """
+    create_all solo crea los índices de las tablas nuevas; en una base existente
+    los índices agregados después a los modelos se crean aquí.
+    """
+    for tabla in SQLModel.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(engine, checkfirst=True)
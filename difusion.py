@@ -0,0 +1,90 @@
+"""
+Difusión de cambios a los navegadores (Server-Sent Events).
+
+crud.py publica cada escritura en el bus de eventos (eventos.py), casi siempre
+desde un hilo del ejecutor. El Difusor pasa cada evento al event loop con
+call_soon_threadsafe y lo reparte entre las colas de las conexiones abiertas en /vivo.
+"""
+import asyncio
+import datetime
+import json
+import logging
+
+from eventos import Evento, suscribir
+
+logger = logging.getLogger(__name__)
+
+# Eventos que puede acumular una conexión lenta antes de cortarla; al reconectar
+# el navegador manda Last-Event-ID y se le reenvía lo que faltó desde la tabla Cambio
+MAX_PENDIENTES = 100
+
+
+def mensaje_sse(cursor: int | None, entidad: str, accion: str, entidad_id: int, datos: dict) -> str:
+    partes = []
+    if cursor is not None:
+        partes.append(f"id: {cursor}")
+    partes.append("event: cambio")
+    partes.append("data: " + json.dumps(
+        {"entidad": entidad, "accion": accion, "id": entidad_id, "datos": datos},
+        ensure_ascii=False,
+        default=datetime.datetime.isoformat,
+    ))
+    return "\n".join(partes) + "\n\n"
+
+
+class Difusor:
+    def __init__(self):
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._colas: set[asyncio.Queue] = set()
+
+    def iniciar(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def detener(self):
+        # Cerrar las conexiones abiertas para que el servidor pueda apagarse
+        for cola in list(self._colas):
+            self._cerrar(cola)
+        self._loop = None
+
+    @property
+    def conexiones(self) -> int:
+        return len(self._colas)
+
+    # ---------------------------
+    # CONEXIONES (en el event loop)
+    # ---------------------------
+    def conectar(self) -> asyncio.Queue:
+        cola = asyncio.Queue(maxsize=MAX_PENDIENTES)
+        self._colas.add(cola)
+        return cola
+
+    def desconectar(self, cola: asyncio.Queue):
+        self._colas.discard(cola)
+
+    def _cerrar(self, cola: asyncio.Queue):
+        # None le indica al generador de /vivo que termine
+        self._colas.discard(cola)
+        while not cola.empty():
+            cola.get_nowait()
+        cola.put_nowait(None)
+
+    def _repartir(self, evento: Evento):
+        for cola in list(self._colas):
+            try:
+                cola.put_nowait(evento)
+            except asyncio.QueueFull:
+                logger.info("Conexión SSE atrasada: se corta y se recuperará con Last-Event-ID")
+                self._cerrar(cola)
+
+    # ---------------------------
+    # SUSCRIPTOR DEL BUS (desde cualquier hilo)
+    # ---------------------------
+    def al_evento(self, evento: Evento):
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self._colas:
+            return
+        loop.call_soon_threadsafe(self._repartir, evento)
+
+
+difusor = Difusor()
+suscribir(difusor.al_evento)
@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class EjecutorSaturado(Exception):
+    """No se consiguió un cupo en el pool dentro del tiempo de espera permitido."""
+
+
+class Ejecutor:
+    """
+    Pool de hilos acotado para llamadas bloqueantes (DB, subidas) desde rutas async.
+
+    - hilos: cuántas llamadas corren a la vez
+    - cola_max: cuántas pueden esperar además de las que corren; el resto espera
+      un cupo hasta `espera_max` segundos y luego se rechaza con EjecutorSaturado
+
+    La espera de cupo es un Future en el event loop de la petición, no un hilo bloqueado:
+    con el pool saturado las peticiones no ocupan el threadpool de Starlette.
+    """
+
+    def __init__(self, nombre: str, hilos: int, cola_max: int, espera_max: float):
+        self.nombre = nombre
+        self.hilos = hilos
+        self.cola_max = cola_max
+        self.espera_max = espera_max
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix=f"ejecutor-{nombre}")
+        self._lock = threading.Lock()
+        # Cupos libres y turnos de quienes esperan uno (ambos con _lock)
+        self._libres = hilos + cola_max
+        self._esperando: deque[asyncio.Future] = deque()
+
+        # Métricas
+        self._en_cola = 0
+        self._en_ejecucion = 0
+        self._completadas = 0
+        self._fallidas = 0
+        self._rechazadas = 0
+        self._espera_total = 0.0
+        self._espera_max_vista = 0.0
+        self._duracion_total = 0.0
+
+    def _correr(self, encolada: float, ctx: contextvars.Context, fn, args, kwargs):
+        inicio = time.perf_counter()
+        espera = inicio - encolada
+        with self._lock:
+            self._en_cola -= 1
+            self._en_ejecucion += 1
+            self._espera_total += espera
+            self._espera_max_vista = max(self._espera_max_vista, espera)
+        ok = False
+        try:
+            resultado = ctx.run(fn, *args, **kwargs)
+            ok = True
+            return resultado
+        finally:
+            with self._lock:
+                self._en_ejecucion -= 1
+                self._duracion_total += time.perf_counter() - inicio
+                if ok:
+                    self._completadas += 1
+                else:
+                    self._fallidas += 1
+            self._liberar()
+
+    # ---------------------------
+    # CUPOS
+    # ---------------------------
+    async def _tomar_cupo(self):
+        with self._lock:
+            if self._libres:
+                self._libres -= 1
+                return
+            turno = asyncio.get_running_loop().create_future()
+            self._esperando.append(turno)
+        try:
+            await asyncio.wait_for(turno, self.espera_max)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._rechazadas += 1
+            raise EjecutorSaturado(f"Pool '{self.nombre}' saturado")
+        except asyncio.CancelledError:
+            if turno.done() and not turno.cancelled():
+                # Nos cedieron el cupo justo cuando se cancelaba la petición: devolverlo
+                self._liberar()
+            raise
+        finally:
+            with self._lock:
+                if turno in self._esperando:
+                    self._esperando.remove(turno)
+
+    def _liberar(self):
+        # Se llama desde los hilos del pool: el cupo pasa al primero que espera, en su event loop
+        with self._lock:
+            if not self._esperando:
+                self._libres += 1
+                return
+            turno = self._esperando.popleft()
+        try:
+            turno.get_loop().call_soon_threadsafe(self._ceder, turno)
+        except RuntimeError:
+            self._liberar()  # su event loop ya se cerró
+
+    def _ceder(self, turno: asyncio.Future):
+        if turno.done():
+            self._liberar()  # venció o se canceló mientras tanto: al siguiente
+        else:
+            turno.set_result(None)
+
+    async def ejecutar(self, fn, *args, **kwargs):
+        await self._tomar_cupo()
+        with self._lock:
+            self._en_cola += 1
+        encolada = time.perf_counter()
+        ctx = contextvars.copy_context()
+        try:
+            futuro = self._pool.submit(self._correr, encolada, ctx, fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._en_cola -= 1
+            self._liberar()
+            raise
+        return await asyncio.wrap_future(futuro)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            terminadas = self._completadas + self._fallidas
+            iniciadas = terminadas + self._en_ejecucion
+            return {
+                "hilos": self.hilos,
+                "cola_max": self.cola_max,
+                "en_cola": self._en_cola,
+                "esperando_cupo": len(self._esperando),
+                "en_ejecucion": self._en_ejecucion,
+                "completadas": self._completadas,
+                "fallidas": self._fallidas,
+                "rechazadas": self._rechazadas,
+                "espera_promedio_ms": (self._espera_total / iniciadas * 1000) if iniciadas else 0.0,
+                "espera_max_ms": self._espera_max_vista * 1000,
+                "duracion_promedio_ms": (self._duracion_total / terminadas * 1000) if terminadas else 0.0,
+            }
+
+    def cerrar(self):
+        # Espera lo pendiente y deja un pool nuevo por si la app vuelve a arrancar (tests, loadtest)
+        self._pool.shutdown(wait=True)
+        self._pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix=f"ejecutor-{self.nombre}")
+
+
+# ---------------------------
+# POOLS GLOBALES
+# ---------------------------
+# "db": llamadas a crud desde rutas async (rápidas, muchas)
+# "subidas": subidas a storage (lentas); aparte para que no ocupen los hilos de la DB
+EJECUTORES = {
+    "db": Ejecutor(
+        "db",
+        hilos=int(os.getenv("EJECUTOR_DB_HILOS", "5")),  # igual al pool_size de db.py
+        cola_max=int(os.getenv("EJECUTOR_DB_COLA", "100")),
+        espera_max=float(os.getenv("EJECUTOR_DB_ESPERA", "30")),
+    ),
+    "subidas": Ejecutor(
+        "subidas",
+        hilos=int(os.getenv("EJECUTOR_SUBIDAS_HILOS", "4")),
+        cola_max=int(os.getenv("EJECUTOR_SUBIDAS_COLA", "32")),
+        espera_max=float(os.getenv("EJECUTOR_SUBIDAS_ESPERA", "10")),
+    ),
+}
+
+
+async def en_hilo(fn, *args, pool: str = "db", **kwargs):
+    """
+    Ejecuta fn(*args, **kwargs) en el pool indicado y espera el resultado sin bloquear el event loop.
+    Uso: item = await en_hilo(crud.crear_item, session, data, imagen_url)
+    """
+    return await EJECUTORES[pool].ejecutar(fn, *args, **kwargs)
+
+
+def metricas() -> dict:
+    return {nombre: e.metricas() for nombre, e in EJECUTORES.items()}
+
+
+def cerrar():
+    for e in EJECUTORES.values():
+        e.cerrar()
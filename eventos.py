@@ -0,0 +1,44 @@
+"""
+Bus de eventos dentro del proceso.
+
+crud.py publica un Evento después de cada escritura confirmada (commit) y los
+índices en memoria se suscriben para actualizarse sin volver a leer todo.
+Los suscriptores se llaman en el mismo hilo que hizo la escritura: deben ser rápidos.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Evento:
+    entidad: str   # "item", "categoria", "ubicacion", "interaccion"
+    accion: str    # "crear", "actualizar", "eliminar", "restaurar"
+    id: int
+    datos: dict = field(default_factory=dict)  # columnas de la fila (y ids de enlaces para ítems)
+    cursor: int | None = None  # id de la fila en la tabla Cambio (ver /cambios)
+
+
+_suscriptores: list[Callable[[Evento], None]] = []
+
+
+def suscribir(fn: Callable[[Evento], None]):
+    if fn not in _suscriptores:
+        _suscriptores.append(fn)
+    return fn
+
+
+def desuscribir(fn: Callable[[Evento], None]):
+    if fn in _suscriptores:
+        _suscriptores.remove(fn)
+
+
+def publicar(evento: Evento):
+    for fn in list(_suscriptores):
+        try:
+            fn(evento)
+        except Exception:
+            # Un índice roto no debe hacer fallar la escritura que ya se confirmó
+            logger.exception("Error en suscriptor %s para %s", getattr(fn, "__name__", fn), evento)
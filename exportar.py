@@ -0,0 +1,300 @@
+"""
+Exporta la wiki a HTML estático con las mismas plantillas que usa la app.
+
+    python -m exportar --destino sitio                  # exportación completa
+    python -m exportar --destino sitio --incremental    # solo lo que cambió desde la última
+
+Cada página queda en <ruta>/index.html, así los enlaces de las plantillas
+(/items, /categorias/id/3, /items/5/detalles...) funcionan en cualquier servidor de archivos.
+
+En <destino>/.exportacion.json se guarda el cursor del feed de cambios (tabla Cambio) y de
+qué entidades depende cada página de detalle. El modo incremental lee los cambios desde ese
+cursor y rehace solo las páginas afectadas: la del propio registro, la lista de su tipo y los
+detalles de ítems que lo muestran (sus categorías, ubicaciones, interacciones y relacionados).
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from jinja2 import Environment, FileSystemLoader
+from sqlmodel import Session, select
+
+import crud
+from db import engine
+from indices.grafo import grafo
+from models import Item, Categoria, Ubicacion, Interaccion
+from routers.cambios import MARGEN_SEGUNDOS
+from supa import proxy
+
+ESTADO = ".exportacion.json"
+
+# Páginas por tarea enviada a cada proceso
+LOTE_PAGINAS = 50
+
+# Filas del feed de cambios por consulta
+LOTE_CAMBIOS = 500
+
+MODELOS = {"item": Item, "categoria": Categoria, "ubicacion": Ubicacion, "interaccion": Interaccion}
+RUTAS_LISTA = {"item": "items", "categoria": "categorias", "ubicacion": "ubicaciones", "interaccion": "interacciones"}
+RUTAS_DETALLE = {
+    "item": "items/{id}/detalles",
+    "categoria": "categorias/id/{id}",
+    "ubicacion": "ubicaciones/id/{id}",
+    "interaccion": "interacciones/id/{id}",
+}
+CAMPOS_ENLACE = {"categoria": "categoria_ids", "ubicacion": "ubicacion_ids", "interaccion": "interaccion_ids"}
+
+
+# ---------------------------
+# PÁGINAS
+# 🔹 Una página se identifica como "inicio", "lista:item" o "item:5";
+#    las dependencias usan el mismo formato "entidad:id"
+# ---------------------------
+def ruta(pagina: str) -> str:
+    if pagina == "inicio":
+        return "index.html"
+    tipo, valor = pagina.split(":")
+    if tipo == "lista":
+        return f"{RUTAS_LISTA[valor]}/index.html"
+    return RUTAS_DETALLE[tipo].format(id=valor) + "/index.html"
+
+
+def _url_for(nombre: str, path: str = "") -> str:
+    # Sin request: rutas relativas a la raíz del sitio
+    return f"/{nombre}/{path}"
+
+
+def _entorno() -> Environment:
+    entorno = Environment(loader=FileSystemLoader("templates"), autoescape=True)
+    entorno.globals["url_for"] = _url_for
+    proxy.registrar_estatico(entorno)
+    return entorno
+
+
+def _lista(session: Session, entidad: str) -> tuple[str, dict]:
+    # Mismo contexto que las rutas HTML de cada lista
+    if entidad == "item":
+        return "items/items.html", {"items": crud.listar_items(session)}
+    if entidad == "categoria":
+        return "categorias/categorias.html", {"categorias": crud.list_categorias(session)}
+    if entidad == "ubicacion":
+        return "ubicaciones/ubicaciones.html", {"ubicaciones": crud.list_ubicaciones(session)}
+    interacciones = [
+        {"id": i.id, "descripcion": i.descripcion, "imagen_url": i.imagen_url, "version": i.version}
+        for i in crud.list_interacciones(session)
+    ]
+    return "interacciones/interacciones.html", {"interacciones": interacciones}
+
+
+def _detalle(session: Session, entidad: str, entidad_id: int) -> tuple[str, dict, set[str]] | None:
+    """Plantilla, contexto y dependencias de una página de detalle; None si el registro no está activo."""
+    if entidad == "item":
+        item = crud.get_item_detallado(session, entidad_id)
+        # get_item_detallado no filtra por activo; el Item ya está en la sesión
+        if not item or not session.get(Item, entidad_id).activo:
+            return None
+        relacionados = grafo.relacionados(entidad_id)
+        deps = {f"item:{entidad_id}"}
+        for tipo, clave in (("categoria", "categorias"), ("ubicacion", "ubicaciones"), ("interaccion", "interacciones")):
+            deps.update(f"{tipo}:{n['id']}" for n in item[clave])
+        deps.update(f"item:{r['id']}" for r in relacionados)
+        return "items/items_detalles.html", {"item": item, "relacionados": relacionados}, deps
+
+    if entidad == "categoria":
+        obj = crud.get_categoria(session, entidad_id)
+        contexto = {"categoria": obj}
+        plantilla = "categorias/categoria_detalles.html"
+    elif entidad == "ubicacion":
+        obj = crud.get_ubicacion(session, entidad_id)
+        contexto = {"ubicacion": obj}
+        plantilla = "ubicaciones/ubicaciones_detalles.html"
+    else:
+        obj = crud.get_interaccion(session, entidad_id)
+        contexto = {"interaccion": obj and {
+            "id": obj.id, "descripcion": obj.descripcion, "imagen_url": obj.imagen_url, "version": obj.version,
+        }}
+        plantilla = "interacciones/interacciones_detalles.html"
+    if not obj:
+        return None
+    return plantilla, contexto, {f"{entidad}:{entidad_id}"}
+
+
+def _escribir(destino: str, relativa: str, html: str):
+    archivo = os.path.join(destino, relativa)
+    os.makedirs(os.path.dirname(archivo), exist_ok=True)
+    # Escribir aparte y reemplazar: el servidor nunca entrega una página a medio escribir
+    fd, temporal = tempfile.mkstemp(dir=os.path.dirname(archivo), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(html)
+    os.replace(temporal, archivo)
+
+
+def _borrar(destino: str, relativa: str):
+    try:
+        os.remove(os.path.join(destino, relativa))
+    except FileNotFoundError:
+        pass
+
+
+# ---------------------------
+# PROCESOS DE RENDERIZADO
+# 🔹 Cada proceso abre su propia sesión y arma el grafo una vez (para "relacionados")
+# ---------------------------
+_proceso: dict = {}
+
+
+def _iniciar_proceso(destino: str):
+    engine.dispose(close=False)  # no compartir conexiones heredadas del proceso padre
+    session = Session(engine)
+    grafo.construir(session)
+    _proceso.update(destino=destino, session=session, entorno=_entorno())
+
+
+def _renderizar_lote(paginas: list[str]) -> dict[str, list[str] | None]:
+    """Renderiza y escribe las páginas; devuelve sus dependencias (None si se borró)."""
+    destino, session, entorno = _proceso["destino"], _proceso["session"], _proceso["entorno"]
+    resultado = {}
+    for pagina in paginas:
+        if pagina == "inicio":
+            plantilla, contexto, deps = "index.html", {}, set()
+        elif pagina.startswith("lista:"):
+            plantilla, contexto = _lista(session, pagina.split(":")[1])
+            deps = set()
+        else:
+            entidad, entidad_id = pagina.split(":")
+            detalle = _detalle(session, entidad, int(entidad_id))
+            if detalle is None:
+                _borrar(destino, ruta(pagina))
+                resultado[pagina] = None
+                continue
+            plantilla, contexto, deps = detalle
+        _escribir(destino, ruta(pagina), entorno.get_template(plantilla).render(contexto))
+        resultado[pagina] = sorted(deps)
+    # Cerrar la transacción entre lotes: cada lote lee datos frescos
+    session.close()
+    return resultado
+
+
+def renderizar(destino: str, paginas: list[str], procesos: int) -> dict[str, list[str] | None]:
+    lotes = [paginas[i:i + LOTE_PAGINAS] for i in range(0, len(paginas), LOTE_PAGINAS)]
+    resultado = {}
+    if not lotes:
+        return resultado
+    with ProcessPoolExecutor(max_workers=min(procesos, len(lotes)), initializer=_iniciar_proceso, initargs=(destino,)) as pool:
+        for parcial in pool.map(_renderizar_lote, lotes):
+            resultado.update(parcial)
+    return resultado
+
+
+# ---------------------------
+# EXPORTACIÓN COMPLETA E INCREMENTAL
+# ---------------------------
+def _hasta() -> datetime.datetime:
+    # Mismo margen que el feed: no saltar transacciones que se confirman tarde
+    return datetime.datetime.utcnow() - datetime.timedelta(seconds=MARGEN_SEGUNDOS)
+
+
+def _leer_estado(destino: str) -> dict | None:
+    try:
+        with open(os.path.join(destino, ESTADO), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _guardar_estado(destino: str, cursor: int, dependencias: dict[str, list[str]]):
+    _escribir(destino, ESTADO, json.dumps({"cursor": cursor, "dependencias": dependencias}))
+
+
+def _copiar_estaticos(destino: str):
+    shutil.copytree("static", os.path.join(destino, "static"), dirs_exist_ok=True)
+
+
+def exportar_completo(destino: str, procesos: int) -> int:
+    with Session(engine) as session:
+        # El cursor se toma antes de leer: lo que se escriba durante la exportación
+        # vuelve a aparecer en la siguiente incremental
+        cursor = crud.ultimo_cambio(session, _hasta())
+        paginas = ["inicio"] + [f"lista:{e}" for e in MODELOS]
+        for entidad, modelo in MODELOS.items():
+            ids = session.exec(select(modelo.id).where(modelo.activo == True).order_by(modelo.id)).all()
+            paginas.extend(f"{entidad}:{i}" for i in ids)
+
+    _copiar_estaticos(destino)
+    resultado = renderizar(destino, paginas, procesos)
+    dependencias = {p: d for p, d in resultado.items() if d and ":" in p and not p.startswith("lista:")}
+    _guardar_estado(destino, cursor, dependencias)
+    return len(paginas)
+
+
+def exportar_incremental(destino: str, procesos: int) -> int:
+    estado = _leer_estado(destino)
+    if estado is None:
+        return exportar_completo(destino, procesos)
+    dependencias: dict[str, list[str]] = estado["dependencias"]
+
+    cambiados: set[str] = set()
+    tocados: set[str] = set()
+    with Session(engine) as session:
+        hasta = _hasta()
+        cursor = estado["cursor"]
+        while True:
+            cambios = crud.listar_cambios(session, cursor, LOTE_CAMBIOS, hasta)
+            for c in cambios:
+                clave = f"{c.entidad}:{c.entidad_id}"
+                cambiados.add(clave)
+                tocados.add(clave)
+                if c.entidad == "item":
+                    # Los nodos nuevos y los que tenía antes: sus ítems pueden ganar o perder relacionados
+                    datos = json.loads(c.datos)
+                    for tipo, campo in CAMPOS_ENLACE.items():
+                        tocados.update(f"{tipo}:{i}" for i in datos.get(campo, []))
+                    tocados.update(d for d in dependencias.get(clave, []) if not d.startswith("item:"))
+            if len(cambios) < LOTE_CAMBIOS:
+                break
+            cursor = cambios[-1].id
+        if cambios:
+            cursor = cambios[-1].id
+
+    if not cambiados:
+        return 0
+
+    paginas = set(cambiados)
+    paginas.update(f"lista:{clave.split(':')[0]}" for clave in cambiados)
+    paginas.update(p for p, deps in dependencias.items() if tocados.intersection(deps))
+
+    _copiar_estaticos(destino)
+    resultado = renderizar(destino, sorted(paginas), procesos)
+    for pagina, deps in resultado.items():
+        if pagina.startswith("lista:") or pagina == "inicio":
+            continue
+        if deps is None:
+            dependencias.pop(pagina, None)
+        else:
+            dependencias[pagina] = deps
+    _guardar_estado(destino, cursor, dependencias)
+    return len(paginas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta la wiki a HTML estático")
+    parser.add_argument("--destino", default="sitio", help="carpeta de salida")
+    parser.add_argument("--incremental", action="store_true", help="rehacer solo las páginas afectadas por cambios")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="procesos de renderizado en paralelo")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.incremental:
+        n = exportar_incremental(args.destino, args.procesos)
+    else:
+        n = exportar_completo(args.destino, args.procesos)
+    print(f"{n} páginas en {time.perf_counter() - inicio:.1f} s -> {args.destino}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""
+Índices en memoria sobre el catálogo.
+
+Se construyen al iniciar la app (ver main.py) y se mantienen al día con los
+eventos que publica crud.py, así las consultas frecuentes no van a la base de datos.
+"""
@@ -0,0 +1,336 @@
+"""
+Índice de bitmaps para los filtros de la búsqueda de ítems.
+
+Cada valor de filtro (categoría 3, ubicación 7, indispensable, activo...) tiene un
+bitmap con un bit encendido por cada ítem que lo cumple; el bit n es el ítem con id n.
+Los bitmaps son enteros de Python, así que combinar filtros es un `&` sobre enteros
+y contar resultados es `bit_count()`, ambos en C.
+
+Se mantiene con los eventos del proceso. Las escrituras de otros workers se notan por las
+generaciones de la caché (cache.Vigencia): hasta que se reconstruye en segundo plano,
+la búsqueda va por SQL.
+
+Uso del benchmark contra la ruta SQL:
+    python -m indices.bitmap --items 10000
+"""
+import argparse
+import threading
+import time
+
+from sqlmodel import Session, select
+
+import tareas
+from cache import Vigencia
+from eventos import Evento, suscribir
+from models import Item, Categoria, Ubicacion, Interaccion, ItemCategoriaLink, ItemLocationLink, ItemInteraccionLink
+
+TIPOS = ("categoria", "ubicacion", "interaccion")
+ENTIDADES = ("item", *TIPOS)
+
+# Columna que da el nombre de cada nodo en las facetas
+ETIQUETAS = {"categoria": "nombre", "ubicacion": "nombre", "interaccion": "descripcion"}
+
+
+def desde_ids(ids) -> int:
+    bits = 0
+    for i in ids:
+        bits |= 1 << i
+    return bits
+
+
+def a_ids(bits: int) -> list[int]:
+    """Ids de los bits encendidos, de menor a mayor."""
+    # Recorrer la representación binaria es mucho más rápido que ir apagando bits de un entero grande
+    binario = bin(bits)[:1:-1]
+    ids = []
+    i = binario.find("1")
+    while i != -1:
+        ids.append(i)
+        i = binario.find("1", i + 1)
+    return ids
+
+
+class IndiceBitmap:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.listo = False
+        self.vigencia = Vigencia(ENTIDADES)
+        self._construccion = threading.Lock()
+        # Eventos que llegan mientras construir() lee la base; se aplican sobre lo leído
+        self._durante: list[Evento] | None = None
+        # ("categoria", 3) -> bitmap; ("existe" | "activo" | "indispensable", True) -> bitmap
+        self._bits: dict[tuple, int] = {}
+        # item_id -> {"categoria": {ids}, ...} para poder quitar bits en una actualización
+        self._enlaces: dict[int, dict[str, set[int]]] = {}
+        # ("categoria", 3) -> nombre, para las facetas
+        self._etiquetas: dict[tuple[str, int], str] = {}
+        self._nodos_inactivos: set[tuple[str, int]] = set()
+
+    # ---------------------------
+    # CONSTRUCCIÓN
+    # ---------------------------
+    def construir(self, session: Session):
+        with self._construccion:
+            with self._lock:
+                self._durante = []
+            try:
+                self._construir(session)
+            finally:
+                with self._lock:
+                    self._durante = None
+
+    def _construir(self, session: Session):
+        marca = self.vigencia.marcar()
+        bits: dict[tuple, int] = {}
+        enlaces: dict[int, dict[str, set[int]]] = {}
+
+        activos, indispensables = [], []
+        for item_id, activo, indispensable in session.exec(select(Item.id, Item.activo, Item.indispensable)):
+            enlaces[item_id] = {t: set() for t in TIPOS}
+            if activo:
+                activos.append(item_id)
+            if indispensable:
+                indispensables.append(item_id)
+        bits[("existe", True)] = desde_ids(enlaces)
+        bits[("activo", True)] = desde_ids(activos)
+        bits[("indispensable", True)] = desde_ids(indispensables)
+
+        tablas = (
+            ("categoria", ItemCategoriaLink.item_id, ItemCategoriaLink.categoria_id),
+            ("ubicacion", ItemLocationLink.item_id, ItemLocationLink.ubicacion_id),
+            ("interaccion", ItemInteraccionLink.item_id, ItemInteraccionLink.interaccion_id),
+        )
+        for tipo, col_item, col_otro in tablas:
+            por_nodo: dict[int, list[int]] = {}
+            for item_id, otro_id in session.exec(select(col_item, col_otro)):
+                if item_id in enlaces:
+                    enlaces[item_id][tipo].add(otro_id)
+                    por_nodo.setdefault(otro_id, []).append(item_id)
+            for otro_id, ids in por_nodo.items():
+                bits[(tipo, otro_id)] = desde_ids(ids)
+
+        etiquetas = {}
+        inactivos = set()
+        for tipo, modelo in (("categoria", Categoria), ("ubicacion", Ubicacion), ("interaccion", Interaccion)):
+            etiqueta = getattr(modelo, ETIQUETAS[tipo])
+            for otro_id, nombre, activo in session.exec(select(modelo.id, etiqueta, modelo.activo)):
+                etiquetas[(tipo, otro_id)] = nombre
+                if not activo:
+                    inactivos.add((tipo, otro_id))
+
+        with self._lock:
+            self._bits = bits
+            self._enlaces = enlaces
+            self._etiquetas = etiquetas
+            self._nodos_inactivos = inactivos
+            self.listo = True
+            self.vigencia.fijar(marca)
+            # Una escritura confirmada durante la lectura puede no estar en lo leído
+            for evento in self._durante:
+                self._aplicar(evento)
+
+    # ---------------------------
+    # ACTUALIZACIÓN INCREMENTAL
+    # ---------------------------
+    def _poner(self, clave: tuple, item_id: int, encendido: bool):
+        actual = self._bits.get(clave, 0)
+        if encendido:
+            self._bits[clave] = actual | (1 << item_id)
+        elif actual:
+            actual &= ~(1 << item_id)
+            if actual:
+                self._bits[clave] = actual
+            else:
+                del self._bits[clave]
+
+    def actualizar_item(self, item_id: int, datos: dict):
+        with self._lock:
+            anteriores = self._enlaces.get(item_id, {t: set() for t in TIPOS})
+            nuevos = {t: set(datos.get(f"{t}_ids", [])) for t in TIPOS}
+            for tipo in TIPOS:
+                for otro_id in anteriores[tipo] - nuevos[tipo]:
+                    self._poner((tipo, otro_id), item_id, False)
+                for otro_id in nuevos[tipo] - anteriores[tipo]:
+                    self._poner((tipo, otro_id), item_id, True)
+            self._enlaces[item_id] = nuevos
+            self._poner(("existe", True), item_id, True)
+            self._poner(("activo", True), item_id, datos.get("activo", True))
+            self._poner(("indispensable", True), item_id, bool(datos.get("indispensable")))
+
+    def actualizar_nodo(self, tipo: str, nodo_id: int, datos: dict):
+        with self._lock:
+            self._etiquetas[(tipo, nodo_id)] = datos.get(ETIQUETAS[tipo])
+            if datos.get("activo", True):
+                self._nodos_inactivos.discard((tipo, nodo_id))
+            else:
+                self._nodos_inactivos.add((tipo, nodo_id))
+
+    def _aplicar(self, evento: Evento):
+        if evento.entidad == "item":
+            self.actualizar_item(evento.id, evento.datos)
+        elif evento.entidad in TIPOS:
+            self.actualizar_nodo(evento.entidad, evento.id, evento.datos)
+
+    def al_evento(self, evento: Evento):
+        with self._lock:
+            if self._durante is not None:
+                self._durante.append(evento)
+            if self.listo:
+                self._aplicar(evento)
+
+    def al_dia(self) -> bool:
+        """
+        False si otro proceso escribió desde que se construyó: pide reconstruirlo en
+        segundo plano (calentar_cache) y mientras tanto no se debe usar.
+        """
+        return self.vigencia.revisar()
+
+    # ---------------------------
+    # CONSULTAS
+    # ---------------------------
+    def filtrar(
+        self,
+        categoria_id: int | None = None,
+        ubicacion_id: int | None = None,
+        interaccion_id: int | None = None,
+        indispensable: bool | None = None,
+        activo: bool | None = True,
+    ) -> int:
+        """Bitmap de los ítems que cumplen todos los filtros indicados."""
+        with self._lock:
+            todos = self._bits.get(("existe", True), 0)
+            bits = todos
+            for tipo, valor in (("categoria", categoria_id), ("ubicacion", ubicacion_id), ("interaccion", interaccion_id)):
+                if valor is not None:
+                    bits &= self._bits.get((tipo, valor), 0)
+            for clave, valor in (("activo", activo), ("indispensable", indispensable)):
+                if valor is not None:
+                    encendidos = self._bits.get((clave, True), 0)
+                    bits &= encendidos if valor else todos & ~encendidos
+            return bits
+
+    def facetas(self, bits: int) -> dict:
+        """
+        Conteo por categoría, ubicación, interacción e indispensable dentro de `bits`,
+        con la misma forma que crud.facetas_items.
+        """
+        facetas = {"categoria": [], "ubicacion": [], "interaccion": [], "indispensable": []}
+        with self._lock:
+            for (tipo, valor), nodo in self._bits.items():
+                if tipo not in TIPOS or (tipo, valor) in self._nodos_inactivos:
+                    continue
+                total = (bits & nodo).bit_count()
+                if total:
+                    facetas[tipo].append({"id": valor, "nombre": self._etiquetas.get((tipo, valor)), "total": total})
+            si = (bits & self._bits.get(("indispensable", True), 0)).bit_count()
+        no = bits.bit_count() - si
+        for valor, etiqueta, total in ((True, "Sí", si), (False, "No", no)):
+            if total:
+                facetas["indispensable"].append({"id": valor, "nombre": etiqueta, "total": total})
+
+        for valores in facetas.values():
+            valores.sort(key=lambda v: (-v["total"], str(v["nombre"])))
+        return facetas
+
+
+indice_bitmap = IndiceBitmap()
+suscribir(indice_bitmap.al_evento)
+
+
+@tareas.registrar_calentador
+def reconstruir():
+    """Vuelve a armar el índice si otro proceso escribió desde la última vez."""
+    if indice_bitmap.listo and not indice_bitmap.vigencia.vigente():
+        from db import engine
+
+        with Session(engine) as session:
+            indice_bitmap.construir(session)
+
+
+# ---------------------------
+# BENCHMARK: bitmaps vs SQL
+# ---------------------------
+def _sembrar(session: Session, n_items: int, n_nodos: int, semilla: int):
+    import random
+
+    azar = random.Random(semilla)
+    for modelo, campos in ((Categoria, "nombre"), (Ubicacion, "nombre"), (Interaccion, "descripcion")):
+        session.add_all(modelo(**{campos: f"{modelo.__name__} {i}"}) for i in range(1, n_nodos + 1))
+    session.add_all(
+        Item(nombre=f"Item {i}", indispensable=azar.random() < 0.2, activo=azar.random() < 0.9)
+        for i in range(1, n_items + 1)
+    )
+    session.flush()
+    for i in range(1, n_items + 1):
+        for link, col in ((ItemCategoriaLink, "categoria_id"), (ItemLocationLink, "ubicacion_id"), (ItemInteraccionLink, "interaccion_id")):
+            for otro in azar.sample(range(1, n_nodos + 1), azar.randint(0, 3)):
+                session.add(link(item_id=i, **{col: otro}))
+    session.commit()
+
+
+def main():
+    import random
+
+    from sqlalchemy import func
+    from sqlmodel import SQLModel, create_engine
+
+    from crud import _condiciones_busqueda
+
+    parser = argparse.ArgumentParser(description="Compara el índice de bitmaps con la búsqueda en SQL")
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--nodos", type=int, default=50, help="categorías, ubicaciones e interacciones de cada tipo")
+    parser.add_argument("--consultas", type=int, default=500)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--url", default="sqlite://", help="base de datos de prueba (por defecto SQLite en memoria)")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    SQLModel.metadata.create_all(engine)
+    azar = random.Random(args.semilla)
+    with Session(engine) as session:
+        _sembrar(session, args.items, args.nodos, args.semilla)
+
+        inicio = time.perf_counter()
+        indice = IndiceBitmap()
+        indice.construir(session)
+        print(f"construcción: {(time.perf_counter() - inicio) * 1000:.1f} ms para {args.items} ítems")
+
+        filtros = []
+        for _ in range(args.consultas):
+            f = {}
+            for clave in ("categoria_id", "ubicacion_id", "interaccion_id"):
+                if azar.random() < 0.5:
+                    f[clave] = azar.randint(1, args.nodos)
+            if azar.random() < 0.3:
+                f["indispensable"] = azar.random() < 0.5
+            filtros.append(f)
+
+        inicio = time.perf_counter()
+        con_sql = []
+        for f in filtros:
+            ids = session.exec(select(Item.id).where(*_condiciones_busqueda(**f)).order_by(Item.id)).all()
+            con_sql.append(list(ids))
+        t_sql = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        con_bitmap = [a_ids(indice.filtrar(**f)) for f in filtros]
+        t_bitmap = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        for f in filtros:
+            session.exec(select(func.count()).select_from(Item).where(*_condiciones_busqueda(**f))).one()
+        t_sql_contar = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        for f in filtros:
+            indice.filtrar(**f).bit_count()
+        t_bitmap_contar = time.perf_counter() - inicio
+
+    assert con_sql == con_bitmap, "el índice y SQL no coinciden"
+    n = args.consultas
+    print(f"ids:    SQL {t_sql / n * 1e6:9.1f} µs/consulta   bitmap {t_bitmap / n * 1e6:9.1f} µs/consulta")
+    print(f"contar: SQL {t_sql_contar / n * 1e6:9.1f} µs/consulta   bitmap {t_bitmap_contar / n * 1e6:9.1f} µs/consulta")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Grafo de relaciones entre ítems.
+
+Es un grafo bipartito: los ítems se conectan con categorías, ubicaciones e
+interacciones a través de las tablas de enlace. Dos ítems están "relacionados"
+si comparten alguno de esos nodos.
+
+Se mantiene con los eventos del proceso; si otro worker (o `python -m archivo`) escribió,
+se nota por las generaciones de la caché y se reconstruye en segundo plano.
+"""
+import threading
+from collections import Counter, deque
+
+from sqlmodel import Session, select
+
+import tareas
+from cache import Vigencia
+from eventos import Evento, suscribir
+from models import Item, Categoria, Ubicacion, Interaccion, ItemCategoriaLink, ItemLocationLink, ItemInteraccionLink
+
+TIPOS = ("categoria", "ubicacion", "interaccion")
+
+# Peso de cada tipo de vínculo al ordenar ítems relacionados
+PESOS = {"ubicacion": 2.0, "interaccion": 2.0, "categoria": 1.0}
+
+
+class GrafoItems:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.listo = False
+        self.vigencia = Vigencia(("item", *TIPOS))
+        self._construccion = threading.Lock()
+        # Eventos que llegan mientras construir() lee la base; se aplican sobre lo leído
+        self._durante: list[Evento] | None = None
+        # item_id -> {"categoria": {ids}, "ubicacion": {ids}, "interaccion": {ids}}
+        self._enlaces: dict[int, dict[str, set[int]]] = {}
+        # ("ubicacion", 3) -> {item_ids}
+        self._items_de: dict[tuple[str, int], set[int]] = {}
+        # item_id -> {"nombre", "imagen_url"} para pintar paneles sin ir a la DB
+        self._resumen: dict[int, dict] = {}
+        self._items_activos: set[int] = set()
+        self._nodos_inactivos: set[tuple[str, int]] = set()
+
+    # ---------------------------
+    # CONSTRUCCIÓN
+    # ---------------------------
+    def construir(self, session: Session):
+        with self._construccion:
+            with self._lock:
+                self._durante = []
+            try:
+                self._construir(session)
+            finally:
+                with self._lock:
+                    self._durante = None
+
+    def _construir(self, session: Session):
+        marca = self.vigencia.marcar()
+        enlaces: dict[int, dict[str, set[int]]] = {}
+        resumen = {}
+        activos = set()
+        for item_id, nombre, imagen_url, activo in session.exec(
+            select(Item.id, Item.nombre, Item.imagen_url, Item.activo)
+        ):
+            enlaces[item_id] = {t: set() for t in TIPOS}
+            resumen[item_id] = {"nombre": nombre, "imagen_url": imagen_url}
+            if activo:
+                activos.add(item_id)
+
+        tablas = (
+            ("categoria", ItemCategoriaLink.item_id, ItemCategoriaLink.categoria_id),
+            ("ubicacion", ItemLocationLink.item_id, ItemLocationLink.ubicacion_id),
+            ("interaccion", ItemInteraccionLink.item_id, ItemInteraccionLink.interaccion_id),
+        )
+        for tipo, col_item, col_otro in tablas:
+            for item_id, otro_id in session.exec(select(col_item, col_otro)):
+                if item_id in enlaces:
+                    enlaces[item_id][tipo].add(otro_id)
+
+        inactivos = set()
+        for tipo, modelo in (("categoria", Categoria), ("ubicacion", Ubicacion), ("interaccion", Interaccion)):
+            for otro_id in session.exec(select(modelo.id).where(modelo.activo == False)):
+                inactivos.add((tipo, otro_id))
+
+        items_de: dict[tuple[str, int], set[int]] = {}
+        for item_id, por_tipo in enlaces.items():
+            for tipo, ids in por_tipo.items():
+                for otro_id in ids:
+                    items_de.setdefault((tipo, otro_id), set()).add(item_id)
+
+        with self._lock:
+            self._enlaces = enlaces
+            self._items_de = items_de
+            self._resumen = resumen
+            self._items_activos = activos
+            self._nodos_inactivos = inactivos
+            self.listo = True
+            self.vigencia.fijar(marca)
+            # Una escritura confirmada durante la lectura puede no estar en lo leído
+            for evento in self._durante:
+                self._aplicar(evento)
+
+    # ---------------------------
+    # ACTUALIZACIÓN INCREMENTAL
+    # ---------------------------
+    def actualizar_item(self, item_id: int, datos: dict):
+        with self._lock:
+            anteriores = self._enlaces.get(item_id, {t: set() for t in TIPOS})
+            nuevos = {
+                "categoria": set(datos.get("categoria_ids", [])),
+                "ubicacion": set(datos.get("ubicacion_ids", [])),
+                "interaccion": set(datos.get("interaccion_ids", [])),
+            }
+            for tipo in TIPOS:
+                for otro_id in anteriores[tipo] - nuevos[tipo]:
+                    nodo = self._items_de.get((tipo, otro_id))
+                    if nodo is not None:
+                        nodo.discard(item_id)
+                        if not nodo:
+                            del self._items_de[(tipo, otro_id)]
+                for otro_id in nuevos[tipo] - anteriores[tipo]:
+                    self._items_de.setdefault((tipo, otro_id), set()).add(item_id)
+            self._enlaces[item_id] = nuevos
+            self._resumen[item_id] = {"nombre": datos.get("nombre"), "imagen_url": datos.get("imagen_url")}
+            if datos.get("activo", True):
+                self._items_activos.add(item_id)
+            else:
+                self._items_activos.discard(item_id)
+
+    def marcar_nodo(self, tipo: str, nodo_id: int, activo: bool):
+        with self._lock:
+            if activo:
+                self._nodos_inactivos.discard((tipo, nodo_id))
+            else:
+                self._nodos_inactivos.add((tipo, nodo_id))
+
+    def _aplicar(self, evento: Evento):
+        if evento.entidad == "item":
+            self.actualizar_item(evento.id, evento.datos)
+        elif evento.entidad in TIPOS:
+            self.marcar_nodo(evento.entidad, evento.id, evento.datos.get("activo", True))
+
+    def al_evento(self, evento: Evento):
+        with self._lock:
+            if self._durante is not None:
+                self._durante.append(evento)
+            if self.listo:
+                self._aplicar(evento)
+
+    # ---------------------------
+    # CONSULTAS
+    # ---------------------------
+    def _vecinos(self, item_id: int, tipos=TIPOS):
+        """Nodos (tipo, id) activos conectados al ítem."""
+        por_tipo = self._enlaces.get(item_id)
+        if not por_tipo:
+            return
+        for tipo in tipos:
+            for otro_id in por_tipo[tipo]:
+                if (tipo, otro_id) not in self._nodos_inactivos:
+                    yield tipo, otro_id
+
+    def relacionados(self, item_id: int, tipos=("ubicacion", "interaccion"), limite: int = 6) -> list[dict]:
+        """
+        Ítems activos que comparten alguna ubicación/interacción (u otro tipo pedido) con el ítem,
+        ordenados por cuántos vínculos comparten (ponderados por PESOS).
+        """
+        # Si otro proceso escribió se responde con lo que hay mientras se reconstruye
+        self.vigencia.revisar()
+        with self._lock:
+            puntajes: Counter = Counter()
+            compartidos: dict[int, list[tuple[str, int]]] = {}
+            for nodo in self._vecinos(item_id, tipos):
+                for otro in self._items_de.get(nodo, ()):
+                    if otro == item_id or otro not in self._items_activos:
+                        continue
+                    puntajes[otro] += PESOS.get(nodo[0], 1.0)
+                    compartidos.setdefault(otro, []).append(nodo)
+
+            mejores = sorted(puntajes.items(), key=lambda kv: (-kv[1], kv[0]))[:limite]
+            return [
+                {
+                    "id": otro,
+                    **self._resumen.get(otro, {}),
+                    "puntaje": puntaje,
+                    "compartidos": [{"tipo": t, "id": i} for t, i in compartidos[otro]],
+                }
+                for otro, puntaje in mejores
+            ]
+
+    def camino(self, origen: int, destino: int, max_saltos: int = 8) -> list[dict] | None:
+        """
+        Camino más corto entre dos ítems pasando por nodos compartidos (BFS).
+        Devuelve la lista de nodos [{"tipo": "item", "id": 1}, {"tipo": "ubicacion", "id": 3}, ...]
+        o None si no están conectados en `max_saltos` saltos.
+        """
+        self.vigencia.revisar()
+        with self._lock:
+            if origen not in self._items_activos or destino not in self._items_activos:
+                return None
+            inicio = ("item", origen)
+            previo: dict[tuple[str, int], tuple[str, int] | None] = {inicio: None}
+            frontera = deque([(inicio, 0)])
+            while frontera:
+                nodo, saltos = frontera.popleft()
+                if nodo == ("item", destino):
+                    camino = []
+                    while nodo is not None:
+                        camino.append({"tipo": nodo[0], "id": nodo[1]})
+                        nodo = previo[nodo]
+                    return camino[::-1]
+                if saltos >= max_saltos:
+                    continue
+                if nodo[0] == "item":
+                    siguientes = self._vecinos(nodo[1])
+                else:
+                    siguientes = (("item", i) for i in self._items_de.get(nodo, ()) if i in self._items_activos)
+                for sig in siguientes:
+                    if sig not in previo:
+                        previo[sig] = nodo
+                        frontera.append((sig, saltos + 1))
+            return None
+
+    def coocurrencias(self, tipo: str, nodo_id: int, con: str, limite: int = 10) -> list[dict]:
+        """
+        Para un nodo (ej: ubicación 3), qué nodos de otro tipo (ej: interacciones)
+        aparecen en sus mismos ítems activos, y cuántas veces.
+        """
+        self.vigencia.revisar()
+        with self._lock:
+            conteo: Counter = Counter()
+            for item_id in self._items_de.get((tipo, nodo_id), ()):
+                if item_id not in self._items_activos:
+                    continue
+                for _, otro_id in self._vecinos(item_id, (con,)):
+                    if (con, otro_id) != (tipo, nodo_id):
+                        conteo[otro_id] += 1
+            return [
+                {"tipo": con, "id": otro_id, "items": n}
+                for otro_id, n in sorted(conteo.items(), key=lambda kv: (-kv[1], kv[0]))[:limite]
+            ]
+
+
+grafo = GrafoItems()
+suscribir(grafo.al_evento)
+
+
+@tareas.registrar_calentador
+def reconstruir():
+    """Vuelve a armar el grafo si otro proceso escribió desde la última vez."""
+    if grafo.listo and not grafo.vigencia.vigente():
+        from db import engine
+
+        with Session(engine) as session:
+            grafo.construir(session)
@@ -0,0 +1,474 @@
+"""
+Instantánea binaria del catálogo para el camino de lectura público.
+
+Todo el catálogo (unos miles de filas) cabe en un archivo chico. Se genera desde la
+base, se guarda en memoria compartida (/dev/shm) y cada worker lo abre con mmap:
+las rutas de listas y detalles leen de ahí sin tocar la base ni armar objetos SQLModel.
+
+Vigencia: la instantánea guarda las generaciones de la caché (cache.py) con que se
+armó. Si alguna entidad cambió después, esa lectura va por crud como siempre y se pide
+una reconstrucción en segundo plano (calentar_cache). La nueva se escribe aparte y
+reemplaza a la anterior con os.replace; cada worker la vuelve a mapear al ver que
+cambió el archivo, y las lecturas en curso terminan con el mapa viejo.
+
+Formato (orden de bytes nativo: el archivo no sale de la máquina):
+    MAGIA (8 bytes) | largo del directorio (uint32) | directorio JSON | secciones
+El directorio trae el formato, las generaciones y (offset, largo) de cada sección:
+    "<entidad>:filas"    registros de ancho fijo (struct), ordenados por id
+    "<entidad>:indice"   int32 por id: número de fila, -1 si no existe
+    "<tipo>:inicio"      uint32: los enlaces del ítem de la fila n son ids[inicio[n]:inicio[n+1]]
+    "<tipo>:ids"         int32: ids de los nodos enlazados
+    "textos"             UTF-8 de todos los strings; las filas guardan (offset, largo)
+
+Uso (arma la instantánea y compara con crud):
+    python -m indices.instantanea --items 5000
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+
+from sqlmodel import Session, select
+
+import tareas
+from cache import cache, directorio_privado
+from db import engine
+from models import Item, Categoria, Ubicacion, Interaccion, ItemCategoriaLink, ItemLocationLink, ItemInteraccionLink
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin candado entre procesos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INSTANTANEA = os.getenv("INSTANTANEA", "1") == "1"
+# En el mismo directorio privado que la caché: otro usuario no puede dejar un archivo en su lugar
+INSTANTANEA_RUTA = os.getenv("INSTANTANEA_RUTA") or os.path.join(directorio_privado(), "instantanea.bin")
+
+MAGIA = b"BWINST\x00\x00"
+FORMATO = 1
+
+ENTIDADES = ("item", "categoria", "ubicacion", "interaccion")
+MODELOS = {"item": Item, "categoria": Categoria, "ubicacion": Ubicacion, "interaccion": Interaccion}
+ENLACES = {
+    "categoria": (ItemCategoriaLink, "categoria_id"),
+    "ubicacion": (ItemLocationLink, "ubicacion_id"),
+    "interaccion": (ItemInteraccionLink, "interaccion_id"),
+}
+
+# Columnas de cada registro: "q" entero (NULO si es None), "?" booleano, "s" texto
+CAMPOS = {
+    "item": (("id", "q"), ("nombre", "s"), ("descripcion", "s"), ("costo", "q"), ("indispensable", "?"),
+             ("activo", "?"), ("imagen_url", "s"), ("version", "q")),
+    "categoria": (("id", "q"), ("nombre", "s"), ("descripcion", "s"), ("activo", "?"), ("imagen_url", "s"),
+                  ("version", "q")),
+    "ubicacion": (("id", "q"), ("nombre", "s"), ("tipo", "s"), ("descripcion", "s"), ("activo", "?"),
+                  ("imagen_url", "s"), ("version", "q")),
+    "interaccion": (("id", "q"), ("descripcion", "s"), ("activo", "?"), ("imagen_url", "s"), ("version", "q")),
+}
+
+# Columnas de cada nodo dentro de get_item_detallado (mismas que arma crud)
+CAMPOS_DETALLE = {
+    "categoria": ("id", "nombre", "descripcion", "imagen_url"),
+    "ubicacion": ("id", "nombre", "tipo", "descripcion", "imagen_url"),
+    "interaccion": ("id", "descripcion", "imagen_url"),
+}
+CLAVES_DETALLE = {"categoria": "categorias", "ubicacion": "ubicaciones", "interaccion": "interacciones"}
+
+NULO = -2 ** 63
+SIN_TEXTO = 0xFFFFFFFF
+
+
+def _estructura(entidad: str) -> struct.Struct:
+    return struct.Struct("=" + "".join("II" if tipo == "s" else tipo for _, tipo in CAMPOS[entidad]))
+
+
+def _alinear(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class Fila(dict):
+    """Fila leída de la instantánea: dict (para tojson y JSON) que también se lee como atributo."""
+
+    def __getattr__(self, campo):
+        try:
+            return self[campo]
+        except KeyError:
+            raise AttributeError(campo) from None
+
+
+# ---------------------------
+# GENERACIÓN
+# ---------------------------
+def generar(session: Session, generaciones: dict[str, int]) -> bytes:
+    textos = bytearray()
+    ubicados: dict[str, tuple[int, int]] = {}
+
+    def texto(valor: str | None) -> tuple[int, int]:
+        if valor is None:
+            return SIN_TEXTO, 0
+        if valor not in ubicados:
+            datos = valor.encode("utf-8")
+            ubicados[valor] = (len(textos), len(datos))
+            textos.extend(datos)
+        return ubicados[valor]
+
+    secciones: dict[str, bytes] = {}
+    item_ids: list[int] = []
+    for entidad, modelo in MODELOS.items():
+        campos = CAMPOS[entidad]
+        estructura = _estructura(entidad)
+        filas = session.exec(select(*(getattr(modelo, c) for c, _ in campos)).order_by(modelo.id)).all()
+        registros = bytearray(estructura.size * len(filas))
+        indice = array("i", [-1]) * ((filas[-1][0] + 1) if filas else 0)
+        for n, fila in enumerate(filas):
+            valores = []
+            for (_, tipo), valor in zip(campos, fila):
+                if tipo == "s":
+                    valores.extend(texto(valor))
+                elif tipo == "q":
+                    valores.append(NULO if valor is None else valor)
+                else:
+                    valores.append(bool(valor))
+            estructura.pack_into(registros, n * estructura.size, *valores)
+            indice[fila[0]] = n
+        secciones[f"{entidad}:filas"] = bytes(registros)
+        secciones[f"{entidad}:indice"] = indice.tobytes()
+        if entidad == "item":
+            item_ids = [fila[0] for fila in filas]
+
+    for tipo, (link, columna) in ENLACES.items():
+        por_item: dict[int, list[int]] = {}
+        otro = getattr(link, columna)
+        for item_id, otro_id in session.exec(select(link.item_id, otro).order_by(link.item_id, otro)):
+            por_item.setdefault(item_id, []).append(otro_id)
+        inicio, ids = array("I", [0]), array("i")
+        for item_id in item_ids:
+            ids.extend(por_item.get(item_id, ()))
+            inicio.append(len(ids))
+        secciones[f"{tipo}:inicio"] = inicio.tobytes()
+        secciones[f"{tipo}:ids"] = ids.tobytes()
+    secciones["textos"] = bytes(textos)
+
+    cuerpo = bytearray()
+    directorio = {"formato": FORMATO, "generaciones": generaciones, "secciones": {}}
+    for nombre, datos in secciones.items():
+        cuerpo.extend(b"\x00" * (_alinear(len(cuerpo)) - len(cuerpo)))
+        directorio["secciones"][nombre] = [len(cuerpo), len(datos)]
+        cuerpo.extend(datos)
+
+    cabecera = json.dumps(directorio).encode()
+    inicio_cuerpo = _alinear(12 + len(cabecera))
+    return (
+        MAGIA + struct.pack("=I", len(cabecera)) + cabecera
+        + b"\x00" * (inicio_cuerpo - 12 - len(cabecera)) + bytes(cuerpo)
+    )
+
+
+# ---------------------------
+# LECTURA
+# ---------------------------
+class Instantanea:
+    """Un archivo de instantánea mapeado en memoria (solo lectura)."""
+
+    def __init__(self, ruta: str):
+        with open(ruta, "rb") as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        vista = memoryview(self._mapa)
+        magia, largo = struct.unpack_from("=8sI", vista)
+        if magia != MAGIA:
+            raise ValueError(f"{ruta} no es una instantánea")
+        directorio = json.loads(bytes(vista[12:12 + largo]))
+        if directorio["formato"] != FORMATO:
+            raise ValueError(f"{ruta} tiene el formato {directorio['formato']}, se esperaba {FORMATO}")
+        base = _alinear(12 + largo)
+
+        def seccion(nombre: str) -> memoryview:
+            offset, n = directorio["secciones"][nombre]
+            return vista[base + offset:base + offset + n]
+
+        self.generaciones: dict[str, int] = directorio["generaciones"]
+        self.tamano = len(self._mapa)
+        self._estructuras = {e: _estructura(e) for e in ENTIDADES}
+        self._filas = {e: seccion(f"{e}:filas") for e in ENTIDADES}
+        self._indices = {e: seccion(f"{e}:indice").cast("i") for e in ENTIDADES}
+        self._inicios = {t: seccion(f"{t}:inicio").cast("I") for t in ENLACES}
+        self._enlaces = {t: seccion(f"{t}:ids").cast("i") for t in ENLACES}
+        self._textos = seccion("textos")
+
+    def _numero(self, entidad: str, entidad_id: int) -> int | None:
+        indice = self._indices[entidad]
+        if 0 <= entidad_id < len(indice) and indice[entidad_id] >= 0:
+            return indice[entidad_id]
+        return None
+
+    def _fila(self, entidad: str, n: int) -> Fila:
+        estructura = self._estructuras[entidad]
+        valores = estructura.unpack_from(self._filas[entidad], n * estructura.size)
+        fila = Fila()
+        i = 0
+        for campo, tipo in CAMPOS[entidad]:
+            if tipo == "s":
+                offset, largo = valores[i], valores[i + 1]
+                fila[campo] = None if offset == SIN_TEXTO else str(self._textos[offset:offset + largo], "utf-8")
+                i += 2
+            else:
+                valor = valores[i]
+                fila[campo] = None if tipo == "q" and valor == NULO else valor
+                i += 1
+        return fila
+
+    def _cantidad(self, entidad: str) -> int:
+        return len(self._filas[entidad]) // self._estructuras[entidad].size
+
+    def _item(self, n: int) -> Fila:
+        fila = self._fila("item", n)
+        del fila["activo"]
+        for tipo, inicios in self._inicios.items():
+            inicio, fin = inicios[n], inicios[n + 1]
+            fila[f"{tipo}_ids"] = self._enlaces[tipo][inicio:fin].tolist()
+        return fila
+
+    # 🔹 Mismas respuestas que las funciones de crud.py que reemplazan
+    def listar(self, entidad: str) -> list[Fila]:
+        return [self._fila(entidad, n) for n in range(self._cantidad(entidad)) if self._activo(entidad, n)]
+
+    def obtener(self, entidad: str, entidad_id: int) -> Fila | None:
+        n = self._numero(entidad, entidad_id)
+        if n is None:
+            return None
+        fila = self._fila(entidad, n)
+        return fila if fila["activo"] else None
+
+    def listar_items(self) -> list[Fila]:
+        return [self._item(n) for n in range(self._cantidad("item")) if self._activo("item", n)]
+
+    def get_item(self, item_id: int) -> Fila | None:
+        n = self._numero("item", item_id)
+        if n is None or not self._activo("item", n):
+            return None
+        return self._item(n)
+
+    def get_item_detallado(self, item_id: int) -> dict | None:
+        # Como crud.get_item_detallado, no filtra por activo
+        n = self._numero("item", item_id)
+        if n is None:
+            return None
+        item = self._item(n)
+        for tipo, campos in CAMPOS_DETALLE.items():
+            nodos = []
+            for otro_id in item.pop(f"{tipo}_ids"):
+                m = self._numero(tipo, otro_id)
+                if m is not None:
+                    fila = self._fila(tipo, m)
+                    nodos.append({c: fila[c] for c in campos})
+            item[CLAVES_DETALLE[tipo]] = nodos
+        return dict(item)
+
+    def _activo(self, entidad: str, n: int) -> bool:
+        estructura = self._estructuras[entidad]
+        # Solo desempaquetar la columna activo, sin decodificar los textos
+        return estructura.unpack_from(self._filas[entidad], n * estructura.size)[self._posicion_activo(entidad)]
+
+    @staticmethod
+    def _posicion_activo(entidad: str) -> int:
+        posicion = 0
+        for campo, tipo in CAMPOS[entidad]:
+            if campo == "activo":
+                return posicion
+            posicion += 2 if tipo == "s" else 1
+        raise KeyError(entidad)
+
+
+def _generaciones_actuales() -> dict[str, int] | None:
+    if cache.backend is None:
+        return None
+    try:
+        return dict(zip(ENTIDADES, map(int, cache.backend.generaciones(ENTIDADES).split("."))))
+    except Exception:
+        logger.exception("No se pudieron leer las generaciones de la caché")
+        return None
+
+
+class LectorInstantanea:
+    """La instantánea vigente de este proceso; la vuelve a mapear cuando cambia el archivo."""
+
+    def __init__(self, ruta: str = INSTANTANEA_RUTA):
+        self.ruta = ruta
+        self._actual: Instantanea | None = None
+        self._firma: tuple | None = None
+        self._lock = threading.Lock()
+        self._pedida = 0.0
+        self._lecturas = 0
+        self._desactualizadas = 0
+
+    def abrir(self) -> Instantanea | None:
+        with self._lock:
+            try:
+                st = os.stat(self.ruta)
+            except FileNotFoundError:
+                self._actual, self._firma = None, None
+                return None
+            firma = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if firma != self._firma:
+                try:
+                    self._actual = Instantanea(self.ruta)
+                except (OSError, ValueError):
+                    logger.exception("Instantánea inválida en %s", self.ruta)
+                    self._actual = None
+                self._firma = firma
+            return self._actual
+
+    def vigente(self, entidades: tuple[str, ...]) -> Instantanea | None:
+        """La instantánea si está al día para esas entidades; si no, None y se pide otra."""
+        actuales = _generaciones_actuales()
+        if actuales is None:
+            return None
+
+        def al_dia(inst):
+            return inst is not None and all(inst.generaciones.get(e) == actuales[e] for e in entidades)
+
+        inst = self._actual
+        if not al_dia(inst):
+            # Quizás otro worker ya la reconstruyó
+            inst = self.abrir()
+            if not al_dia(inst):
+                self._desactualizadas += 1
+                self._pedir()
+                return None
+        self._lecturas += 1
+        return inst
+
+    def _pedir(self):
+        # Una vez por segundo como mucho: varias lecturas seguidas no encolan varias reconstrucciones
+        ahora = time.monotonic()
+        if ahora - self._pedida > 1:
+            self._pedida = ahora
+            tareas.cola.encolar("calentar_cache", clave="calentar_cache", reemplazar=True)
+
+    def metricas(self) -> dict:
+        inst = self._actual
+        return {
+            "activa": INSTANTANEA and cache.backend is not None,
+            "lecturas": self._lecturas,
+            "desactualizadas": self._desactualizadas,
+            "bytes": inst.tamano if inst else 0,
+            "generaciones": inst.generaciones if inst else None,
+        }
+
+
+lector = LectorInstantanea()
+
+
+# Función de crud -> (entidades de las que depende, cómo leerla de la instantánea)
+LECTURAS = {
+    "listar_items": (("item",), Instantanea.listar_items),
+    "get_item": (("item",), Instantanea.get_item),
+    "get_item_detallado": (ENTIDADES, Instantanea.get_item_detallado),
+    "list_categorias": (("categoria",), lambda inst: inst.listar("categoria")),
+    "get_categoria": (("categoria",), lambda inst, i: inst.obtener("categoria", i)),
+    "list_ubicaciones": (("ubicacion",), lambda inst: inst.listar("ubicacion")),
+    "get_ubicacion": (("ubicacion",), lambda inst, i: inst.obtener("ubicacion", i)),
+    "list_interacciones": (("interaccion",), lambda inst: inst.listar("interaccion")),
+    "get_interaccion": (("interaccion",), lambda inst, i: inst.obtener("interaccion", i)),
+}
+
+
+def leer(fn, session: Session, *args):
+    """
+    Resuelve una lectura de crud desde la instantánea si está al día;
+    si no, llama a la función de crud con la sesión (que sigue pasando por la caché).
+    """
+    entidades, desde_instantanea = LECTURAS[fn.__name__]
+    inst = lector.vigente(entidades) if INSTANTANEA else None
+    if inst is None:
+        return fn(session, *args)
+    return desde_instantanea(inst, *args)
+
+
+# ---------------------------
+# RECONSTRUCCIÓN
+# ---------------------------
+def _escribir(ruta: str, datos: bytes):
+    fd, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta) or ".", suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(datos)
+    os.replace(temporal, ruta)
+
+
+@tareas.registrar_calentador
+def reconstruir() -> bool:
+    """Arma y publica una instantánea nueva si la actual quedó atrás. True si escribió una."""
+    if not INSTANTANEA:
+        return False
+    with open(lector.ruta + ".lock", "w") as candado:
+        if fcntl is not None:
+            try:
+                fcntl.flock(candado, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False  # otro worker la está armando
+        # Las generaciones se leen antes que la base: lo que se escriba en el medio la deja vieja
+        generaciones = _generaciones_actuales()
+        if generaciones is None:
+            return False
+        actual = lector.abrir()
+        if actual is not None and actual.generaciones == generaciones:
+            return False
+        with Session(engine) as session:
+            datos = generar(session, generaciones)
+        _escribir(lector.ruta, datos)
+    lector.abrir()
+    return True
+
+
+def main():
+    import crud
+    from indices.bitmap import _sembrar
+    from sqlmodel import SQLModel, create_engine
+
+    parser = argparse.ArgumentParser(description="Arma la instantánea y compara sus lecturas con crud")
+    parser.add_argument("--items", type=int, default=0, help="sembrar ítems de prueba en una base en memoria")
+    parser.add_argument("--nodos", type=int, default=50)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    motor = engine
+    if args.items:
+        motor = create_engine("sqlite://")
+        SQLModel.metadata.create_all(motor)
+        with Session(motor) as session:
+            _sembrar(session, args.items, args.nodos, 1)
+
+    with Session(motor) as session:
+        inicio = time.perf_counter()
+        datos = generar(session, dict.fromkeys(ENTIDADES, 0))
+        print(f"generación: {(time.perf_counter() - inicio) * 1000:.1f} ms, {len(datos) / 1024:.0f} KiB")
+        ruta = os.path.join(tempfile.mkdtemp(), "instantanea.bin")
+        _escribir(ruta, datos)
+        inst = Instantanea(ruta)
+
+        for nombre, leer_crud, leer_inst in (
+            ("listar_items", lambda: crud.listar_items.sin_cache(session), inst.listar_items),
+            ("list_categorias", lambda: crud.list_categorias.sin_cache(session), lambda: inst.listar("categoria")),
+        ):
+            inicio = time.perf_counter()
+            for _ in range(args.repeticiones):
+                leer_crud()
+                session.expunge_all()
+            con_crud = (time.perf_counter() - inicio) / args.repeticiones * 1000
+            inicio = time.perf_counter()
+            for _ in range(args.repeticiones):
+                leer_inst()
+            con_inst = (time.perf_counter() - inicio) / args.repeticiones * 1000
+            print(f"{nombre}: crud {con_crud:.2f} ms, instantánea {con_inst:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Índice de prefijos (trie) para autocompletar nombres de ítems, categorías y ubicaciones.
+
+- Sin acentos y sin mayúsculas: "angel" encuentra "Ángel", "ROSARIO" encuentra "Rosario".
+- Se indexa el nombre completo y cada sufijo que empieza en una palabra,
+  así "culpa" también encuentra "Mea Culpa".
+- Cada nodo guarda los mejores candidatos de su subárbol por tipo, ya ordenados
+  (primero los que empiezan con el prefijo), así una consulta solo recorre tantos
+  nodos como letras tiene el prefijo y filtrar por tipo no deja la lista vacía.
+- Las escrituras de crud solo actualizan la tabla de entradas y marcan el trie
+  como sucio; se reconstruye en la siguiente consulta. Si escribió otro proceso
+  (se nota por las generaciones de la caché), las entradas se vuelven a leer.
+"""
+import threading
+import unicodedata
+
+from sqlmodel import Session, select
+
+from cache import Vigencia
+from eventos import Evento, suscribir
+from models import Item, Categoria, Ubicacion
+
+# Orden de preferencia entre tipos cuando empatan
+PRIORIDAD = {"item": 0, "categoria": 1, "ubicacion": 2}
+MODELOS = {"item": Item, "categoria": Categoria, "ubicacion": Ubicacion}
+
+# Candidatos guardados por nodo y tipo: el máximo de `limite` que acepta /busqueda/autocompletar
+TOP_POR_NODO = 50
+
+
+def normalizar(texto: str) -> str:
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.casefold().split())
+
+
+class _Nodo:
+    __slots__ = ("hijos", "top")
+
+    def __init__(self):
+        self.hijos: dict[str, "_Nodo"] = {}
+        # tipo -> [(es_infijo, prioridad, largo, nombre normalizado, id)], de mejor a peor
+        self.top: dict[str, list[tuple]] = {}
+
+
+def _mejores(rangos: list[tuple]) -> list[tuple]:
+    # Un nombre puede llegar al nodo por el comienzo y por otra palabra: queda el mejor rango
+    vistos = set()
+    mejores = []
+    for rango in sorted(rangos):
+        if rango[-1] not in vistos:
+            vistos.add(rango[-1])
+            mejores.append(rango)
+            if len(mejores) == TOP_POR_NODO:
+                break
+    return mejores
+
+
+class IndicePrefijos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas: dict[tuple[str, int], str] | None = None  # (tipo, id) -> nombre
+        self._raiz = _Nodo()
+        self._sucio = True
+        self.vigencia = Vigencia(tuple(MODELOS))
+
+    # ---------------------------
+    # ENTRADAS
+    # ---------------------------
+    def _cargar(self, session: Session):
+        marca = self.vigencia.marcar()
+        entradas = {}
+        for tipo, modelo in MODELOS.items():
+            for entidad_id, nombre in session.exec(
+                select(modelo.id, modelo.nombre).where(modelo.activo == True)
+            ):
+                entradas[(tipo, entidad_id)] = nombre
+        self._entradas = entradas
+        self.vigencia.fijar(marca)
+        self._sucio = True
+
+    def al_evento(self, evento: Evento):
+        if evento.entidad not in MODELOS:
+            return
+        with self._lock:
+            if self._entradas is None:
+                return  # todavía no se cargó: se leerá completo en la primera consulta
+            clave = (evento.entidad, evento.id)
+            if evento.datos.get("activo", True) and evento.datos.get("nombre"):
+                if self._entradas.get(clave) == evento.datos["nombre"]:
+                    return
+                self._entradas[clave] = evento.datos["nombre"]
+            elif self._entradas.pop(clave, None) is None:
+                return
+            self._sucio = True
+
+    # ---------------------------
+    # TRIE
+    # ---------------------------
+    def _reconstruir(self):
+        raiz = _Nodo()
+        for (tipo, entidad_id), nombre in self._entradas.items():
+            normal = normalizar(nombre)
+            if not normal:
+                continue
+            palabras = normal.split(" ")
+            for n in range(len(palabras)):
+                # n == 0 es el nombre completo (empieza con el prefijo); el resto, sufijos desde cada palabra
+                sufijo = " ".join(palabras[n:])
+                rango = (n > 0, PRIORIDAD[tipo], len(normal), normal, entidad_id)
+                nodo = raiz
+                for letra in sufijo:
+                    nodo = nodo.hijos.setdefault(letra, _Nodo())
+                    nodo.top.setdefault(tipo, []).append(rango)
+
+        # Dejar solo los mejores candidatos de cada tipo en cada nodo
+        pendientes = [raiz]
+        while pendientes:
+            nodo = pendientes.pop()
+            for tipo, rangos in nodo.top.items():
+                nodo.top[tipo] = _mejores(rangos)
+            pendientes.extend(nodo.hijos.values())
+
+        self._raiz = raiz
+        self._sucio = False
+
+    def buscar(self, session: Session, q: str, limite: int = 8, tipos: tuple[str, ...] = tuple(MODELOS)) -> list[dict]:
+        prefijo = normalizar(q)
+        if not prefijo:
+            return []
+
+        with self._lock:
+            if self._entradas is None or not self.vigencia.vigente():
+                self._cargar(session)
+            if self._sucio:
+                self._reconstruir()
+            entradas = self._entradas
+            nodo = self._raiz
+            for letra in prefijo:
+                nodo = nodo.hijos.get(letra)
+                if nodo is None:
+                    return []
+            # Cada lista ya está ordenada y trae hasta TOP_POR_NODO por tipo: el mejor
+            # `limite` de los tipos pedidos está en la unión
+            candidatos = sorted((rango, tipo) for tipo in tipos for rango in nodo.top.get(tipo, ()))
+
+        return [
+            {"tipo": tipo, "id": entidad_id, "nombre": entradas.get((tipo, entidad_id), normal)}
+            for (_, _, _, normal, entidad_id), tipo in candidatos[:limite]
+        ]
+
+    def invalidar(self):
+        with self._lock:
+            self._entradas = None
+
+
+indice_prefijos = IndicePrefijos()
+suscribir(indice_prefijos.al_evento)
@@ -0,0 +1,158 @@
+"""
+Prueba de carga de la wiki con niveles crecientes de concurrencia.
+
+Uso:
+    python -m loadtest                               # app en proceso, almacenamiento local y SQLite temporal
+    python -m loadtest --escenario subida --niveles 1,8,32 --duracion 5
+    python -m loadtest --url http://127.0.0.1:8000   # contra un servidor ya levantado
+
+Sin --url la app se importa en este mismo proceso con STORAGE_BACKEND=local, así que
+no se toca Supabase ni la base de datos real. Todas las peticiones llegan desde el mismo
+cliente: los límites de admision.py se suben para medir la app y no la cubeta (se pueden
+fijar otros con las variables ADMISION_*).
+
+Las respuestas 429 y 503 (admisión o pool saturado) se cuentan como rechazos, aparte de
+los errores.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+from loadtest.escenarios import ESCENARIOS, Estado, elegir, sembrar
+
+
+def _preparar_entorno_local(directorio: str):
+    # Debe ejecutarse ANTES de importar main/db/supa
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{directorio}/carga.db")
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["STORAGE_LOCAL_DIR"] = os.path.join(directorio, "media")
+    os.environ.setdefault("DB_ECHO", "0")
+    for clase in ("SUBIDAS", "ESCRITURAS"):
+        os.environ.setdefault(f"ADMISION_{clase}_TASA", "10000")
+        os.environ.setdefault(f"ADMISION_{clase}_RAFAGA", "10000")
+        os.environ.setdefault(f"ADMISION_{clase}_COLA", "10000")
+        os.environ.setdefault(f"ADMISION_{clase}_ESPERA", "60")
+
+
+# Rechazos por carga (admision.py, ejecutor.py): no son fallas de la app
+RECHAZOS = (429, 503)
+
+
+async def _trabajador(cliente, estado, escenario, fin, latencias, errores, rechazos, conteo):
+    while time.perf_counter() < fin:
+        operacion = elegir(escenario)
+        inicio = time.perf_counter()
+        estado_http = None
+        try:
+            r = await operacion(cliente, estado)
+            estado_http = r.status_code
+        except Exception:
+            pass
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        conteo[operacion.__name__] += 1
+        if estado_http in RECHAZOS:
+            rechazos[operacion.__name__] += 1
+        elif estado_http is None or estado_http >= 400:
+            errores[operacion.__name__] += 1
+
+
+async def _nivel(cliente, estado, escenario, concurrencia, duracion):
+    latencias: list[float] = []
+    errores: Counter = Counter()
+    rechazos: Counter = Counter()
+    conteo: Counter = Counter()
+    inicio = time.perf_counter()
+    fin = inicio + duracion
+    await asyncio.gather(*[
+        _trabajador(cliente, estado, escenario, fin, latencias, errores, rechazos, conteo)
+        for _ in range(concurrencia)
+    ])
+    transcurrido = time.perf_counter() - inicio
+    total = len(latencias)
+    latencias.sort()
+    return {
+        "concurrencia": concurrencia,
+        "peticiones": total,
+        "rps": total / transcurrido if transcurrido else 0.0,
+        "errores": sum(errores.values()),
+        "tasa_error": sum(errores.values()) / total if total else 0.0,
+        "rechazos": sum(rechazos.values()),
+        "p50_ms": statistics.median(latencias) if latencias else 0.0,
+        "p95_ms": latencias[int(total * 0.95) - 1] if total else 0.0,
+        "por_operacion": {
+            op: {"peticiones": n, "errores": errores[op], "rechazos": rechazos[op]} for op, n in conteo.items()
+        },
+    }
+
+
+def _imprimir(resultado):
+    print(
+        f"{resultado['concurrencia']:>6} {resultado['peticiones']:>10} {resultado['rps']:>9.1f} "
+        f"{resultado['errores']:>8} {resultado['tasa_error'] * 100:>7.2f}% {resultado['rechazos']:>9} "
+        f"{resultado['p50_ms']:>9.1f} {resultado['p95_ms']:>9.1f}"
+    )
+
+
+async def ejecutar(args):
+    if args.url:
+        cliente = httpx.AsyncClient(base_url=args.url, timeout=60)
+        app = None
+    else:
+        from main import app
+        cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://carga", timeout=60)
+
+    async def _correr():
+        estado = Estado()
+        async with cliente:
+            await sembrar(cliente, estado, args.semilla)
+            print(f"Escenario: {args.escenario} | {args.duracion}s por nivel | semilla: {args.semilla} ítems")
+            print(f"{'conc.':>6} {'peticiones':>10} {'req/s':>9} {'errores':>8} {'%error':>8} {'rechazos':>9} {'p50 ms':>9} {'p95 ms':>9}")
+            resultados = []
+            for concurrencia in args.niveles:
+                resultado = await _nivel(cliente, estado, args.escenario, concurrencia, args.duracion)
+                _imprimir(resultado)
+                resultados.append(resultado)
+            return resultados
+
+    if app is None:
+        resultados = await _correr()
+    else:
+        # ASGITransport no ejecuta el lifespan: se abre a mano para crear tablas, etc.
+        async with app.router.lifespan_context(app):
+            resultados = await _correr()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"escenario": args.escenario, "niveles": resultados}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la wiki de Blasphemous")
+    parser.add_argument("--url", help="URL de un servidor ya levantado (por defecto: app en proceso)")
+    parser.add_argument("--escenario", choices=sorted(ESCENARIOS), default="mixto")
+    parser.add_argument("--niveles", default="1,4,16,32",
+                        type=lambda v: [int(x) for x in v.split(",") if x.strip()],
+                        help="niveles de concurrencia separados por coma")
+    parser.add_argument("--duracion", type=float, default=10.0, help="segundos por nivel")
+    parser.add_argument("--semilla", type=int, default=50, help="ítems a crear antes de medir")
+    parser.add_argument("--json", help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    if args.url:
+        asyncio.run(ejecutar(args))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="wiki_carga_") as directorio:
+        _preparar_entorno_local(directorio)
+        asyncio.run(ejecutar(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Escenarios de carga para la wiki.
+
+Cada operación es una corrutina que recibe el cliente httpx y el estado compartido
+(ids conocidos) y devuelve la respuesta. Los escenarios son listas de (peso, operación).
+"""
+import base64
+import random
+import uuid
+
+import httpx
+
+# PNG 1x1 transparente: suficiente para ejercitar la ruta de subida sin depender de Pillow
+PNG_1X1 = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+NOMBRES = ["Rosario", "Cuenta", "Reliquia", "Cordón", "Bilis", "Lágrima", "Mea Culpa", "Corazón"]
+
+
+class Estado:
+    """Ids creados durante la semilla y la prueba, para que las lecturas apunten a datos reales."""
+
+    def __init__(self):
+        self.items: list[int] = []
+        self.categorias: list[int] = []
+        self.ubicaciones: list[int] = []
+
+    def item(self) -> int:
+        return random.choice(self.items) if self.items else 1
+
+
+def _imagen():
+    return {"imagen": (f"carga_{uuid.uuid4().hex[:8]}.png", PNG_1X1, "image/png")}
+
+
+# ---------------------------
+# LECTURAS
+# ---------------------------
+async def listar_items(cliente: httpx.AsyncClient, estado: Estado):
+    return await cliente.get("/items/")
+
+
+async def detalle_item(cliente: httpx.AsyncClient, estado: Estado):
+    return await cliente.get(f"/items/{estado.item()}/detalles")
+
+
+async def buscar_items(cliente: httpx.AsyncClient, estado: Estado):
+    return await cliente.get("/items/search", params={"nombre": random.choice(NOMBRES)[:3]})
+
+
+async def listar_categorias(cliente: httpx.AsyncClient, estado: Estado):
+    return await cliente.get("/categorias/")
+
+
+# ---------------------------
+# ESCRITURAS
+# ---------------------------
+async def crear_item(cliente: httpx.AsyncClient, estado: Estado):
+    datos = {
+        "nombre": f"{random.choice(NOMBRES)} {uuid.uuid4().hex[:6]}",
+        "descripcion": "creado por la prueba de carga",
+        "costo": str(random.randint(0, 5000)),
+        "indispensable": random.choice(["true", "false"]),
+    }
+    if estado.categorias:
+        datos["categoria_ids"] = str(random.choice(estado.categorias))
+    r = await cliente.post("/items/", data=datos)
+    if r.status_code == 200:
+        estado.items.append(r.json()["id"])
+    return r
+
+
+async def actualizar_item(cliente: httpx.AsyncClient, estado: Estado):
+    return await cliente.put(
+        f"/items/{estado.item()}",
+        data={"descripcion": f"editado {uuid.uuid4().hex[:6]}"}
+    )
+
+
+# ---------------------------
+# SUBIDAS
+# ---------------------------
+async def crear_categoria_con_imagen(cliente: httpx.AsyncClient, estado: Estado):
+    r = await cliente.post(
+        "/categorias/",
+        data={"nombre": f"Categoría {uuid.uuid4().hex[:6]}"},
+        files=_imagen()
+    )
+    if r.status_code == 200:
+        estado.categorias.append(r.json()["id"])
+    return r
+
+
+async def actualizar_item_con_imagen(cliente: httpx.AsyncClient, estado: Estado):
+    return await cliente.put(f"/items/{estado.item()}", files=_imagen())
+
+
+async def subir_imagen(cliente: httpx.AsyncClient, estado: Estado):
+    nombre, contenido, tipo = _imagen()["imagen"]
+    return await cliente.post("/imagenes/upload", files={"file": (nombre, contenido, tipo)})
+
+
+ESCENARIOS = {
+    "lectura": [
+        (5, listar_items),
+        (3, detalle_item),
+        (2, buscar_items),
+        (1, listar_categorias),
+    ],
+    "escritura": [
+        (2, crear_item),
+        (3, actualizar_item),
+        (1, listar_items),
+    ],
+    "subida": [
+        (2, crear_categoria_con_imagen),
+        (2, actualizar_item_con_imagen),
+        (1, subir_imagen),
+    ],
+    # Tráfico "realista": mayoría lecturas, algunas escrituras y pocas subidas
+    "mixto": [
+        (6, listar_items),
+        (4, detalle_item),
+        (3, buscar_items),
+        (2, listar_categorias),
+        (2, crear_item),
+        (2, actualizar_item),
+        (1, crear_categoria_con_imagen),
+        (1, actualizar_item_con_imagen),
+    ],
+}
+
+
+def elegir(escenario: str):
+    pesos, operaciones = zip(*ESCENARIOS[escenario])
+    return random.choices(operaciones, weights=pesos, k=1)[0]
+
+
+async def sembrar(cliente: httpx.AsyncClient, estado: Estado, n_items: int = 50):
+    """Crea datos base para que las lecturas no devuelvan listas vacías."""
+    for n in range(5):
+        r = await cliente.post("/categorias/", data={"nombre": f"Categoría base {n}"})
+        estado.categorias.append(r.json()["id"])
+        r = await cliente.post("/ubicaciones/", data={"nombre": f"Ubicación base {n}"})
+        estado.ubicaciones.append(r.json()["id"])
+    for n in range(n_items):
+        await crear_item(cliente, estado)
@@ -1,14 +1,52 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-from db import create_tables, get_session
-from routers import items, categorias, ubicaciones, interacciones, imagenes
+from db import create_tables, get_read_session, marcar_escritura, engine
+from routers import items, categorias, ubicaciones, interacciones, imagenes, img, metricas, busqueda, cambios, vivo
+import crud
 from crud import list_categorias
 from sqlmodel import Session
+from supa.supabase import STORAGE_BACKEND
+import ejecutor
+import tareas
+from indices.grafo import grafo
+from indices.bitmap import indice_bitmap
+from indices import instantanea
+from difusion import difusor
+from cache import cache
+from supa import proxy
+from respuestas import CacheRespuestas
+from admision import Admision
+import subidas
+import admin
+import asyncio
 
-app = FastAPI(lifespan=create_tables, title="Blasphemous Wiki API")
+
+@asynccontextmanager
+async def lifespan(app):
+    async with create_tables(app):
+        # La base pudo cambiar con la app apagada: no confiar en lo que quedó en la caché.
+        # Antes de los índices, que se comparan con esas generaciones (ver cache.Vigencia)
+        cache.vaciar()
+        # Índices en memoria: se cargan una vez y luego se actualizan con los eventos de crud
+        with Session(engine) as session:
+            proxy.registrar_urls_existentes(session)
+            grafo.construir(session)
+            indice_bitmap.construir(session)
+        instantanea.reconstruir()
+        tareas.cola.iniciar()
+        difusor.iniciar(asyncio.get_running_loop())
+        yield
+        difusor.detener()
+        tareas.cola.detener()
+    # Esperar las llamadas bloqueantes que sigan en curso
+    ejecutor.cerrar()
+
+
+app = FastAPI(lifespan=lifespan, title="Blasphemous Wiki API")
 
 #  Static y Templates
 
@@ -17,12 +55,40 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Motor de plantillas Jinja2
 templates = Jinja2Templates(directory="templates")
+proxy.registrar_plantillas(templates)
 
 app.include_router(items.router)
 app.include_router(categorias.router)
 app.include_router(ubicaciones.router)
 app.include_router(interacciones.router)
 app.include_router(imagenes.router)
+app.include_router(img.router)
+app.include_router(metricas.router)
+app.include_router(busqueda.router)
+app.include_router(cambios.router)
+app.include_router(vivo.router)
+
+# Con almacenamiento local/memoria la app sirve las imágenes subidas en /media
+if STORAGE_BACKEND != "supabase":
+    app.include_router(imagenes.router_media)
+
+# Read-your-writes: tras una escritura el cliente lee de la primaria unos segundos
+@app.middleware("http")
+async def leer_primaria_tras_escritura(request: Request, call_next):
+    response = await call_next(request)
+    if request.method in ("POST", "PUT", "PATCH", "DELETE") and response.status_code < 400:
+        marcar_escritura(response)
+    return response
+
+# Páginas HTML completas en caché, invalidadas por revisión de datos (ver respuestas.py)
+app.add_middleware(CacheRespuestas)
+
+# Formularios con imágenes: revisa formato, peso y dimensiones mientras llegan (ver subidas.py)
+app.add_middleware(subidas.ValidarSubidas)
+
+# Límite de ritmo por cliente y de concurrencia para escrituras y subidas (ver admision.py)
+# Se agrega al final para quedar por fuera: lo rechazado ni siquiera se empieza a leer
+app.add_middleware(Admision)
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -51,9 +117,36 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         status_code=exc.status_code,
     )
 
+@app.exception_handler(ejecutor.EjecutorSaturado)
+async def ejecutor_saturado_handler(request: Request, exc: ejecutor.EjecutorSaturado):
+    return JSONResponse(
+        {"detail": "Servidor ocupado, intenta de nuevo en unos segundos"},
+        status_code=503,
+        headers={"Retry-After": "5"},
+    )
+
+@app.exception_handler(subidas.ImagenInvalida)
+async def imagen_invalida_handler(request: Request, exc: subidas.ImagenInvalida):
+    return JSONResponse({"detail": exc.detalle}, status_code=exc.estado)
+
+@app.exception_handler(admin.AccesoDenegado)
+async def acceso_denegado_handler(request: Request, exc: admin.AccesoDenegado):
+    return JSONResponse({"detail": exc.detalle}, status_code=exc.estado)
+
+@app.exception_handler(crud.ConflictoVersion)
+async def conflicto_version_handler(request: Request, exc: crud.ConflictoVersion):
+    return JSONResponse(
+        {
+            "detail": "Otro usuario modificó este registro mientras lo editabas; recarga para ver los cambios",
+            "version_esperada": exc.esperada,
+            "version_actual": exc.actual,
+        },
+        status_code=409,
+    )
+
 @app.get("/categorias", response_class=HTMLResponse)
-async def categorias_page(request: Request, session: Session = Depends(get_session)):
-    categorias = list_categorias(session)
+async def categorias_page(request: Request, session: Session = Depends(get_read_session)):
+    categorias = instantanea.leer(list_categorias, session)
     return templates.TemplateResponse(
         "categorias/categorias.html",
         {"request": request, "categorias": categorias}
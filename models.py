@@ -1,12 +1,53 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 from typing import List, Optional
 import datetime
 
 # --- Bucket URL / Imagen Historica ---
 class Imagen(SQLModel, table=True):
+    # sqlite_autoincrement: /img/{id} se cachea como immutable, un id borrado no puede volver
+    # a apuntar a otra imagen (ver olvidar_imagenes en supa/supabase.py)
+    __table_args__ = {"sqlite_autoincrement": True}
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    url: str
+    url: str = Field(index=True)
     fecha_subida: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    # Lo que dejó el ingreso (supa/supabase.py): formato, tamaño y bytes antes y después
+    formato: Optional[str] = None
+    ancho: Optional[int] = None
+    alto: Optional[int] = None
+    bytes_original: Optional[int] = None
+    bytes_optimizado: Optional[int] = None
+    variantes: Optional[str] = None   # JSON formato -> {"url", "bytes"} (filas viejas: formato -> bytes)
+
+# --- Registro de cambios (feed para sincronización incremental) ---
+class Cambio(SQLModel, table=True):
+    # El id es el cursor: crece con cada escritura confirmada
+    id: Optional[int] = Field(default=None, primary_key=True)
+    entidad: str          # "item", "categoria", "ubicacion", "interaccion"
+    entidad_id: int
+    accion: str           # "crear", "actualizar", "eliminar", "restaurar"
+    version: Optional[int] = None
+    datos: str            # JSON con las columnas de la fila (y ids de enlaces para ítems)
+    fecha: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+
+# --- Archivo: filas eliminadas hace más que la retención, fuera de las tablas activas ---
+class Archivado(SQLModel, table=True):
+    __table_args__ = (Index("ix_archivado_entidad_id", "entidad", "entidad_id", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    entidad: str          # "item", "categoria", "ubicacion", "interaccion"
+    entidad_id: int
+    datos: str            # JSON con las columnas de la fila
+    fecha_eliminacion: Optional[datetime.datetime] = None
+    fecha_archivo: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+
+class EnlaceArchivado(SQLModel, table=True):
+    # Vuelve a su tabla de enlace cuando los dos extremos están otra vez en las tablas activas
+    id: Optional[int] = Field(default=None, primary_key=True)
+    tipo: str             # "categoria", "ubicacion", "interaccion"
+    item_id: int = Field(index=True)
+    otro_id: int = Field(index=True)
 
 # --- Link tables ---
 class ItemLocationLink(SQLModel, table=True):
@@ -51,16 +92,29 @@ class Item(SQLModel, table=True):
     )
 """
 class Item(SQLModel, table=True):
+    # Índices para ordenar/paginar la búsqueda (WHERE activo ... ORDER BY costo|nombre, id) sin ordenar en memoria.
+    # sqlite_autoincrement: SQLite no reutiliza los ids de las filas archivadas (ver archivo.py)
+    __table_args__ = (
+        Index("ix_item_activo_costo_id", "activo", "costo", "id"),
+        Index("ix_item_activo_nombre_id", "activo", "nombre", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     nombre: str
     descripcion: Optional[str] = None
     costo: Optional[int] = None
     indispensable: bool = False
     activo: bool = Field(default=True)
+    # Cuándo se hizo el soft delete; el archivado saca la fila pasada la retención (ver archivo.py)
+    fecha_eliminacion: Optional[datetime.datetime] = None
 
     # Imagen asociada opcional
     imagen_url: Optional[str] = None
 
+    # Control de concurrencia optimista: cada UPDATE exige la versión leída y la incrementa
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
     categorias: List["Categoria"] = Relationship(
         back_populates="items",
         link_model=ItemCategoriaLink
@@ -77,14 +131,19 @@ class Item(SQLModel, table=True):
 
 
 class Categoria(SQLModel, table=True):
+    __table_args__ = {"sqlite_autoincrement": True}
+
     id: Optional[int] = Field(default=None, primary_key=True)
     nombre: str
     descripcion: Optional[str] = None
     activo: bool = Field(default=True)
+    fecha_eliminacion: Optional[datetime.datetime] = None
 
     # Imagen asociada opcional
     imagen_url: Optional[str] = None
 
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
     items: List[Item] = Relationship(
         back_populates="categorias",
         link_model=ItemCategoriaLink
@@ -94,15 +153,20 @@ class Categoria(SQLModel, table=True):
 
 
 class Ubicacion(SQLModel, table=True):
+    __table_args__ = {"sqlite_autoincrement": True}
+
     id: Optional[int] = Field(default=None, primary_key=True)
     nombre: str
     tipo: Optional[str] = None
     descripcion: Optional[str] = None
     activo: bool = Field(default=True)
+    fecha_eliminacion: Optional[datetime.datetime] = None
 
     # Imagen asociada opcional
     imagen_url: Optional[str] = None
 
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
     items: List[Item] = Relationship(
         back_populates="ubicaciones",
         link_model=ItemLocationLink
@@ -110,13 +174,18 @@ class Ubicacion(SQLModel, table=True):
 
 
 class Interaccion(SQLModel, table=True):
+    __table_args__ = {"sqlite_autoincrement": True}
+
     id: Optional[int] = Field(default=None, primary_key=True)
     descripcion: str
     activo: bool = Field(default=True)
+    fecha_eliminacion: Optional[datetime.datetime] = None
 
     # Imagen asociada opcional
     imagen_url: Optional[str] = None
 
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
     items: List[Item] = Relationship(
         back_populates="interacciones",
         link_model=ItemInteraccionLink
@@ -0,0 +1,175 @@
+"""
+Proyecciones de solo lectura para las listas de ítems.
+
+listar_items cargaba cada Item completo (con su estado en la sesión) más sus
+Categoria/Ubicacion/Interaccion enteras, solo para sacar los ids. Aquí se piden
+solo las columnas que usan las listas y los ids de enlaces llegan ya agregados
+por la base (group_concat en SQLite, array_agg en Postgres), en la misma consulta.
+Cada fila es un FilaItem con __slots__: sin __dict__ por instancia y sin sesión.
+
+Benchmark de memoria y tiempo contra la carga con relaciones:
+    python -m proyecciones --items 10000,100000
+"""
+import argparse
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from models import Item, ItemCategoriaLink, ItemLocationLink, ItemInteraccionLink
+
+# campo de FilaItem -> (tabla de enlace, columna del nodo)
+ENLACES = {
+    "categoria_ids": (ItemCategoriaLink, "categoria_id"),
+    "ubicacion_ids": (ItemLocationLink, "ubicacion_id"),
+    "interaccion_ids": (ItemInteraccionLink, "interaccion_id"),
+}
+
+
+@dataclass(slots=True, frozen=True)
+class FilaItem:
+    id: int
+    nombre: str
+    descripcion: str | None
+    costo: int | None
+    indispensable: bool
+    version: int
+    imagen_url: str | None
+    categoria_ids: list[int]
+    ubicacion_ids: list[int]
+    interaccion_ids: list[int]
+
+    def a_dict(self) -> dict:
+        return asdict(self)
+
+
+COLUMNAS = (Item.id, Item.nombre, Item.descripcion, Item.costo, Item.indispensable, Item.version, Item.imagen_url)
+
+
+def _ids_agregados(dialecto: str, link, columna: str):
+    """Subconsulta correlacionada con los ids enlazados al ítem de la fila."""
+    otro = getattr(link, columna)
+    if dialecto == "postgresql":
+        agregado = func.array_agg(otro)
+    else:
+        agregado = func.group_concat(otro)
+    return select(agregado).where(link.item_id == Item.id).correlate(Item).scalar_subquery()
+
+
+def _lista_ids(valor) -> list[int]:
+    if valor is None:
+        return []
+    if isinstance(valor, str):
+        # group_concat: "3,1,7"; el orden interno de SQLite no está garantizado
+        return sorted(int(i) for i in valor.split(","))
+    return sorted(valor)
+
+
+def consulta_items(session: Session):
+    """SELECT de las columnas de FilaItem; se le agregan where/order_by/limit como a cualquier select."""
+    dialecto = session.get_bind().dialect.name
+    return select(*COLUMNAS, *(_ids_agregados(dialecto, link, columna) for link, columna in ENLACES.values()))
+
+
+def filas_items(session: Session, query) -> list[FilaItem]:
+    n = len(COLUMNAS)
+    return [
+        FilaItem(*fila[:n], *(_lista_ids(v) for v in fila[n:]))
+        for fila in session.exec(query)
+    ]
+
+
+def proyectar_items(session: Session, *condiciones) -> list[FilaItem]:
+    return filas_items(session, consulta_items(session).where(*condiciones).order_by(Item.id))
+
+
+# ---------------------------
+# BENCHMARK
+# ---------------------------
+def _sembrar(session: Session, n_items: int, n_nodos: int):
+    import random
+
+    from sqlalchemy import insert
+
+    from models import Categoria, Ubicacion, Interaccion
+
+    azar = random.Random(1)
+    for modelo, campo in ((Categoria, "nombre"), (Ubicacion, "nombre"), (Interaccion, "descripcion")):
+        session.execute(insert(modelo), [{campo: f"{modelo.__name__} {i}"} for i in range(1, n_nodos + 1)])
+    session.execute(insert(Item), [
+        {"nombre": f"Item {i}", "descripcion": "x" * 40, "costo": azar.randint(1, 5000), "activo": True}
+        for i in range(1, n_items + 1)
+    ])
+    for link, columna in ENLACES.values():
+        session.execute(insert(link), [
+            {"item_id": i, columna: otro}
+            for i in range(1, n_items + 1)
+            for otro in azar.sample(range(1, n_nodos + 1), azar.randint(0, 3))
+        ])
+    session.commit()
+
+
+def _medir(nombre: str, fn) -> None:
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = fn()
+    duracion = time.perf_counter() - inicio
+    actual, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {nombre:<12} {duracion * 1000:8.0f} ms  {len(resultado) / duracion:9.0f} filas/s  "
+          f"retenido {actual / 2**20:6.1f} MiB  pico {pico / 2**20:6.1f} MiB")
+
+
+def main():
+    from sqlalchemy.orm import selectinload
+    from sqlmodel import SQLModel, create_engine
+
+    parser = argparse.ArgumentParser(description="Compara la proyección con la carga ORM de listar_items")
+    parser.add_argument("--items", default="10000,100000", help="tamaños separados por coma")
+    parser.add_argument("--nodos", type=int, default=50)
+    args = parser.parse_args()
+
+    for n in (int(x) for x in args.items.split(",")):
+        engine = create_engine("sqlite://")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            _sembrar(session, n, args.nodos)
+
+        print(f"{n} ítems")
+        with Session(engine) as session:
+            def con_orm():
+                items = session.exec(
+                    select(Item).where(Item.activo == True).options(
+                        selectinload(Item.categorias), selectinload(Item.ubicaciones), selectinload(Item.interacciones)
+                    )
+                ).all()
+                return [
+                    {
+                        "id": it.id, "nombre": it.nombre, "descripcion": it.descripcion, "costo": it.costo,
+                        "indispensable": it.indispensable, "version": it.version, "imagen_url": it.imagen_url,
+                        "categoria_ids": [c.id for c in it.categorias],
+                        "ubicacion_ids": [u.id for u in it.ubicaciones],
+                        "interaccion_ids": [i.id for i in it.interacciones],
+                    }
+                    for it in items
+                ]
+
+            orm = con_orm()
+            _medir("ORM", con_orm)
+            session.expunge_all()
+        with Session(engine) as session:
+            proyeccion = proyectar_items(session, Item.activo == True)
+            _medir("proyección", lambda: proyectar_items(session, Item.activo == True))
+
+        por_id = {f["id"]: f for f in orm}
+        for fila in proyeccion:
+            esperado = por_id[fila.id]
+            for campo in ENLACES:
+                esperado[campo] = sorted(esperado[campo])
+            assert fila.a_dict() == esperado, f"la proyección no coincide para el ítem {fila.id}"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Caché de respuestas HTML completas (middleware ASGI).
+
+Aunque los datos ya estén en caché, cada GET vuelve a renderizar la plantilla. Este
+middleware guarda la respuesta entera en memoria, con clave:
+    ruta + parámetros normalizados + si acepta HTML
+y la revisión de los datos que muestra (generaciones de cache.py de las entidades
+de esa sección). Cuando una escritura de crud sube la generación, la revisión cambia y
+la entrada deja de servirse, en todos los workers.
+
+Vencimiento: una entrada está fresca RESPUESTAS_TTL segundos. Durante los
+RESPUESTAS_SWR siguientes se sirve igual ("stale-while-revalidate") mientras se
+renderiza la nueva en segundo plano. Solo sirve si la revisión no cambió: una escritura
+invalida siempre. El tamaño total está acotado por RESPUESTAS_MAX_BYTES (LRU).
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from urllib.parse import parse_qsl, urlencode
+
+from cache import cache
+from db import COOKIE_PRIMARIA, LEER_PRIMARIA_SEGUNDOS, replicas
+
+logger = logging.getLogger(__name__)
+
+RESPUESTAS_TTL = int(os.getenv("RESPUESTAS_TTL", "60"))
+RESPUESTAS_SWR = int(os.getenv("RESPUESTAS_SWR", "30"))
+RESPUESTAS_MAX_BYTES = int(os.getenv("RESPUESTAS_MAX_BYTES", str(32 * 1024 * 1024)))
+
+ENTIDADES = ("item", "categoria", "ubicacion", "interaccion")
+
+# Prefijo de ruta -> entidades que muestran sus páginas. Las de ítems muestran
+# nombres de categorías, ubicaciones e interacciones (detalle, facetas)
+SECCIONES = (
+    ("/items", ENTIDADES),
+    ("/categorias", ("categoria",)),
+    ("/ubicaciones", ("ubicacion",)),
+    ("/interacciones", ("interaccion",)),
+)
+
+
+def entidades_de(ruta: str) -> tuple[str, ...] | None:
+    for prefijo, entidades in SECCIONES:
+        if ruta == prefijo or ruta.startswith(prefijo + "/"):
+            return entidades
+    return None
+
+
+def _clave(scope: dict, acepta_html: bool) -> str:
+    # Mismo orden y sin parámetros vacíos: ?b=2&a=1&c= y ?a=1&b=2 son la misma página
+    parametros = sorted((k, v) for k, v in parse_qsl(scope["query_string"].decode("latin-1")) if v != "")
+    clave = f"{scope['path']}?{urlencode(parametros)}|{'html' if acepta_html else '*'}"
+    # Una página renderizada desde una réplica no se le sirve a quien lee de la primaria
+    return clave + "|primaria" if _lee_primaria(scope) else clave
+
+
+def _lee_primaria(scope: dict) -> bool:
+    # Sin réplicas todo se lee de la primaria y la cookie no cambia nada
+    return bool(replicas) and COOKIE_PRIMARIA + "=" in _cabecera(scope, b"cookie")
+
+
+def _cabecera(scope: dict, nombre: bytes) -> str:
+    for clave, valor in scope["headers"]:
+        if clave == nombre:
+            return valor.decode("latin-1")
+    return ""
+
+
+@dataclass
+class Entrada:
+    revision: str
+    estado: int
+    cabeceras: list[tuple[bytes, bytes]]
+    cuerpo: bytes
+    creada: float
+    ttl: float
+
+
+class AlmacenRespuestas:
+    """LRU acotado por bytes; compartido por todas las peticiones del proceso."""
+
+    def __init__(self, max_bytes: int = RESPUESTAS_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entradas: OrderedDict[str, Entrada] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.rancias = 0
+        self.fallos = 0
+        self.refrescos = 0
+        self.desalojos = 0
+
+    def obtener(self, clave: str) -> Entrada | None:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+            return entrada
+
+    def guardar(self, clave: str, entrada: Entrada):
+        tamano = len(entrada.cuerpo)
+        if tamano > self.max_bytes // 4:
+            return  # una página enorme desalojaría a todas las demás
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior.cuerpo)
+            self._entradas[clave] = entrada
+            self._bytes += tamano
+            while self._bytes > self.max_bytes:
+                _, vieja = self._entradas.popitem(last=False)
+                self._bytes -= len(vieja.cuerpo)
+                self.desalojos += 1
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "aciertos": self.aciertos,
+                "rancias": self.rancias,
+                "fallos": self.fallos,
+                "refrescos": self.refrescos,
+                "desalojos": self.desalojos,
+            }
+
+
+almacen = AlmacenRespuestas()
+
+
+class CacheRespuestas:
+    def __init__(self, app, almacen: AlmacenRespuestas = almacen):
+        self.app = app
+        self.almacen = almacen
+        self._refrescando: set[str] = set()
+
+    async def __call__(self, scope, receive, send):
+        entidades = entidades_de(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+        revision = cache.revision(entidades) if entidades else None
+        if revision is None:
+            await self.app(scope, receive, send)
+            return
+
+        clave = _clave(scope, "text/html" in _cabecera(scope, b"accept"))
+        entrada = self.almacen.obtener(clave)
+        if entrada is not None and entrada.revision == revision:
+            edad = time.monotonic() - entrada.creada
+            if edad < entrada.ttl:
+                self.almacen.aciertos += 1
+                await self._enviar(send, entrada, b"HIT")
+                return
+            if edad < entrada.ttl + RESPUESTAS_SWR:
+                self.almacen.rancias += 1
+                if clave not in self._refrescando:
+                    self._refrescando.add(clave)
+                    asyncio.create_task(self._refrescar(scope, clave, revision))
+                await self._enviar(send, entrada, b"STALE")
+                return
+
+        self.almacen.fallos += 1
+        await self._renderizar(scope, receive, send, clave, revision)
+
+    def _ttl(self, scope: dict) -> float:
+        # Sin la cookie de lectura en primaria la página pudo salir de una réplica
+        # atrasada: que dure lo mismo que esa ventana (ver db.py)
+        if replicas and not _lee_primaria(scope):
+            return min(RESPUESTAS_TTL, LEER_PRIMARIA_SEGUNDOS)
+        return RESPUESTAS_TTL
+
+    async def _renderizar(self, scope, receive, send, clave: str, revision: str):
+        """Pasa la petición a la app y guarda la respuesta si es HTML cacheable."""
+        respuesta: dict = {"cuerpo": bytearray()}
+
+        async def capturar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                respuesta["estado"] = mensaje["status"]
+                respuesta["cabeceras"] = list(mensaje.get("headers", []))
+                mensaje = {**mensaje, "headers": respuesta["cabeceras"] + [(b"x-cache", b"MISS")]}
+            elif mensaje["type"] == "http.response.body":
+                respuesta["cuerpo"].extend(mensaje.get("body", b""))
+                respuesta["completa"] = not mensaje.get("more_body", False)
+            if send is not None:
+                await send(mensaje)
+
+        await self.app(scope, receive, capturar)
+
+        cabeceras = respuesta.get("cabeceras", [])
+        tipo = next((v for k, v in cabeceras if k == b"content-type"), b"")
+        if (
+            respuesta.get("estado") == 200
+            and respuesta.get("completa")
+            and tipo.startswith(b"text/html")
+            and not any(k == b"set-cookie" for k, _ in cabeceras)
+        ):
+            self.almacen.guardar(clave, Entrada(
+                revision, 200, cabeceras, bytes(respuesta["cuerpo"]), time.monotonic(), self._ttl(scope),
+            ))
+
+    async def _refrescar(self, scope, clave: str, revision: str):
+        async def recibir():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        try:
+            await self._renderizar(dict(scope), recibir, None, clave, revision)
+            self.almacen.refrescos += 1
+        except Exception:
+            logger.exception("No se pudo refrescar %s", clave)
+        finally:
+            self._refrescando.discard(clave)
+
+    async def _enviar(self, send, entrada: Entrada, estado_cache: bytes):
+        await send({
+            "type": "http.response.start",
+            "status": entrada.estado,
+            "headers": entrada.cabeceras + [(b"x-cache", estado_cache)],
+        })
+        await send({"type": "http.response.body", "body": entrada.cuerpo})
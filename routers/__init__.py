@@ -1 +1 @@
-from . import items, categorias, ubicaciones, interacciones
+from . import items, categorias, ubicaciones, interacciones, imagenes, img, metricas, busqueda, cambios, vivo
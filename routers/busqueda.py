@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+from db import get_read_session
+from indices.prefijos import indice_prefijos, MODELOS, TOP_POR_NODO
+
+router = APIRouter(prefix="/busqueda", tags=["Búsqueda"])
+
+# Página de detalle de cada tipo, para que el front pueda enlazar la sugerencia
+URLS = {
+    "item": "/items/{id}/detalles",
+    "categoria": "/categorias/id/{id}",
+    "ubicacion": "/ubicaciones/id/{id}",
+}
+
+
+# ---------------------------
+# AUTOCOMPLETAR (índice de prefijos en memoria)
+# ---------------------------
+@router.get("/autocompletar")
+def autocompletar(
+    q: str = Query(default="", max_length=100),
+    limite: int = Query(default=8, ge=1, le=TOP_POR_NODO),
+    tipos: str = Query(default="item,categoria,ubicacion"),
+    session: Session = Depends(get_read_session)
+):
+    tipos_validos = tuple(t for t in tipos.split(",") if t in MODELOS)
+    sugerencias = indice_prefijos.buscar(session, q, limite, tipos_validos)
+    for s in sugerencias:
+        s["url"] = URLS[s["tipo"]].format(id=s["id"])
+    return sugerencias
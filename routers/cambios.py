@@ -0,0 +1,76 @@
+import datetime
+import json
+import os
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+import crud
+from db import engine, get_read_session
+
+router = APIRouter(prefix="/cambios", tags=["Cambios"])
+
+# Filas por consulta mientras se transmite el feed
+LOTE = 500
+
+# Los cambios más nuevos que esto no se entregan todavía: una transacción que tomó
+# un id menor puede confirmarse después de otra con id mayor, y el consumidor la saltaría
+MARGEN_SEGUNDOS = float(os.getenv("CAMBIOS_MARGEN", "1"))
+
+
+def _hasta() -> datetime.datetime:
+    return datetime.datetime.utcnow() - datetime.timedelta(seconds=MARGEN_SEGUNDOS)
+
+
+def _linea(c) -> str:
+    return json.dumps({
+        "cursor": c.id,
+        "entidad": c.entidad,
+        "id": c.entidad_id,
+        "accion": c.accion,
+        "version": c.version,
+        "datos": json.loads(c.datos),
+        "fecha": c.fecha.isoformat(),
+    }, ensure_ascii=False) + "\n"
+
+
+# ---------------------------
+# FEED DE CAMBIOS (NDJSON)
+# ---------------------------
+@router.get("/")
+def feed_cambios(
+    since: int = Query(default=0, ge=0, description="último cursor ya procesado"),
+    limite: int | None = Query(default=None, ge=1, description="máximo de cambios a devolver"),
+):
+    """
+    Un cambio por línea (NDJSON), en orden de cursor. El consumidor guarda el
+    `cursor` de la última línea y la próxima vez pide `?since=<cursor>`.
+    """
+    hasta = _hasta()
+
+    def generar():
+        # Sesión propia: la de Depends se cierra antes de que empiece el streaming
+        desde = since
+        enviados = 0
+        with Session(engine) as session:
+            while limite is None or enviados < limite:
+                lote = LOTE if limite is None else min(LOTE, limite - enviados)
+                cambios = crud.listar_cambios(session, desde, lote, hasta)
+                for c in cambios:
+                    yield _linea(c)
+                enviados += len(cambios)
+                if len(cambios) < lote:
+                    break
+                desde = cambios[-1].id
+
+    return StreamingResponse(generar(), media_type="application/x-ndjson")
+
+
+# ---------------------------
+# CURSOR ACTUAL
+# 🔹 Para empezar a seguir el feed después de una copia completa
+# ---------------------------
+@router.get("/cursor")
+def cursor_actual(session: Session = Depends(get_read_session)):
+    return {"cursor": crud.ultimo_cambio(session, _hasta())}
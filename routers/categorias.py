@@ -1,9 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
 from sqlmodel import Session
-from db import get_session
+from db import get_session, get_read_session
 from schemas import CategoriaCreate, CategoriaRead, CategoriaUpdate
 import crud
 from supa.supabase import upload_to_bucket
+from ejecutor import en_hilo
+import tareas
+from indices import instantanea
+from supa import proxy
 from typing import Optional
 from os import getenv
 from fastapi.responses import HTMLResponse
@@ -11,6 +15,7 @@ from fastapi.templating import Jinja2Templates
 from starlette.requests import Request
 
 templates = Jinja2Templates(directory="templates")
+proxy.registrar_plantillas(templates)
 
 
 router = APIRouter(prefix="/categorias", tags=["Categorías"])
@@ -26,32 +31,39 @@ async def create_categoria(
     session: Session = Depends(get_session)
 ):
     imagen_url = None
+    pendiente = None
 
-    # Subir imagen si viene
-    if imagen:
-        imagen_url = await upload_to_bucket(imagen, bucket=getenv("SUPABASE_BUCKET"))
+    # Subir (o dejar en cola) la imagen si viene
+    if imagen and imagen.filename:
+        imagen_url, pendiente = await tareas.preparar_imagen(imagen, getenv("SUPABASE_BUCKET"))
 
-    cat = crud.create_categoria(session, nombre, descripcion, imagen_url)
+    cat = await en_hilo(crud.create_categoria, session, nombre, descripcion, imagen_url)
+
+    if pendiente:
+        tareas.encolar_imagen("categoria", cat.id, pendiente, getenv("SUPABASE_BUCKET"))
 
     return CategoriaRead(
         id=cat.id,
         nombre=cat.nombre,
         descripcion=cat.descripcion,
-        imagen_url=cat.imagen_url
+        imagen_url=cat.imagen_url,
+        version=cat.version,
+        imagen_pendiente=pendiente is not None
     )
 
 # ---------------------------
 # LISTAR TODAS
 # ---------------------------
 @router.get("/", response_model=list[CategoriaRead])
-def list_categorias(session: Session = Depends(get_session)):
-    categorias = crud.list_categorias(session)
+def list_categorias(session: Session = Depends(get_read_session)):
+    categorias = instantanea.leer(crud.list_categorias, session)
     return [
         CategoriaRead(
             id=c.id,
             nombre=c.nombre,
             descripcion=c.descripcion,
-            imagen_url=c.imagen_url
+            imagen_url=c.imagen_url,
+            version=c.version
         )
         for c in categorias
     ]
@@ -61,14 +73,15 @@ def list_categorias(session: Session = Depends(get_session)):
 # LISTAR ELIMINADAS
 # ---------------------------
 @router.get("/eliminadas", response_model=list[CategoriaRead])
-def listar_categorias_eliminadas(session: Session = Depends(get_session)):
+def listar_categorias_eliminadas(session: Session = Depends(get_read_session)):
     categorias = crud.listar_categorias_eliminadas(session)
     return [
         CategoriaRead(
             id=c.id,
             nombre=c.nombre,
             descripcion=c.descripcion,
-            imagen_url=c.imagen_url
+            imagen_url=c.imagen_url,
+            version=c.version
         )
         for c in categorias
     ]
@@ -78,7 +91,7 @@ def listar_categorias_eliminadas(session: Session = Depends(get_session)):
 # LISTAR ELIMINADAS (HTML)
 # ---------------------------
 @router.get("/eliminadas", response_class=HTMLResponse)
-def listar_categorias_eliminadas_html(request: Request, session: Session = Depends(get_session)):
+def listar_categorias_eliminadas_html(request: Request, session: Session = Depends(get_read_session)):
     categorias = crud.listar_categorias_eliminadas(session)
     return templates.TemplateResponse("categorias/eliminados.html", {
         "request": request,
@@ -90,7 +103,7 @@ def listar_categorias_eliminadas_html(request: Request, session: Session = Depen
 # OBTENER POR ID
 # ---------------------------
 @router.get("/id/{categoria_id}", response_model=CategoriaRead)
-def get_categoria(categoria_id: int, session: Session = Depends(get_session)):
+def get_categoria(categoria_id: int, session: Session = Depends(get_read_session)):
     categoria = crud.get_categoria(session, categoria_id)
     if not categoria:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
@@ -98,7 +111,8 @@ def get_categoria(categoria_id: int, session: Session = Depends(get_session)):
         id=categoria.id,
         nombre=categoria.nombre,
         descripcion=categoria.descripcion,
-        imagen_url=categoria.imagen_url
+        imagen_url=categoria.imagen_url,
+        version=categoria.version
     )
 """
 
@@ -106,8 +120,8 @@ def get_categoria(categoria_id: int, session: Session = Depends(get_session)):
 # DETALLES DE CATEGORÍA (HTML)
 # ---------------------------
 @router.get("/id/{categoria_id}", response_class=HTMLResponse)
-def categoria_detalles_html(request: Request, categoria_id: int, session: Session = Depends(get_session)):
-    categoria = crud.get_categoria(session, categoria_id)
+def categoria_detalles_html(request: Request, categoria_id: int, session: Session = Depends(get_read_session)):
+    categoria = instantanea.leer(crud.get_categoria, session, categoria_id)
     if not categoria:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     return templates.TemplateResponse("categorias/categoria_detalles.html", {
@@ -124,21 +138,24 @@ async def update_categoria(
     nombre: Optional[str] = Form(None),
     descripcion: Optional[str] = Form(None),
     imagen: UploadFile | None = File(None),  # ← mantiene input FILE normal
+    version: int | None = Form(None),  # versión que vio el cliente (409 si cambió)
     session: Session = Depends(get_session)
 ):
 
     imagen_url = None
+    pendiente = None
 
     if imagen is not None:
         # Caso 1: campo enviado vacío (send empty value)
         if imagen.filename == "":
             imagen_url = ""
+            tareas.cola.cancelar(f"categoria:{categoria_id}")
 
         # Caso 2: el usuario sí sube archivo normal
         elif imagen.file:
-            imagen_url = await upload_to_bucket(
+            imagen_url, pendiente = await tareas.preparar_imagen(
                 imagen,
-                bucket=getenv("SUPABASE_BUCKET")   # ← AQUÍ EL CAMBIO
+                getenv("SUPABASE_BUCKET")   # ← AQUÍ EL CAMBIO
             )
 
         # Caso 3: algo raro
@@ -147,22 +164,29 @@ async def update_categoria(
 
     # Si imagen == None → NO tocar imagen en BD
 
-    categoria = crud.update_categoria(
+    categoria = await en_hilo(
+        crud.update_categoria,
         session,
         categoria_id,
         nombre,
         descripcion,
-        imagen_url
+        imagen_url,
+        version
     )
 
     if not categoria:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
 
+    if pendiente:
+        tareas.encolar_imagen("categoria", categoria.id, pendiente, getenv("SUPABASE_BUCKET"))
+
     return CategoriaRead(
         id=categoria.id,
         nombre=categoria.nombre,
         descripcion=categoria.descripcion,
-        imagen_url=categoria.imagen_url
+        imagen_url=categoria.imagen_url,
+        version=categoria.version,
+        imagen_pendiente=tareas.imagen_pendiente("categoria", categoria.id)
     )
 
 
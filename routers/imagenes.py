@@ -1,34 +1,78 @@
+import mimetypes
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from supa.supabase import upload_to_bucket
+from fastapi.responses import RedirectResponse, Response
+from supa.supabase import BUCKET_POR_DEFECTO, get_storage_backend, ingerir_imagen, url_negociada
 from fastapi.templating import Jinja2Templates
 
 from sqlalchemy import func
 from sqlmodel import select, Session
-from db import get_session
+from db import get_session, get_read_session
 from fastapi import Depends, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
-from models import Item, Categoria, Ubicacion, Interaccion
+from models import Imagen, Item, Categoria, Ubicacion, Interaccion
+from supa.recolector import GRACIA_MINUTOS, recolectar_huerfanas
+from subidas import validar_imagen
+import tareas
+from ejecutor import en_hilo
+from admin import requiere_admin
+import datetime
 
 templates = Jinja2Templates(directory="templates")
 
 
 router = APIRouter(prefix="/imagenes", tags=["Imágenes"])
 
+# Solo se registra cuando STORAGE_BACKEND es "local" o "memoria" (ver main.py)
+router_media = APIRouter(prefix="/media", tags=["Imágenes"])
+
 
 @router.post("/upload", status_code=201)
 async def subir_imagen(file: UploadFile = File(...)):
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="El archivo debe ser una imagen")
+    # Formato por bytes mágicos, no por el content_type que declara el cliente
+    info = await validar_imagen(file)
 
     try:
-        url = await upload_to_bucket(file)
-        return {"url": url}
+        imagen, _ = await en_hilo(
+            ingerir_imagen, await file.read(), file.filename, info.content_type, BUCKET_POR_DEFECTO,
+            pool="subidas",
+        )
+        # id sirve para /imagenes/{id}, que elige el formato según Accept. Si ninguna entidad
+        # la usa antes de `expira`, el recolector de huérfanas la puede borrar
+        return {
+            "url": imagen.url,
+            "id": imagen.id,
+            "bytes_original": imagen.bytes_original,
+            "bytes_optimizado": imagen.bytes_optimizado,
+            "expira": (imagen.fecha_subida + datetime.timedelta(minutes=GRACIA_MINUTOS)).isoformat() + "Z",
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ---------------------------
+# IMÁGENES HUÉRFANAS
+# ---------------------------
+# Recorren los buckets y la segunda borra en lote: solo con X-Admin-Token (ver admin.py)
+@router.get("/huerfanas", dependencies=[Depends(requiere_admin)])
+def reporte_huerfanas(session: Session = Depends(get_session)):
+    # Solo reporta (dry-run): no borra nada. Lee de la primaria: en una réplica atrasada
+    # las subidas recientes aparecerían como huérfanas
+    return recolectar_huerfanas(session, dry_run=True)
+
+
+@router.post("/huerfanas/recolectar", status_code=202, dependencies=[Depends(requiere_admin)])
+def recolectar(lote: int = 100, pausa: float = 1.0):
+    # El borrado puede tardar: se hace en segundo plano y se consulta en /metricas/tareas/{id}
+    tarea_id = tareas.cola.encolar(
+        "recolectar_huerfanas",
+        {"dry_run": False, "lote": lote, "pausa": pausa},
+        clave="recolector",
+        reemplazar=True,
+    )
+    return {"ok": True, "tarea_id": tarea_id}
+
 @router.get("/dashboard", response_class=HTMLResponse)
-def dashboard(request: Request, session: Session = Depends(get_session)):
+def dashboard(request: Request, session: Session = Depends(get_read_session)):
     total_items = session.exec(select(func.count(Item.id))).one()
     total_categorias = session.exec(select(func.count(Categoria.id))).one()
     total_ubicaciones = session.exec(select(func.count(Ubicacion.id))).one()
@@ -44,3 +88,31 @@ def dashboard(request: Request, session: Session = Depends(get_session)):
             "total_interacciones": total_interacciones
         }
     )
+
+
+# ---------------------------
+# MEJOR FORMATO SEGÚN ACCEPT
+# ---------------------------
+@router.get("/{imagen_id:int}")
+def imagen_negociada(imagen_id: int, request: Request, session: Session = Depends(get_read_session)):
+    imagen = session.get(Imagen, imagen_id)
+    if not imagen:
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    # Cada archivo tiene nombre único y no cambia: la redirección se puede cachear por Accept
+    return RedirectResponse(
+        url_negociada(imagen, request.headers.get("accept", "")),
+        status_code=307,
+        headers={"Vary": "Accept", "Cache-Control": "public, max-age=86400"},
+    )
+
+
+# ---------------------------
+# SERVIR ARCHIVOS DEL BACKEND LOCAL / MEMORIA
+# ---------------------------
+@router_media.get("/{bucket}/{ruta:path}")
+def servir_media(bucket: str, ruta: str):
+    contenido = get_storage_backend().leer(bucket, ruta)
+    if contenido is None:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    tipo = mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+    return Response(content=contenido, media_type=tipo)
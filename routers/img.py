@@ -0,0 +1,38 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from supa import proxy
+
+router = APIRouter(prefix="/img", tags=["Imágenes"])
+
+
+# ---------------------------
+# PLACEHOLDER GENERADO AQUÍ (reemplaza a via.placeholder.com)
+# ---------------------------
+@router.get("/vacio/{ancho:int}x{alto:int}")
+def imagen_vacia(ancho: int, alto: int):
+    if not (0 < ancho <= proxy.MAX_LADO_VACIO and 0 < alto <= proxy.MAX_LADO_VACIO):
+        raise HTTPException(status_code=404, detail="Tamaño no permitido")
+    return Response(
+        proxy.svg_vacio(ancho, alto),
+        media_type="image/svg+xml",
+        headers={"Cache-Control": proxy.CACHE_CONTROL},
+    )
+
+
+# ---------------------------
+# IMAGEN REDUCIDA DESDE LA CACHÉ EN DISCO
+# ---------------------------
+@router.get("/{imagen_id:int}/{ancho:int}")
+def imagen_reducida(imagen_id: int, ancho: int, request: Request):
+    if ancho not in proxy.ANCHOS:
+        raise HTTPException(status_code=404, detail=f"Ancho no permitido; usa uno de {proxy.ANCHOS}")
+    resultado = proxy.servir(imagen_id, ancho, "image/webp" in request.headers.get("accept", ""))
+    if resultado is None:
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    datos, content_type = resultado
+    return Response(
+        datos,
+        media_type=content_type,
+        headers={"Cache-Control": proxy.CACHE_CONTROL, "Vary": "Accept"},
+    )
@@ -1,15 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from sqlmodel import Session
-from db import get_session
+from db import get_session, get_read_session
 from schemas import InteraccionCreate, InteraccionRead, InteraccionUpdate
 import crud
 from supa.supabase import upload_to_bucket
+from ejecutor import en_hilo
+import tareas
+from indices import instantanea
+from supa import proxy
 from os import getenv
 from fastapi import Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
 templates = Jinja2Templates(directory="templates")
+proxy.registrar_plantillas(templates)
 
 router = APIRouter(prefix="/interacciones", tags=["Interacciones"])
 
@@ -23,21 +28,28 @@ async def create_interaccion(
     session: Session = Depends(get_session)
 ):
     imagen_url = None
+    pendiente = None
 
-    # ✔ Si viene imagen → subir al bucket
-    if imagen:
-        imagen_url = await upload_to_bucket(imagen, bucket=getenv("BUCKET_INTERACCIONES"))
+    # ✔ Si viene imagen → subir al bucket (o dejar en cola)
+    if imagen and imagen.filename:
+        imagen_url, pendiente = await tareas.preparar_imagen(imagen, getenv("BUCKET_INTERACCIONES"))
 
-    i = crud.create_interaccion(
+    i = await en_hilo(
+        crud.create_interaccion,
         session=session,
         descripcion=descripcion,
         imagen_url=imagen_url
     )
 
+    if pendiente:
+        tareas.encolar_imagen("interaccion", i.id, pendiente, getenv("BUCKET_INTERACCIONES"))
+
     return InteraccionRead(
         id=i.id,
         descripcion=i.descripcion,
-        imagen_url=i.imagen_url
+        imagen_url=i.imagen_url,
+        version=i.version,
+        imagen_pendiente=pendiente is not None
     )
 
 
@@ -45,36 +57,36 @@ async def create_interaccion(
 # LISTAR TODAS
 # ---------------------------
 @router.get("/", response_model=list[InteraccionRead])
-def list_interacciones(session: Session = Depends(get_session)):
+def list_interacciones(session: Session = Depends(get_read_session)):
     interacciones = crud.list_interacciones(session)
-    return [InteraccionRead(id=i.id, descripcion=i.descripcion, imagen_url=i.imagen_url) for i in interacciones]
+    return [InteraccionRead(id=i.id, descripcion=i.descripcion, imagen_url=i.imagen_url, version=i.version) for i in interacciones]
 
 # ---------------------------
 # LISTAR ELIMINADAS (SOFT DELETE)
 # ---------------------------
 @router.get("/eliminadas", response_model=list[InteraccionRead])
-def listar_interacciones_eliminadas(session: Session = Depends(get_session)):
+def listar_interacciones_eliminadas(session: Session = Depends(get_read_session)):
     interacciones = crud.listar_interacciones_eliminadas(session)
-    return [InteraccionRead(id=i.id, descripcion=i.descripcion, imagen_url=i.imagen_url) for i in interacciones]
+    return [InteraccionRead(id=i.id, descripcion=i.descripcion, imagen_url=i.imagen_url, version=i.version) for i in interacciones]
 
 # ---------------------------
 # OBTENER POR ID
 # ---------------------------
 @router.get("/id/{interaccion_id}", response_model=InteraccionRead)
-def get_interaccion(interaccion_id: int, session: Session = Depends(get_session)):
+def get_interaccion(interaccion_id: int, session: Session = Depends(get_read_session)):
     i = crud.get_interaccion(session, interaccion_id)
     if not i:
         raise HTTPException(status_code=404, detail="Interacción no encontrada")
-    return InteraccionRead(id=i.id, descripcion=i.descripcion, imagen_url=i.imagen_url)
+    return InteraccionRead(id=i.id, descripcion=i.descripcion, imagen_url=i.imagen_url, version=i.version)
 """
 # ---------------------------
 # LISTAR TODAS
 # ---------------------------
 @router.get("/", response_class=HTMLResponse)
-def list_interacciones(request: Request, session: Session = Depends(get_session)):
-    interacciones = crud.list_interacciones(session)
+def list_interacciones(request: Request, session: Session = Depends(get_read_session)):
+    interacciones = instantanea.leer(crud.list_interacciones, session)
     interacciones_data = [
-        {"id": i.id, "descripcion": i.descripcion, "imagen_url": i.imagen_url}
+        {"id": i.id, "descripcion": i.descripcion, "imagen_url": i.imagen_url, "version": i.version}
         for i in interacciones
     ]
     return templates.TemplateResponse("interacciones/interacciones.html", {"request": request, "interacciones": interacciones_data})
@@ -83,10 +95,10 @@ def list_interacciones(request: Request, session: Session = Depends(get_session)
 # LISTAR ELIMINADAS (SOFT DELETE)
 # ---------------------------
 @router.get("/eliminadas", response_class=HTMLResponse)
-def listar_interacciones_eliminadas(request: Request, session: Session = Depends(get_session)):
+def listar_interacciones_eliminadas(request: Request, session: Session = Depends(get_read_session)):
     interacciones = crud.listar_interacciones_eliminadas(session)
     interacciones_data = [
-        {"id": i.id, "descripcion": i.descripcion, "imagen_url": i.imagen_url}
+        {"id": i.id, "descripcion": i.descripcion, "imagen_url": i.imagen_url, "version": i.version}
         for i in interacciones
     ]
     return templates.TemplateResponse("interacciones/interacciones_eliminados.html", {"request": request, "interacciones": interacciones_data})
@@ -95,12 +107,12 @@ def listar_interacciones_eliminadas(request: Request, session: Session = Depends
 # OBTENER POR ID
 # ---------------------------
 @router.get("/id/{interaccion_id}", response_class=HTMLResponse)
-def get_interaccion(interaccion_id: int, request: Request, session: Session = Depends(get_session)):
-    i = crud.get_interaccion(session, interaccion_id)
+def get_interaccion(interaccion_id: int, request: Request, session: Session = Depends(get_read_session)):
+    i = instantanea.leer(crud.get_interaccion, session, interaccion_id)
     if not i:
         return HTMLResponse(content="<h1>Interacción no encontrada</h1>", status_code=404)
 
-    interaccion_data = {"id": i.id, "descripcion": i.descripcion, "imagen_url": i.imagen_url}
+    interaccion_data = {"id": i.id, "descripcion": i.descripcion, "imagen_url": i.imagen_url, "version": i.version}
     return templates.TemplateResponse("interacciones/interacciones_detalles.html", {"request": request, "interaccion": interaccion_data})
 
 # ---------------------------
@@ -111,32 +123,42 @@ async def update_interaccion(
     interaccion_id: int,
     descripcion: str = Form(None),
     imagen: UploadFile | None = File(None),
+    version: int | None = Form(None),  # versión que vio el cliente (409 si cambió)
     session: Session = Depends(get_session)
 ):
     imagen_url = None
+    pendiente = None
 
     if imagen is not None:
         if imagen.filename == "":
             # ✔ Borrar imagen
             imagen_url = ""
+            tareas.cola.cancelar(f"interaccion:{interaccion_id}")
         else:
-            # ✔ Subir nueva
-            imagen_url = await upload_to_bucket(imagen, bucket=getenv("BUCKET_INTERACCIONES"))
+            # ✔ Subir nueva (o dejar en cola)
+            imagen_url, pendiente = await tareas.preparar_imagen(imagen, getenv("BUCKET_INTERACCIONES"))
 
-    i = crud.update_interaccion(
+    i = await en_hilo(
+        crud.update_interaccion,
         session=session,
         interaccion_id=interaccion_id,
         descripcion=descripcion,
-        imagen_url=imagen_url
+        imagen_url=imagen_url,
+        version=version
     )
 
     if not i:
         raise HTTPException(status_code=404, detail="Interacción no encontrada")
 
+    if pendiente:
+        tareas.encolar_imagen("interaccion", i.id, pendiente, getenv("BUCKET_INTERACCIONES"))
+
     return InteraccionRead(
         id=i.id,
         descripcion=i.descripcion,
-        imagen_url=i.imagen_url
+        imagen_url=i.imagen_url,
+        version=i.version,
+        imagen_pendiente=tareas.imagen_pendiente("interaccion", i.id)
     )
 
 # ---------------------------
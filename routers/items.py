@@ -1,20 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
 from sqlmodel import Session
-from db import get_session
+from db import get_session, get_read_session
 from schemas import ItemCreate, ItemRead, ItemUpdate, ItemReadFull
 import crud
-from typing import Optional, List
+from typing import Annotated, Optional, List
 from supa.supabase import upload_to_bucket
+from ejecutor import en_hilo
+import tareas
+from indices import instantanea
+from supa import proxy
+from indices.grafo import grafo, TIPOS
 from os import getenv
-from pydantic import BaseModel, Field
-from fastapi.responses import HTMLResponse
+from pydantic import BaseModel, BeforeValidator, Field
+from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
+from urllib.parse import urlencode
 from fastapi.templating import Jinja2Templates
 from fastapi import Request
 
 templates = Jinja2Templates(directory="templates")
+proxy.registrar_plantillas(templates)
 
 router = APIRouter(prefix="/items", tags=["Items"])
 
+# Ítems por página en la búsqueda
+POR_PAGINA = 30
+
+# El formulario de búsqueda manda "" en los campos vacíos: cuenta como no indicado.
+# Cualquier otro valor que no sea un entero es un 422, no un 500
+EnteroOpcional = Annotated[Optional[int], BeforeValidator(lambda v: None if v == "" else v), Query()]
+
 # ---------------------------
 # CREATE
 # ---------------------------
@@ -32,10 +47,11 @@ async def crear_item(
 ):
 
     imagen_url = None
+    pendiente = None
 
-    # Subir imagen si viene
-    if imagen:
-        imagen_url = await upload_to_bucket(imagen, bucket=getenv("BUCKET_ITEMS"))
+    # Subir (o dejar en cola) la imagen si viene
+    if imagen and imagen.filename:
+        imagen_url, pendiente = await tareas.preparar_imagen(imagen, getenv("BUCKET_ITEMS"))
 
     # Crear DTO para crud
     data = ItemCreate(
@@ -48,19 +64,23 @@ async def crear_item(
         interaccion_ids=interaccion_ids
     )
 
-    item = crud.crear_item(session, data, imagen_url)
+    item = await en_hilo(crud.crear_item, session, data, imagen_url)
 
     if not item:
         raise HTTPException(status_code=400, detail="Error al crear el ítem")
 
-    return item
+    if pendiente:
+        tareas.encolar_imagen("item", item.id, pendiente, getenv("BUCKET_ITEMS"))
+
+    enlaces = await en_hilo(crud.ids_enlaces, session, item.id)
+    return ItemRead(**item.model_dump(), **enlaces, imagen_pendiente=pendiente is not None)
 
 """
 # ---------------------------
 # READ ALL
 # ---------------------------
 @router.get("/", response_model=List[ItemRead])
-def listar_items(session: Session = Depends(get_session)):
+def listar_items(session: Session = Depends(get_read_session)):
     return crud.listar_items(session)
 
 
@@ -69,15 +89,15 @@ def listar_items(session: Session = Depends(get_session)):
 # 🔹 Debe ir antes de cualquier ruta con {item_id}
 # ---------------------------
 @router.get("/estado/eliminados", response_model=List[ItemRead])
-def listar_items_eliminados(session: Session = Depends(get_session)):
+def listar_items_eliminados(session: Session = Depends(get_read_session)):
     return crud.listar_items_eliminados(session)
 """
 # ---------------------------
 # LISTAR TODOS LOS ITEMS
 # ---------------------------
 @router.get("/", response_class=HTMLResponse)
-def listar_items(request: Request, session: Session = Depends(get_session)):
-    items = crud.listar_items(session)
+def listar_items(request: Request, session: Session = Depends(get_read_session)):
+    items = instantanea.leer(crud.listar_items, session)
     return templates.TemplateResponse("items/items.html", {
         "request": request,
         "items": items
@@ -88,7 +108,7 @@ def listar_items(request: Request, session: Session = Depends(get_session)):
 # 🔹 Debe ir antes de cualquier ruta con {item_id}
 # ---------------------------
 @router.get("/estado/eliminados", response_class=HTMLResponse)
-def listar_items_eliminados(request: Request, session: Session = Depends(get_session)):
+def listar_items_eliminados(request: Request, session: Session = Depends(get_read_session)):
     items = crud.listar_items_eliminados(session)
     return templates.TemplateResponse("items/items_eliminados.html", {
         "request": request,
@@ -104,7 +124,7 @@ def buscar_items(
     ubicacion_id: Optional[int] = Query(default=None),
     indispensable: Optional[bool] = Query(default=None),
     nombre: Optional[str] = Query(default=None),
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_read_session)
 ):
     return crud.buscar_items(
         session,
@@ -119,16 +139,19 @@ def buscar_items(
 @router.get("/search", response_class=HTMLResponse)
 def buscar_items_html(
         request: Request,
-        categoria_id: Optional[str] = Query(default=None),
-        ubicacion_id: Optional[str] = Query(default=None),
+        categoria_id: EnteroOpcional = None,
+        ubicacion_id: EnteroOpcional = None,
+        interaccion_id: EnteroOpcional = None,
         indispensable: Optional[str] = Query(default=None),
         nombre: Optional[str] = Query(default=None),
-        session: Session = Depends(get_session)
+        costo_min: EnteroOpcional = None,
+        costo_max: EnteroOpcional = None,
+        orden: str = Query(default="id", pattern=r"^-?(id|costo|nombre)$"),
+        pagina: int = Query(default=1, ge=1),
+        por_pagina: int = Query(default=POR_PAGINA, ge=1, le=200),
+        formato: str = Query(default="html", pattern=r"^(html|json)$"),
+        session: Session = Depends(get_read_session)
 ):
-    # Convertir strings vacíos a tipos correctos
-    categoria_id_int = int(categoria_id) if categoria_id else None
-    ubicacion_id_int = int(ubicacion_id) if ubicacion_id else None
-
     if indispensable == "true":
         indispensable_bool = True
     elif indispensable == "false":
@@ -136,50 +159,130 @@ def buscar_items_html(
     else:
         indispensable_bool = None
 
-    items = crud.buscar_items(
-        session,
-        ubicacion_id=ubicacion_id_int,
+    filtros = dict(
+        categoria_id=categoria_id,
+        ubicacion_id=ubicacion_id,
+        interaccion_id=interaccion_id,
         indispensable=indispensable_bool,
         nombre=nombre,
+        costo_min=costo_min,
+        costo_max=costo_max,
     )
-
-    # Filtrado por categoría si se indicó
-    if categoria_id_int is not None:
-        items = [
-            it for it in items
-            if any(c.id == categoria_id_int for c in getattr(it, "categorias", []))
-        ]
+    items = crud.buscar_items(session, **filtros, orden=orden, limite=por_pagina, offset=(pagina - 1) * por_pagina)
+    total = crud.contar_items(session, **filtros)
+    facetas = crud.facetas_items(session, **filtros)
+
+    # Cada valor de faceta lleva el enlace que lo activa (o lo quita si ya está activo);
+    # cambiar un filtro vuelve a la primera página
+    parametros = {
+        clave: None if valor is None else str(valor)
+        for clave, valor in filtros.items() if clave != "indispensable"
+    }
+    parametros.update({
+        "indispensable": indispensable,
+        "orden": orden if orden != "id" else None,
+        "por_pagina": por_pagina if por_pagina != POR_PAGINA else None,
+        "formato": formato if formato != "html" else None,
+    })
+    for faceta, valores in facetas.items():
+        parametro = "indispensable" if faceta == "indispensable" else f"{faceta}_id"
+        for v in valores:
+            valor = str(v["id"]).lower()
+            v["activo"] = parametros[parametro] == valor
+            query = {k: val for k, val in parametros.items() if val}
+            if v["activo"]:
+                query.pop(parametro, None)
+            else:
+                query[parametro] = valor
+            v["url"] = "/items/search?" + urlencode(query)
+
+    paginas = max(1, -(-total // por_pagina))
+    query = {k: v for k, v in parametros.items() if v}
+    paginacion = {
+        "pagina": pagina,
+        "paginas": paginas,
+        "por_pagina": por_pagina,
+        "total": total,
+        "anterior": "/items/search?" + urlencode({**query, "pagina": pagina - 1}) if pagina > 1 else None,
+        "siguiente": "/items/search?" + urlencode({**query, "pagina": pagina + 1}) if pagina < paginas else None,
+    }
+
+    # ?formato=json para clientes que no son el navegador; por defecto, la página de siempre
+    if formato == "json":
+        return JSONResponse({"items": jsonable_encoder(items), "facetas": facetas, "paginacion": paginacion})
 
     return templates.TemplateResponse(
         "items/items.html",
         {
             "request": request,
             "items": items,
+            "facetas": facetas,
+            "paginacion": paginacion,
             "categoria_id": categoria_id,
             "ubicacion_id": ubicacion_id,
-            "indispensable": indispensable,
-            "nombre": nombre
+            "interaccion_id": interaccion_id,
+            "indispensable": indispensable_bool,
+            "nombre": nombre,
+            "costo_min": costo_min,
+            "costo_max": costo_max,
+            "orden": orden
         }
     )
 
+# ---------------------------
+# GRAFO DE RELACIONES (índice en memoria)
+# 🔹 Debe ir antes de cualquier ruta con {item_id}
+# ---------------------------
+@router.get("/grafo/coocurrencias")
+def coocurrencias(
+    tipo: str = Query(..., description="categoria | ubicacion | interaccion"),
+    id: int = Query(...),
+    con: str = Query(..., description="tipo de los nodos a contar"),
+    limite: int = Query(default=10, le=100),
+):
+    if tipo not in TIPOS or con not in TIPOS:
+        raise HTTPException(status_code=400, detail=f"tipo y con deben ser uno de {', '.join(TIPOS)}")
+    return grafo.coocurrencias(tipo, id, con, limite)
+
+
+@router.get("/{item_id}/relacionados")
+def items_relacionados(
+    item_id: int,
+    tipos: str = Query(default="ubicacion,interaccion", description="tipos de vínculo separados por coma"),
+    limite: int = Query(default=6, le=50),
+):
+    tipos_validos = tuple(t for t in tipos.split(",") if t in TIPOS)
+    if not tipos_validos:
+        raise HTTPException(status_code=400, detail=f"tipos debe incluir alguno de {', '.join(TIPOS)}")
+    return grafo.relacionados(item_id, tipos_validos, limite)
+
+
+@router.get("/{item_id}/camino/{destino_id}")
+def camino_entre_items(item_id: int, destino_id: int, max_saltos: int = Query(default=8, le=20)):
+    camino = grafo.camino(item_id, destino_id, max_saltos)
+    if camino is None:
+        raise HTTPException(status_code=404, detail="Los ítems no están conectados")
+    return camino
+
 # ---------------------------
 # READ ONE (DETALLADO)
 # ---------------------------
 @router.get("/{item_id}/detalles", response_class=HTMLResponse)
-def obtener_item_detallado_html(item_id: int, request: Request, session: Session = Depends(get_session)):
-    item = crud.get_item_detallado(session, item_id)
+def obtener_item_detallado_html(item_id: int, request: Request, session: Session = Depends(get_read_session)):
+    item = instantanea.leer(crud.get_item_detallado, session, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Ítem no encontrado")
 
     print(item)
     return templates.TemplateResponse("items/items_detalles.html", {
         "request": request,
-        "item": item
+        "item": item,
+        "relacionados": grafo.relacionados(item_id)
     })
 """
 
 @router.get("/{item_id}/detalles")
-def obtener_item_json(item_id: int, session: Session = Depends(get_session)):
+def obtener_item_json(item_id: int, session: Session = Depends(get_read_session)):
     item = crud.get_item_detallado(session, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Ítem no encontrado")
@@ -201,7 +304,7 @@ def restaurar_item(item_id: int, session: Session = Depends(get_session)):
 # READ ONE
 # ---------------------------
 @router.get("/{item_id}", response_model=ItemRead)
-def obtener_item(item_id: int, session: Session = Depends(get_session)):
+def obtener_item(item_id: int, session: Session = Depends(get_read_session)):
     item = crud.get_item(session, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Ítem no encontrado")
@@ -212,13 +315,14 @@ def obtener_item(item_id: int, session: Session = Depends(get_session)):
 # OBTENER ITEM POR ID
 # ---------------------------
 @router.get("/{item_id}", response_class=HTMLResponse)
-def obtener_item(request: Request, item_id: int, session: Session = Depends(get_session)):
-    item = crud.get_item(session, item_id)
+def obtener_item(request: Request, item_id: int, session: Session = Depends(get_read_session)):
+    item = instantanea.leer(crud.get_item, session, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Ítem no encontrado")
     return templates.TemplateResponse("items/items_detalles.html", {
         "request": request,
-        "item": item
+        "item": item,
+        "relacionados": grafo.relacionados(item_id)
     })
 
 # ---------------------------
@@ -235,19 +339,22 @@ async def actualizar_item(
     ubicacion_ids: list[int] | None = Form(None),
     interaccion_ids: list[int] | None = Form(None),
     imagen: UploadFile | None = File(None),
+    version: int | None = Form(None),  # versión que vio el cliente (409 si cambió)
     session: Session = Depends(get_session)
 ):
 
     imagen_url = None
+    pendiente = None
 
     if imagen is not None:
-        # Caso 1: limpiar imagen
+        # Caso 1: limpiar imagen (y descartar la que se estuviera procesando)
         if imagen.filename == "":
             imagen_url = ""
+            tareas.cola.cancelar(f"item:{item_id}")
 
         # Caso 2: se sube imagen nueva
         elif imagen.file:
-            imagen_url = await upload_to_bucket(imagen, bucket=getenv("BUCKET_ITEMS"))
+            imagen_url, pendiente = await tareas.preparar_imagen(imagen, getenv("BUCKET_ITEMS"))
 
         # Caso 3: valor extraño
         else:
@@ -264,12 +371,16 @@ async def actualizar_item(
         interaccion_ids=interaccion_ids
     )
 
-    item = crud.update_item(session, item_id, data, imagen_url)
+    item = await en_hilo(crud.update_item, session, item_id, data, imagen_url, version)
 
     if not item:
         raise HTTPException(status_code=404, detail="Ítem no encontrado")
 
-    return item
+    if pendiente:
+        tareas.encolar_imagen("item", item.id, pendiente, getenv("BUCKET_ITEMS"))
+
+    enlaces = await en_hilo(crud.ids_enlaces, session, item.id)
+    return ItemRead(**item.model_dump(), **enlaces, imagen_pendiente=tareas.imagen_pendiente("item", item.id))
 
 
 
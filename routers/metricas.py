@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException
+
+import admision
+import ejecutor
+import tareas
+from cache import cache
+from difusion import difusor
+from indices.instantanea import lector
+from respuestas import almacen
+from supa.proxy import cache_disco
+
+router = APIRouter(prefix="/metricas", tags=["Métricas"])
+
+
+# ---------------------------
+# MÉTRICAS DE LOS POOLS DE HILOS
+# ---------------------------
+@router.get("/")
+def ver_metricas():
+    return {
+        "ejecutores": ejecutor.metricas(),
+        "tareas": tareas.cola.metricas(),
+        "vivo": {"conexiones": difusor.conexiones},
+        "cache": cache.metricas(),
+        "instantanea": lector.metricas(),
+        "respuestas": almacen.metricas(),
+        "admision": admision.metricas(),
+        "img": cache_disco.metricas(),
+    }
+
+
+# ---------------------------
+# ESTADO DE UNA TAREA EN SEGUNDO PLANO
+# ---------------------------
+@router.get("/tareas/{tarea_id}")
+def ver_tarea(tarea_id: int):
+    tarea = tareas.cola.estado(tarea_id)
+    if not tarea:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    return tarea
@@ -1,15 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from sqlmodel import Session
-from db import get_session
+from db import get_session, get_read_session
 from schemas import UbicacionCreate, UbicacionRead
 import crud
 from supa.supabase import upload_to_bucket
+from ejecutor import en_hilo
+import tareas
+from indices import instantanea
+from supa import proxy
 from os import getenv
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from starlette.requests import Request
 
 templates = Jinja2Templates(directory="templates")
+proxy.registrar_plantillas(templates)
 
 router = APIRouter(prefix="/ubicaciones", tags=["Ubicaciones"])
 
@@ -22,27 +27,30 @@ async def create_ubicacion(
     tipo: str | None = Form(None),
     descripcion: str | None = Form(None),
     imagen: UploadFile | None = File(None),
+    version: int | None = Form(None),  # versión que vio el cliente (409 si cambió)
     session: Session = Depends(get_session)
 ):
     imagen_url = None
+    pendiente = None
 
-    # Subir imagen si viene
-    if imagen:
-        imagen_url = await upload_to_bucket(imagen, bucket=getenv("BUCKET_UBICACIONES"))
+    # Subir (o dejar en cola) la imagen si viene
+    if imagen and imagen.filename:
+        imagen_url, pendiente = await tareas.preparar_imagen(imagen, getenv("BUCKET_UBICACIONES"))
 
-    u = crud.create_ubicacion(session, nombre, tipo, descripcion)
-    u.imagen_url = imagen_url  # guardarla en el modelo
+    # crud guarda también la imagen: un solo commit, fuera del event loop
+    u = await en_hilo(crud.create_ubicacion, session, nombre, tipo, descripcion, imagen_url)
 
-    session.add(u)
-    session.commit()
-    session.refresh(u)
+    if pendiente:
+        tareas.encolar_imagen("ubicacion", u.id, pendiente, getenv("BUCKET_UBICACIONES"))
 
     return UbicacionRead(
         id=u.id,
         nombre=u.nombre,
         tipo=u.tipo,
         descripcion=u.descripcion,
-        imagen_url=u.imagen_url
+        imagen_url=u.imagen_url,
+        version=u.version,
+        imagen_pendiente=pendiente is not None
     )
 
 """
@@ -50,10 +58,10 @@ async def create_ubicacion(
 # LISTAR TODAS
 # ---------------------------
 @router.get("/", response_model=list[UbicacionRead])
-def list_ubicaciones(session: Session = Depends(get_session)):
+def list_ubicaciones(session: Session = Depends(get_read_session)):
     ubicaciones = crud.list_ubicaciones(session)
     return [
-        UbicacionRead(id=u.id, nombre=u.nombre, tipo=u.tipo, descripcion=u.descripcion, imagen_url=u.imagen_url)
+        UbicacionRead(id=u.id, nombre=u.nombre, tipo=u.tipo, descripcion=u.descripcion, imagen_url=u.imagen_url, version=u.version)
         for u in ubicaciones
     ]
 """
@@ -62,8 +70,8 @@ def list_ubicaciones(session: Session = Depends(get_session)):
 # LISTAR UBICACIONES (HTML)
 # ---------------------------
 @router.get("/")
-def list_ubicaciones(request: Request, session: Session = Depends(get_session)):
-    ubicaciones = crud.list_ubicaciones(session)
+def list_ubicaciones(request: Request, session: Session = Depends(get_read_session)):
+    ubicaciones = instantanea.leer(crud.list_ubicaciones, session)
     return templates.TemplateResponse(
         "ubicaciones/ubicaciones.html",
         {
@@ -76,10 +84,10 @@ def list_ubicaciones(request: Request, session: Session = Depends(get_session)):
 # LISTAR ELIMINADAS (SOFT DELETE)
 # ---------------------------
 @router.get("/eliminadas", response_model=list[UbicacionRead])
-def listar_ubicaciones_eliminadas(session: Session = Depends(get_session)):
+def listar_ubicaciones_eliminadas(session: Session = Depends(get_read_session)):
     ubicaciones = crud.listar_ubicaciones_eliminadas(session)
     return [
-        UbicacionRead(id=u.id, nombre=u.nombre, tipo=u.tipo, descripcion=u.descripcion, imagen_url=u.imagen_url)
+        UbicacionRead(id=u.id, nombre=u.nombre, tipo=u.tipo, descripcion=u.descripcion, imagen_url=u.imagen_url, version=u.version)
         for u in ubicaciones
     ]
 """
@@ -87,7 +95,7 @@ def listar_ubicaciones_eliminadas(session: Session = Depends(get_session)):
 # LISTAR ELIMINADAS (SOFT DELETE)
 # ---------------------------
 @router.get("/eliminadas")
-def listar_ubicaciones_eliminadas(request: Request, session: Session = Depends(get_session)):
+def listar_ubicaciones_eliminadas(request: Request, session: Session = Depends(get_read_session)):
     ubicaciones = crud.listar_ubicaciones_eliminadas(session)
 
     # Si la petición acepta HTML, renderiza plantilla
@@ -99,7 +107,7 @@ def listar_ubicaciones_eliminadas(request: Request, session: Session = Depends(g
 
     # Si no, devuelve JSON
     return [
-        UbicacionRead(id=u.id, nombre=u.nombre, tipo=u.tipo, descripcion=u.descripcion, imagen_url=u.imagen_url)
+        UbicacionRead(id=u.id, nombre=u.nombre, tipo=u.tipo, descripcion=u.descripcion, imagen_url=u.imagen_url, version=u.version)
         for u in ubicaciones
     ]
 
@@ -109,18 +117,18 @@ def listar_ubicaciones_eliminadas(request: Request, session: Session = Depends(g
 # OBTENER POR ID
 # ---------------------------
 @router.get("/id/{ubicacion_id}", response_model=UbicacionRead)
-def get_ubicacion(ubicacion_id: int, session: Session = Depends(get_session)):
+def get_ubicacion(ubicacion_id: int, session: Session = Depends(get_read_session)):
     u = crud.get_ubicacion(session, ubicacion_id)
     if not u:
         raise HTTPException(status_code=404, detail="Ubicación no encontrada")
-    return UbicacionRead(id=u.id, nombre=u.nombre, tipo=u.tipo, descripcion=u.descripcion, imagen_url=u.imagen_url)
+    return UbicacionRead(id=u.id, nombre=u.nombre, tipo=u.tipo, descripcion=u.descripcion, imagen_url=u.imagen_url, version=u.version)
 """
 # ---------------------------
 # OBTENER POR ID
 # ---------------------------
 @router.get("/id/{ubicacion_id}")
-def get_ubicacion(ubicacion_id: int, request: Request, session: Session = Depends(get_session)):
-    u = crud.get_ubicacion(session, ubicacion_id)
+def get_ubicacion(ubicacion_id: int, request: Request, session: Session = Depends(get_read_session)):
+    u = instantanea.leer(crud.get_ubicacion, session, ubicacion_id)
     if not u:
         raise HTTPException(status_code=404, detail="Ubicación no encontrada")
 
@@ -132,7 +140,7 @@ def get_ubicacion(ubicacion_id: int, request: Request, session: Session = Depend
         )
 
     # Si no, devuelve JSON
-    return UbicacionRead(id=u.id, nombre=u.nombre, tipo=u.tipo, descripcion=u.descripcion, imagen_url=u.imagen_url)
+    return UbicacionRead(id=u.id, nombre=u.nombre, tipo=u.tipo, descripcion=u.descripcion, imagen_url=u.imagen_url, version=u.version)
 
 
 # ---------------------------
@@ -145,41 +153,51 @@ async def update_ubicacion(
     tipo: str | None = Form(None),
     descripcion: str | None = Form(None),
     imagen: UploadFile | None = File(None),
+    version: int | None = Form(None),  # versión que vio el cliente (409 si cambió)
     session: Session = Depends(get_session)
 ):
     imagen_url = None
+    pendiente = None
 
     if imagen is not None:
         # Caso 1: campo enviado vacío → borrar imagen
         if imagen.filename == "":
             imagen_url = ""
+            tareas.cola.cancelar(f"ubicacion:{ubicacion_id}")
 
-        # Caso 2: archivo subido → subir al bucket
+        # Caso 2: archivo subido → subir al bucket (o dejar en cola)
         elif imagen.file:
-            imagen_url = await upload_to_bucket(imagen, bucket=getenv("BUCKET_UBICACIONES"))
+            imagen_url, pendiente = await tareas.preparar_imagen(imagen, getenv("BUCKET_UBICACIONES"))
 
         # Caso 3: algo raro → no tocar
         else:
             imagen_url = None
 
-    u = crud.update_ubicacion(
+    u = await en_hilo(
+        crud.update_ubicacion,
         session,
         ubicacion_id,
         nombre,
         tipo,
         descripcion,
-        imagen_url  # ✔ enviar control total al crud
+        imagen_url,  # ✔ enviar control total al crud
+        version
     )
 
     if not u:
         raise HTTPException(status_code=404, detail="Ubicación no encontrada")
 
+    if pendiente:
+        tareas.encolar_imagen("ubicacion", u.id, pendiente, getenv("BUCKET_UBICACIONES"))
+
     return UbicacionRead(
         id=u.id,
         nombre=u.nombre,
         tipo=u.tipo,
         descripcion=u.descripcion,
-        imagen_url=u.imagen_url
+        imagen_url=u.imagen_url,
+        version=u.version,
+        imagen_pendiente=tareas.imagen_pendiente("ubicacion", u.id)
     )
 
 # ---------------------------
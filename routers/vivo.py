@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+import crud
+from db import engine
+from difusion import difusor, mensaje_sse
+from ejecutor import en_hilo
+
+router = APIRouter(prefix="/vivo", tags=["En vivo"])
+
+ENTIDADES = ("item", "categoria", "ubicacion", "interaccion")
+
+# Cada cuánto mandar un comentario para que proxies y navegador no cierren la conexión
+LATIDO_SEGUNDOS = 15
+
+# Máximo de cambios a reenviar al reconectar; si faltan más, conviene recargar la página
+MAX_REENVIO = 1000
+
+
+def _pendientes(desde: int) -> list:
+    with Session(engine) as session:
+        return crud.listar_cambios(session, desde, MAX_REENVIO + 1)
+
+
+async def flujo(request: Request, entidades: set[str], ultimo: int | None):
+    # Conectarse antes de leer lo pendiente, para no perder lo que llegue en el medio
+    cola = difusor.conectar()
+    try:
+        yield "retry: 3000\n\n"
+
+        if ultimo is not None:
+            cambios = await en_hilo(_pendientes, ultimo)
+            if len(cambios) > MAX_REENVIO:
+                yield "event: recargar\ndata: {}\n\n"
+                return
+            for c in cambios:
+                ultimo = c.id
+                if c.entidad in entidades:
+                    yield mensaje_sse(c.id, c.entidad, c.accion, c.entidad_id, json.loads(c.datos))
+
+        while not await request.is_disconnected():
+            try:
+                evento = await asyncio.wait_for(cola.get(), LATIDO_SEGUNDOS)
+            except asyncio.TimeoutError:
+                yield ": latido\n\n"
+                continue
+            if evento is None:
+                return  # el difusor cortó la conexión (atrasada o apagado)
+            if evento.entidad not in entidades:
+                continue
+            if ultimo is not None and evento.cursor is not None and evento.cursor <= ultimo:
+                continue  # ya se envió en el reenvío
+            yield mensaje_sse(evento.cursor, evento.entidad, evento.accion, evento.id, evento.datos)
+    finally:
+        difusor.desconectar(cola)
+
+
+# ---------------------------
+# CAMBIOS EN VIVO (Server-Sent Events)
+# ---------------------------
+@router.get("/")
+async def cambios_en_vivo(
+    request: Request,
+    entidades: str = Query(default=",".join(ENTIDADES), description="entidades separadas por coma"),
+    last_event_id: int | None = Header(default=None),
+):
+    """
+    Un evento `cambio` por cada escritura: {"entidad", "accion", "id", "datos"}.
+    El `id` del evento es el cursor del feed de cambios; al reconectar, el navegador
+    lo manda en Last-Event-ID y se reenvía lo que se perdió.
+    """
+    elegidas = {e for e in entidades.split(",") if e in ENTIDADES}
+    return StreamingResponse(
+        flujo(request, elegidas, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
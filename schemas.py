@@ -14,6 +14,8 @@ class CategoriaCreate(CategoriaBase):
 
 class CategoriaRead(CategoriaBase):
     id: int
+    version: int = 1  # enviar de vuelta al actualizar (409 si otro la cambió antes)
+    imagen_pendiente: bool = False  # la imagen se está procesando en segundo plano
 
 class CategoriaUpdate(SQLModel):
     nombre: Optional[str] = None
@@ -35,6 +37,8 @@ class UbicacionCreate(UbicacionBase):
 
 class UbicacionRead(UbicacionBase):
     id: int
+    version: int = 1
+    imagen_pendiente: bool = False
 
 
 # ==============================
@@ -46,8 +50,10 @@ class InteraccionCreate(SQLModel):
 
 class InteraccionRead(SQLModel):
     id: int
+    version: int = 1
     descripcion: str
     imagen_url: Optional[str] = None  # ← agregado
+    imagen_pendiente: bool = False
 
 class InteraccionUpdate(SQLModel):
     descripcion: Optional[str] = None
@@ -71,9 +77,11 @@ class ItemCreate(ItemBase):
 
 class ItemRead(ItemBase):
     id: int
+    version: int = 1
     categoria_ids: List[int] = Field(default_factory=list)
     ubicacion_ids: List[int] = Field(default_factory=list)
     interaccion_ids: List[int] = Field(default_factory=list)
+    imagen_pendiente: bool = False
 
 class ItemUpdate(SQLModel):
     nombre: Optional[str] = None
@@ -95,6 +103,7 @@ if TYPE_CHECKING:
 
 class ItemReadFull(ItemBase):
     id: int
+    version: int = 1
     categorias: List["CategoriaRead"] = []
     ubicaciones: List["UbicacionRead"] = []
     interacciones: List["InteraccionRead"] = []
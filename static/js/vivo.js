@@ -0,0 +1,75 @@
+// Cambios en vivo: escucha /vivo/ (Server-Sent Events) y actualiza las cards de la lista sin recargar.
+//
+// Marcado que espera en las plantillas:
+//   - la lista:  data-vivo="item|categoria|ubicacion|interaccion"
+//                (y data-vivo-modo="eliminados" en las páginas de eliminados)
+//   - cada card: data-id y data-json con los datos que usan los botones
+//   - los campos que se pueden refrescar: data-campo="nombre" (data-vacio="texto si está vacío",
+//     data-formato="sino" para booleanos; en <img>, data-vacio es la imagen por defecto)
+(function () {
+    const lista = document.querySelector("[data-vivo]");
+
+    function datos(el) {
+        return JSON.parse(el.closest("[data-id]").dataset.json || "{}");
+    }
+
+    function formatear(el, valor) {
+        if (el.dataset.formato === "sino") return valor ? "Sí" : "No";
+        if (valor === null || valor === undefined || valor === "") return el.dataset.vacio || "";
+        return valor;
+    }
+
+    function avisar() {
+        if (document.getElementById("vivo-aviso")) return;
+        const aviso = document.createElement("div");
+        aviso.id = "vivo-aviso";
+        aviso.className = "alert alert-info d-flex justify-content-between align-items-center";
+        aviso.innerHTML = 'Hay cambios nuevos en esta lista. <a href="" class="btn btn-sm btn-outline-primary">Recargar</a>';
+        lista.before(aviso);
+    }
+
+    function aplicar(accion, id, nuevos) {
+        if (!lista) return;
+        const card = lista.querySelector(`[data-id="${id}"]`);
+        const eliminados = lista.dataset.vivoModo === "eliminados";
+        const sale = eliminados ? accion === "restaurar" : accion === "eliminar";
+        const entra = eliminados ? accion === "eliminar" : accion === "crear" || accion === "restaurar";
+
+        if (sale) {
+            if (card) card.remove();
+            return;
+        }
+        if (entra) {
+            // La card nueva la dibuja el servidor (orden, paginación, filtros)
+            if (!card) avisar();
+            return;
+        }
+        if (!card || !nuevos) return;
+
+        card.dataset.json = JSON.stringify(Object.assign(datos(card), nuevos));
+        card.querySelectorAll("[data-campo]").forEach((el) => {
+            const campo = el.dataset.campo;
+            if (!(campo in nuevos)) return;
+            if (el.tagName === "IMG") {
+                el.src = nuevos[campo] || el.dataset.vacio;
+            } else {
+                el.textContent = formatear(el, nuevos[campo]);
+            }
+        });
+    }
+
+    window.Vivo = { aplicar, datos };
+
+    if (!lista || !window.EventSource) return;
+
+    // EventSource reconecta solo y manda Last-Event-ID: el servidor reenvía lo que se perdió
+    const fuente = new EventSource("/vivo/?entidades=" + lista.dataset.vivo);
+    fuente.addEventListener("cambio", (e) => {
+        const cambio = JSON.parse(e.data);
+        aplicar(cambio.accion, cambio.id, cambio.datos);
+    });
+    fuente.addEventListener("recargar", () => {
+        fuente.close();
+        avisar();
+    });
+})();
@@ -0,0 +1,274 @@
+"""
+Validación de imágenes subidas, mientras llegan.
+
+Antes solo se miraba el content_type que manda el cliente (y solo en /imagenes/upload):
+un archivo enorme o que no es una imagen se leía entero en memoria y se mandaba al
+storage. Ahora:
+
+- ValidarSubidas (middleware ASGI) mira los formularios multipart a medida que llegan.
+  Rechaza por Content-Length sin leer nada y corta la lectura cuando el cuerpo o un
+  archivo pasan el límite. De cada archivo guarda solo el comienzo: los bytes mágicos
+  deciden el formato con el primer trozo y Pillow lee las dimensiones de la cabecera.
+  Si algo no cumple, responde 413/415 sin leer el resto del cuerpo.
+- validar_imagen() hace la misma revisión sobre un UploadFile ya recibido y devuelve el
+  formato detectado; las rutas guardan ese content_type y no el que declaró el cliente.
+
+Límites: IMAGEN_MAX_BYTES (10 MiB), IMAGEN_MAX_PIXELES (40 Mpx) e IMAGEN_MAX_LADO_ENTRADA
+(10000 px por lado).
+"""
+import io
+import os
+from dataclasses import dataclass
+
+from fastapi import UploadFile
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.responses import JSONResponse
+
+IMAGEN_MAX_BYTES = int(os.getenv("IMAGEN_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGEN_MAX_PIXELES = int(os.getenv("IMAGEN_MAX_PIXELES", str(40_000_000)))
+IMAGEN_MAX_LADO_ENTRADA = int(os.getenv("IMAGEN_MAX_LADO_ENTRADA", "10000"))
+
+# Lo que puede ocupar el formulario además del archivo (nombre, descripción, ids...)
+FORMULARIO_MAX_BYTES = 256 * 1024
+
+# Hasta dónde se busca la cabecera con las dimensiones (un JPEG con EXIF o perfil ICC
+# grande la puede tener lejos del comienzo)
+CABECERA_MAX = 1024 * 1024
+
+# bytes mágicos, posición -> (formato de Pillow, content_type)
+FIRMAS = (
+    (b"\xff\xd8\xff", 0, "JPEG", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", 0, "PNG", "image/png"),
+    (b"GIF87a", 0, "GIF", "image/gif"),
+    (b"GIF89a", 0, "GIF", "image/gif"),
+    (b"WEBP", 8, "WEBP", "image/webp"),  # RIFF <tamaño> WEBP
+)
+LARGO_FIRMA = 12
+
+
+class ImagenInvalida(Exception):
+    def __init__(self, estado: int, detalle: str):
+        super().__init__(detalle)
+        self.estado = estado
+        self.detalle = detalle
+
+
+@dataclass(frozen=True)
+class InfoImagen:
+    formato: str
+    content_type: str
+    ancho: int | None
+    alto: int | None
+
+
+def _megas(n: int) -> str:
+    return f"{n / 2**20:.0f} MiB"
+
+
+def _formato(cabecera: bytes) -> tuple[str, str]:
+    for firma, posicion, formato, content_type in FIRMAS:
+        if cabecera[posicion:posicion + len(firma)] == firma:
+            if formato == "WEBP" and not cabecera.startswith(b"RIFF"):
+                continue
+            return formato, content_type
+    raise ImagenInvalida(415, "El archivo debe ser una imagen JPEG, PNG, GIF o WebP")
+
+
+def inspeccionar(cabecera: bytes, completo: bool) -> InfoImagen | None:
+    """
+    Revisa el comienzo de un archivo. Devuelve None si hacen falta más bytes para
+    decidir (solo cuando `completo` es False); lanza ImagenInvalida si no sirve.
+    """
+    if len(cabecera) < LARGO_FIRMA and not completo:
+        return None
+    formato, content_type = _formato(cabecera)
+
+    try:
+        from PIL import Image, UnidentifiedImageError
+    except ImportError:
+        # Sin Pillow solo se puede confiar en los bytes mágicos
+        return InfoImagen(formato, content_type, None, None)
+
+    try:
+        # open() solo lee la cabecera; los píxeles no se decodifican
+        with Image.open(io.BytesIO(cabecera), formats=[formato]) as img:
+            ancho, alto = img.size
+    except Image.DecompressionBombError:
+        raise ImagenInvalida(413, f"La imagen supera {IMAGEN_MAX_PIXELES} píxeles")
+    except (UnidentifiedImageError, SyntaxError, OSError, EOFError, ValueError):
+        if not completo:
+            return None
+        raise ImagenInvalida(415, f"El archivo dice ser {formato} pero no se pudo leer")
+
+    if max(ancho, alto) > IMAGEN_MAX_LADO_ENTRADA or ancho * alto > IMAGEN_MAX_PIXELES:
+        raise ImagenInvalida(
+            413,
+            f"La imagen mide {ancho}x{alto} px; el máximo es {IMAGEN_MAX_LADO_ENTRADA} px "
+            f"por lado y {IMAGEN_MAX_PIXELES} píxeles",
+        )
+    return InfoImagen(formato, content_type, ancho, alto)
+
+
+class InspectorImagen:
+    """Recibe un archivo por trozos y lo revisa apenas hay bytes suficientes; no guarda el resto."""
+
+    def __init__(self):
+        self.tamano = 0
+        self.info: InfoImagen | None = None
+        self._cabecera = bytearray()
+        self._siguiente = LARGO_FIRMA
+
+    def agregar(self, datos: bytes):
+        self.tamano += len(datos)
+        if self.tamano > IMAGEN_MAX_BYTES:
+            raise ImagenInvalida(413, f"La imagen supera {_megas(IMAGEN_MAX_BYTES)}")
+        if self.info is not None:
+            return
+        self._cabecera += datos[:CABECERA_MAX - len(self._cabecera)]
+        if len(self._cabecera) >= self._siguiente:
+            self._revisar(completo=len(self._cabecera) >= CABECERA_MAX)
+            # Pillow pidió más: volver a intentar cuando haya el doble
+            self._siguiente = len(self._cabecera) * 2
+
+    def terminar(self) -> InfoImagen | None:
+        if self.info is None and self.tamano:
+            self._revisar(completo=True)
+        return self.info
+
+    def _revisar(self, completo: bool):
+        self.info = inspeccionar(bytes(self._cabecera), completo)
+        if self.info is not None:
+            self._cabecera = bytearray()
+
+
+async def validar_imagen(archivo: UploadFile) -> InfoImagen:
+    """Revisa un UploadFile ya recibido leyendo solo su comienzo, y lo deja en la posición 0."""
+    if archivo.size is not None and archivo.size > IMAGEN_MAX_BYTES:
+        raise ImagenInvalida(413, f"La imagen supera {_megas(IMAGEN_MAX_BYTES)}")
+    inspector = InspectorImagen()
+    while inspector.info is None:
+        trozo = await archivo.read(64 * 1024)
+        if not trozo:
+            break
+        inspector.agregar(trozo)
+    info = inspector.terminar()
+    await archivo.seek(0)
+    if info is None:
+        raise ImagenInvalida(400, "El archivo está vacío")
+    return info
+
+
+# ---------------------------
+# MIDDLEWARE
+# ---------------------------
+class _Formulario:
+    """Sigue las partes de un multipart con python-multipart y pasa los archivos a un InspectorImagen."""
+
+    def __init__(self, boundary: bytes):
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._al_empezar_parte,
+            "on_header_field": self._al_nombre_cabecera,
+            "on_header_value": self._al_valor_cabecera,
+            "on_header_end": self._al_terminar_cabecera,
+            "on_headers_finished": self._al_terminar_cabeceras,
+            "on_part_data": self._al_recibir_datos,
+            "on_part_end": self._al_terminar_parte,
+        })
+        self._nombre = b""
+        self._valor = b""
+        self._disposicion = b""
+        self._inspector: InspectorImagen | None = None
+
+    def escribir(self, datos: bytes):
+        self._parser.write(datos)
+
+    def _al_empezar_parte(self):
+        self._disposicion = b""
+        self._inspector = None
+
+    def _al_nombre_cabecera(self, datos, inicio, fin):
+        self._nombre += datos[inicio:fin]
+
+    def _al_valor_cabecera(self, datos, inicio, fin):
+        self._valor += datos[inicio:fin]
+
+    def _al_terminar_cabecera(self):
+        if self._nombre.lower() == b"content-disposition":
+            self._disposicion = self._valor
+        self._nombre = self._valor = b""
+
+    def _al_terminar_cabeceras(self):
+        _, opciones = parse_options_header(self._disposicion)
+        # filename="" es un <input type="file"> que se dejó vacío
+        if opciones.get(b"filename"):
+            self._inspector = InspectorImagen()
+
+    def _al_recibir_datos(self, datos, inicio, fin):
+        if self._inspector is not None:
+            self._inspector.agregar(datos[inicio:fin])
+
+    def _al_terminar_parte(self):
+        if self._inspector is not None:
+            self._inspector.terminar()
+
+
+class ValidarSubidas:
+    def __init__(self, app):
+        self.app = app
+        self.max_cuerpo = IMAGEN_MAX_BYTES + FORMULARIO_MAX_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+        cabeceras = dict(scope["headers"])
+        tipo, opciones = parse_options_header(cabeceras.get(b"content-type", b""))
+        if tipo != b"multipart/form-data" or b"boundary" not in opciones:
+            await self.app(scope, receive, send)
+            return
+
+        largo = cabeceras.get(b"content-length")
+        if largo is not None and largo.isdigit() and int(largo) > self.max_cuerpo:
+            await self._rechazar(scope, receive, send, ImagenInvalida(
+                413, f"La petición supera {_megas(self.max_cuerpo)}"
+            ))
+            return
+
+        formulario = _Formulario(opciones[b"boundary"])
+        recibidos = 0
+        rechazo: ImagenInvalida | None = None
+
+        async def recibir():
+            nonlocal recibidos, rechazo
+            mensaje = await receive()
+            if mensaje["type"] == "http.request" and rechazo is None:
+                cuerpo = mensaje.get("body", b"")
+                recibidos += len(cuerpo)
+                try:
+                    if recibidos > self.max_cuerpo:
+                        raise ImagenInvalida(413, f"La petición supera {_megas(self.max_cuerpo)}")
+                    formulario.escribir(cuerpo)
+                except ImagenInvalida as e:
+                    rechazo = e
+                    raise
+                except Exception:
+                    pass  # multipart mal formado: que lo rechace el parser de Starlette
+            return mensaje
+
+        async def enviar(mensaje):
+            # Tras un rechazo la app responde con su propio error (400 de FastAPI): se descarta
+            if rechazo is None:
+                await send(mensaje)
+
+        try:
+            await self.app(scope, recibir, enviar)
+        except Exception:
+            if rechazo is None:
+                raise
+        if rechazo is not None:
+            await self._rechazar(scope, receive, send, rechazo)
+
+    async def _rechazar(self, scope, receive, send, error: ImagenInvalida):
+        # Connection: close para no tener que leer (y descartar) lo que falta del cuerpo
+        respuesta = JSONResponse({"detail": error.detalle}, status_code=error.estado, headers={"Connection": "close"})
+        await respuesta(scope, receive, send)
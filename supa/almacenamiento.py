@@ -0,0 +1,213 @@
+import abc
+import datetime
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+
+class BackendAlmacenamiento(abc.ABC):
+    """
+    Interfaz mínima que necesita la app para guardar imágenes.
+    Las rutas siempre son relativas al bucket (ej: "public/espada_123.png").
+    Un backend al que le falte algún método abstracto no se puede instanciar.
+    """
+
+    nombre = "base"
+
+    @abc.abstractmethod
+    def subir(self, bucket: str, ruta: str, contenido: bytes, content_type: str | None = None) -> None:
+        ...
+
+    @abc.abstractmethod
+    def url_publica(self, bucket: str, ruta: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    def leer(self, bucket: str, ruta: str) -> bytes | None:
+        ...
+
+    # Para el recolector de imágenes huérfanas (supa/recolector.py)
+    @abc.abstractmethod
+    def listar(self, bucket: str, prefijo: str = "public") -> list[dict]:
+        """Devuelve [{"ruta": str, "creado": datetime | None, "tamano": int | None}, ...]"""
+
+    @abc.abstractmethod
+    def eliminar(self, bucket: str, rutas: list[str]) -> None:
+        ...
+
+    def ruta_desde_url(self, bucket: str, url: str) -> str | None:
+        """Inverso de url_publica: None si la URL no pertenece a este bucket."""
+        base = self.url_publica(bucket, "")
+        if not url or not url.startswith(base):
+            return None
+        return url[len(base):].split("?", 1)[0] or None
+
+
+# ---------------------------
+# SUPABASE (producción)
+# ---------------------------
+class AlmacenamientoSupabase(BackendAlmacenamiento):
+    nombre = "supabase"
+
+    def __init__(self, cliente_factory: Callable):
+        # Se recibe la factory para no crear el cliente hasta el primer uso
+        self._cliente_factory = cliente_factory
+
+    def _bucket(self, bucket: str):
+        return self._cliente_factory().storage.from_(bucket)
+
+    def subir(self, bucket, ruta, contenido, content_type=None):
+        self._bucket(bucket).upload(
+            path=ruta,
+            file=contenido,
+            file_options={"content-type": content_type or "application/octet-stream"}
+        )
+
+    def url_publica(self, bucket, ruta):
+        return self._bucket(bucket).get_public_url(ruta)
+
+    def leer(self, bucket, ruta):
+        try:
+            return self._bucket(bucket).download(ruta)
+        except Exception:
+            return None
+
+    def listar(self, bucket, prefijo="public"):
+        objetos = []
+        offset = 0
+        while True:
+            pagina = self._bucket(bucket).list(prefijo, {"limit": 1000, "offset": offset})
+            for obj in pagina:
+                # Las "carpetas" vienen sin id
+                if not obj.get("id"):
+                    continue
+                creado = obj.get("created_at")
+                objetos.append({
+                    "ruta": f"{prefijo}/{obj['name']}" if prefijo else obj["name"],
+                    "creado": datetime.datetime.fromisoformat(creado.replace("Z", "+00:00")) if creado else None,
+                    "tamano": (obj.get("metadata") or {}).get("size"),
+                })
+            if len(pagina) < 1000:
+                return objetos
+            offset += 1000
+
+    def eliminar(self, bucket, rutas):
+        if rutas:
+            self._bucket(bucket).remove(rutas)
+
+    def ruta_desde_url(self, bucket, url):
+        # get_public_url puede añadir "?" al final, se compara sin query string
+        base = self.url_publica(bucket, "").split("?", 1)[0]
+        if not url or not url.startswith(base):
+            return None
+        return url[len(base):].split("?", 1)[0] or None
+
+
+# ---------------------------
+# DISCO LOCAL (desarrollo / pruebas de carga)
+# ---------------------------
+class AlmacenamientoLocal(BackendAlmacenamiento):
+    nombre = "local"
+
+    def __init__(self, directorio: str, url_base: str = "/media"):
+        self.directorio = Path(directorio)
+        self.url_base = url_base.rstrip("/")
+
+    def _archivo(self, bucket: str, ruta: str) -> Path:
+        archivo = (self.directorio / bucket / ruta).resolve()
+        # Evitar que una ruta con ".." salga del directorio del bucket
+        if not archivo.is_relative_to((self.directorio / bucket).resolve()):
+            raise ValueError("Ruta fuera del bucket")
+        return archivo
+
+    def subir(self, bucket, ruta, contenido, content_type=None):
+        archivo = self._archivo(bucket, ruta)
+        archivo.parent.mkdir(parents=True, exist_ok=True)
+        tmp = archivo.with_name(archivo.name + ".tmp")
+        tmp.write_bytes(contenido)
+        os.replace(tmp, archivo)
+
+    def url_publica(self, bucket, ruta):
+        return f"{self.url_base}/{bucket}/{ruta}"
+
+    def leer(self, bucket, ruta):
+        try:
+            return self._archivo(bucket, ruta).read_bytes()
+        except (OSError, ValueError):
+            return None
+
+    def listar(self, bucket, prefijo="public"):
+        raiz = self.directorio / bucket
+        carpeta = raiz / prefijo if prefijo else raiz
+        if not carpeta.is_dir():
+            return []
+        objetos = []
+        for archivo in carpeta.rglob("*"):
+            if not archivo.is_file() or archivo.name.endswith(".tmp"):
+                continue
+            stat = archivo.stat()
+            objetos.append({
+                "ruta": archivo.relative_to(raiz).as_posix(),
+                "creado": datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc),
+                "tamano": stat.st_size,
+            })
+        return objetos
+
+    def eliminar(self, bucket, rutas):
+        for ruta in rutas:
+            try:
+                self._archivo(bucket, ruta).unlink()
+            except (FileNotFoundError, ValueError):
+                pass
+
+
+# ---------------------------
+# MEMORIA (pruebas rápidas, se pierde al reiniciar)
+# ---------------------------
+class AlmacenamientoMemoria(BackendAlmacenamiento):
+    nombre = "memoria"
+
+    def __init__(self, url_base: str = "/media"):
+        self.url_base = url_base.rstrip("/")
+        self._objetos: dict[tuple[str, str], tuple[bytes, str | None, datetime.datetime]] = {}
+        self._lock = threading.Lock()
+
+    def subir(self, bucket, ruta, contenido, content_type=None):
+        ahora = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            self._objetos[(bucket, ruta)] = (bytes(contenido), content_type, ahora)
+
+    def url_publica(self, bucket, ruta):
+        return f"{self.url_base}/{bucket}/{ruta}"
+
+    def leer(self, bucket, ruta):
+        obj = self._objetos.get((bucket, ruta))
+        return obj[0] if obj else None
+
+    def listar(self, bucket, prefijo="public"):
+        with self._lock:
+            return [
+                {"ruta": r, "creado": creado, "tamano": len(contenido)}
+                for (b, r), (contenido, _, creado) in self._objetos.items()
+                if b == bucket and (not prefijo or r.startswith(prefijo + "/"))
+            ]
+
+    def eliminar(self, bucket, rutas):
+        with self._lock:
+            for ruta in rutas:
+                self._objetos.pop((bucket, ruta), None)
+
+
+def crear_backend(tipo: str, cliente_factory: Optional[Callable] = None) -> BackendAlmacenamiento:
+    """
+    Crea el backend según STORAGE_BACKEND: "supabase" (defecto), "local" o "memoria".
+    """
+    tipo = (tipo or "supabase").lower()
+    if tipo == "supabase":
+        return AlmacenamientoSupabase(cliente_factory)
+    if tipo == "local":
+        return AlmacenamientoLocal(os.getenv("STORAGE_LOCAL_DIR", "./media"))
+    if tipo == "memoria":
+        return AlmacenamientoMemoria()
+    raise ValueError(f"STORAGE_BACKEND desconocido: {tipo}")
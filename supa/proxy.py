@@ -0,0 +1,323 @@
+"""
+Proxy local de imágenes con caché en disco.
+
+Las plantillas ponían imagen_url tal cual (URLs públicas de Supabase) y via.placeholder.com
+para lo que no tenía imagen: cada vista hacía que el navegador fuera a hosts externos, sin
+control del tamaño ni del cacheo. Ahora las plantillas usan:
+
+    {{ item.imagen_url|img(600) }}   -> /img/<id de Imagen>/600
+    {{ sin_imagen(300, 200) }}       -> /img/vacio/300x200 (SVG generado aquí)
+
+/img/{id}/{ancho} lee la imagen del storage una sola vez, la reduce a ese ancho (WebP si el
+navegador lo acepta) y guarda original y reducciones en un directorio con límite de bytes,
+desalojando lo menos usado. Cada id apunta a un archivo que no cambia (ruta con UUID), así
+que la respuesta se puede cachear un año.
+
+El filtro |img solo lee: pintar una página nunca escribe en la base. Las URLs anteriores a
+la tabla Imagen se registran una vez al iniciar (registrar_urls_existentes); una URL sin
+fila se deja tal cual en la página, igual que las que no son de nuestros buckets.
+"""
+import io
+import os
+import tempfile
+import threading
+from urllib.parse import quote
+
+from sqlmodel import Session, select
+
+from db import engine
+from models import Imagen
+from supa.supabase import get_storage_backend, ubicar_url
+
+IMG_CACHE_DIR = os.getenv("IMG_CACHE_DIR", os.path.join(tempfile.gettempdir(), "blasphemous-img"))
+IMG_CACHE_MAX_BYTES = int(os.getenv("IMG_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Anchos permitidos: cualquier otro número llenaría la caché con variantes inútiles
+ANCHOS = (100, 150, 300, 600, 1200)
+
+CALIDAD = 80
+MAX_LADO_VACIO = 4000
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+# ---------------------------
+# CACHÉ EN DISCO (LRU por fecha de modificación)
+# ---------------------------
+class CacheDisco:
+    """
+    Archivos en un directorio, compartido por los workers de la máquina. Cada lectura
+    toca la fecha de modificación; al pasar `max_bytes` se borran los más viejos.
+    """
+
+    def __init__(self, directorio: str = IMG_CACHE_DIR, max_bytes: int = IMG_CACHE_MAX_BYTES):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        os.makedirs(directorio, exist_ok=True)
+        self._lock = threading.Lock()
+        self._bytes = sum(e.stat().st_size for e in self._archivos())
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def _archivos(self):
+        return [e for e in os.scandir(self.directorio) if e.is_file() and not e.name.startswith(".")]
+
+    def _ruta(self, nombre: str) -> str:
+        return os.path.join(self.directorio, nombre)
+
+    def leer(self, nombre: str) -> bytes | None:
+        ruta = self._ruta(nombre)
+        try:
+            with open(ruta, "rb") as f:
+                datos = f.read()
+            os.utime(ruta)
+        except FileNotFoundError:
+            self.fallos += 1
+            return None
+        self.aciertos += 1
+        return datos
+
+    def escribir(self, nombre: str, datos: bytes):
+        # Archivo temporal + replace: otro worker nunca lee un archivo a medio escribir
+        fd, temporal = tempfile.mkstemp(dir=self.directorio, prefix=".")
+        with os.fdopen(fd, "wb") as f:
+            f.write(datos)
+        os.replace(temporal, self._ruta(nombre))
+        with self._lock:
+            self._bytes += len(datos)
+            if self._bytes > self.max_bytes:
+                self._podar()
+
+    def eliminar_prefijo(self, prefijo: str) -> int:
+        """Borra los archivos cuyo nombre empieza por `prefijo`. Devuelve cuántos borró."""
+        borrados = 0
+        with self._lock:
+            for entrada in self._archivos():
+                if not entrada.name.startswith(prefijo):
+                    continue
+                try:
+                    tamano = entrada.stat().st_size
+                    os.unlink(entrada.path)
+                except FileNotFoundError:
+                    continue
+                self._bytes -= tamano
+                borrados += 1
+        return borrados
+
+    def _podar(self):
+        # Recontar del disco: los otros workers también escriben y borran
+        archivos = sorted(self._archivos(), key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in archivos)
+        objetivo = self.max_bytes * 0.9
+        for entrada in archivos:
+            if total <= objetivo:
+                break
+            try:
+                tamano = entrada.stat().st_size
+                os.unlink(entrada.path)
+            except FileNotFoundError:
+                continue
+            total -= tamano
+            self.desalojos += 1
+        self._bytes = total
+
+    def metricas(self) -> dict:
+        return {
+            "directorio": self.directorio,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+        }
+
+
+cache_disco = CacheDisco()
+
+# Un candado por archivo: dos peticiones de la misma imagen no la bajan ni la reducen dos veces.
+# nombre -> [candado, peticiones que lo tienen o lo esperan]; la entrada se borra al soltarlo
+# la última (si se borrara antes, una tercera petición crearía otro candado y calcularía en paralelo)
+_candados: dict[str, list] = {}
+_candados_lock = threading.Lock()
+
+
+def _candado(nombre: str) -> threading.Lock:
+    with _candados_lock:
+        entrada = _candados.setdefault(nombre, [threading.Lock(), 0])
+        entrada[1] += 1
+        return entrada[0]
+
+
+def _soltar(nombre: str):
+    with _candados_lock:
+        entrada = _candados[nombre]
+        entrada[1] -= 1
+        if not entrada[1]:
+            del _candados[nombre]
+
+
+def _en_cache(nombre: str, calcular) -> bytes | None:
+    datos = cache_disco.leer(nombre)
+    if datos is not None:
+        return datos
+    candado = _candado(nombre)
+    try:
+        with candado:
+            datos = cache_disco.leer(nombre)
+            if datos is None:
+                datos = calcular()
+                if datos is not None:
+                    cache_disco.escribir(nombre, datos)
+    finally:
+        _soltar(nombre)
+    return datos
+
+
+# ---------------------------
+# IMÁGENES
+# ---------------------------
+def _original(imagen_id: int) -> bytes | None:
+    with Session(engine) as session:
+        imagen = session.get(Imagen, imagen_id)
+    ubicacion = ubicar_url(imagen.url) if imagen else None
+    if not ubicacion:
+        return None
+    return get_storage_backend().leer(*ubicacion)
+
+
+def _reducir(original: bytes, ancho: int, webp: bool) -> bytes:
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(original)) as abierta:
+        if getattr(abierta, "is_animated", False):
+            return original
+        formato = abierta.format
+        img = ImageOps.exif_transpose(abierta)
+        if img.width > ancho:
+            img = img.resize((ancho, max(1, round(img.height * ancho / img.width))), Image.Resampling.LANCZOS)
+
+        salida = io.BytesIO()
+        if webp:
+            img.save(salida, "WEBP", quality=CALIDAD)
+        elif formato == "JPEG":
+            img.save(salida, "JPEG", quality=CALIDAD, optimize=True, progressive=True)
+        else:
+            img.save(salida, "PNG", optimize=True)
+        return salida.getvalue()
+
+
+def _content_type(datos: bytes) -> str:
+    from PIL import Image
+
+    with Image.open(io.BytesIO(datos)) as img:
+        return Image.MIME.get(img.format, "application/octet-stream")
+
+
+def servir(imagen_id: int, ancho: int, acepta_webp: bool) -> tuple[bytes, str] | None:
+    """(bytes, content_type) de la imagen reducida a `ancho`, o None si no existe o no es de nuestros buckets."""
+    def calcular():
+        # Solo si falta la reducción se toca la base y el original
+        original = _en_cache(f"{imagen_id}-original", lambda: _original(imagen_id))
+        return None if original is None else _reducir(original, ancho, acepta_webp)
+
+    datos = _en_cache(f"{imagen_id}-{ancho}{'-webp' if acepta_webp else ''}", calcular)
+    if datos is None:
+        return None
+    return datos, _content_type(datos)
+
+
+# ---------------------------
+# PLACEHOLDER
+# ---------------------------
+def svg_vacio(ancho: int, alto: int, texto: str = "Sin imagen") -> str:
+    letra = max(12, min(ancho, alto) // 8)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{ancho}" height="{alto}" viewBox="0 0 {ancho} {alto}">'
+        f'<rect width="100%" height="100%" fill="#cccccc"/>'
+        f'<text x="50%" y="50%" fill="#666666" font-family="sans-serif" font-size="{letra}" '
+        f'text-anchor="middle" dominant-baseline="middle">{texto}</text></svg>'
+    )
+
+
+# ---------------------------
+# AYUDAS PARA LAS PLANTILLAS
+# ---------------------------
+# url -> id de Imagen (o None si no tiene fila). Una URL nunca cambia de id y su fila se crea
+# al subirla, antes de que una entidad la use; solo olvidar() la saca al borrar la imagen
+_ids: dict[str, int | None] = {}
+MAX_IDS = 50_000
+
+
+def imagen_id(url: str) -> int | None:
+    """Id de la fila de Imagen con esa URL, o None si no es de nuestros buckets o no tiene fila. Solo lee."""
+    if url in _ids:
+        return _ids[url]
+    if not ubicar_url(url):
+        return None
+    with Session(engine) as session:
+        encontrado = session.exec(select(Imagen.id).where(Imagen.url == url).order_by(Imagen.id)).first()
+    if len(_ids) >= MAX_IDS:
+        _ids.clear()
+    _ids[url] = encontrado
+    return encontrado
+
+
+def olvidar(ids: list[int], urls: list[str]):
+    """
+    Saca de la caché en disco y del mapa url -> id las imágenes borradas (la llama
+    olvidar_imagenes). El mapa es de cada worker: en los otros la URL borrada sigue apuntando
+    a su id viejo, que ya no se reutiliza y responde 404.
+    """
+    for imagen in ids:
+        cache_disco.eliminar_prefijo(f"{imagen}-")
+    for url in urls:
+        _ids.pop(url, None)
+
+
+def registrar_urls_existentes(session: Session) -> int:
+    """
+    Migración: crea la fila de Imagen (sin tamaños) de cada imagen_url de nuestros buckets
+    que no tenga, para las subidas anteriores al registro de ingreso. Se corre al iniciar la
+    app; las subidas nuevas ya tienen su fila desde ingerir_imagen. Devuelve cuántas creó.
+    """
+    from models import Categoria, Interaccion, Item, Ubicacion
+
+    urls = set()
+    for modelo in (Item, Categoria, Ubicacion, Interaccion):
+        urls.update(session.exec(select(modelo.imagen_url).where(modelo.imagen_url != None)))
+    faltantes = urls - set(session.exec(select(Imagen.url)))
+    nuevas = [Imagen(url=url) for url in sorted(faltantes) if ubicar_url(url)]
+    session.add_all(nuevas)
+    session.commit()
+    return len(nuevas)
+
+
+def url_vacio(ancho: int, alto: int) -> str:
+    return f"/img/vacio/{ancho}x{alto}"
+
+
+def url_img(url: str | None, ancho: int = 600) -> str:
+    """Filtro |img: la URL del proxy para esa imagen, o el placeholder si no hay."""
+    if not url:
+        return url_vacio(ancho, ancho * 2 // 3)
+    imagen = imagen_id(url)
+    if imagen is None:
+        return url  # externa: el proxy no baja URLs de terceros
+    return f"/img/{imagen}/{ancho}"
+
+
+def registrar_plantillas(templates):
+    """Agrega |img y sin_imagen() a un Jinja2Templates de las rutas."""
+    templates.env.filters["img"] = url_img
+    templates.env.globals["sin_imagen"] = url_vacio
+
+
+def registrar_estatico(entorno):
+    """Versión para exportar.py: el sitio estático no tiene /img, así que usa las URLs originales."""
+    entorno.filters["img"] = lambda url, ancho=600: url or _data_vacio(ancho, ancho * 2 // 3)
+    entorno.globals["sin_imagen"] = _data_vacio
+
+
+def _data_vacio(ancho: int, alto: int) -> str:
+    return "data:image/svg+xml;charset=utf-8," + quote(svg_vacio(ancho, alto))
@@ -0,0 +1,121 @@
+"""
+Recolector de imágenes huérfanas.
+
+Compara el contenido de los buckets con las imagen_url guardadas en todas las tablas
+(incluidas las filas eliminadas y archivadas, que pueden restaurarse) y borra en lotes lo que no
+está referenciado. Junto con cada objeto borrado se borra su fila de Imagen: la tabla
+registra todas las subidas, también las que nunca se asignaron a una entidad, así que no
+cuenta como referencia, pero /imagenes/{id} y /img/{id} no deben quedar apuntando a un
+objeto que ya no existe.
+
+Uso:
+    python -m supa.recolector              # solo reporte (dry-run)
+    python -m supa.recolector --ejecutar   # borra de verdad
+"""
+import argparse
+import datetime
+import json
+import time
+
+from sqlmodel import Session, select
+
+from models import Archivado, Item, Categoria, Ubicacion, Interaccion
+from supa.supabase import BUCKETS, get_storage_backend, olvidar_imagenes, ruta_base, ubicar_url
+
+# Objetos más nuevos que esto no se tocan: pueden ser subidas cuya entidad aún no se actualizó
+GRACIA_MINUTOS = 60
+
+# Cuántas rutas de ejemplo mostrar por bucket en el reporte
+MUESTRAS = 20
+
+
+def urls_referenciadas(session: Session) -> set[tuple[str, str]]:
+    """(bucket, ruta) de todas las imágenes en uso, activas, eliminadas o archivadas."""
+    urls = []
+    for modelo in (Item, Categoria, Ubicacion, Interaccion):
+        urls.extend(session.exec(select(modelo.imagen_url).where(modelo.imagen_url != None)))
+    # Las filas archivadas se pueden restaurar con su imagen
+    urls.extend(json.loads(datos).get("imagen_url") for datos in session.exec(select(Archivado.datos)))
+
+    referenciadas = set()
+    for url in urls:
+        ubicacion = ubicar_url(url) if url else None
+        if ubicacion:
+            referenciadas.add(ubicacion)
+    return referenciadas
+
+
+def recolectar_huerfanas(
+    session: Session,
+    dry_run: bool = True,
+    lote: int = 100,
+    pausa: float = 1.0,
+    gracia_minutos: int = GRACIA_MINUTOS,
+) -> dict:
+    """
+    Busca (y si dry_run es False, borra) las imágenes sin referencia.
+    Borra de a `lote` rutas por llamada, esperando `pausa` segundos entre lotes
+    para no saturar la API de storage.
+    """
+    backend = get_storage_backend()
+    referenciadas = urls_referenciadas(session)
+    limite = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=gracia_minutos)
+
+    reporte = {"dry_run": dry_run, "buckets": {}}
+    for bucket in sorted(set(BUCKETS.values())):
+        objetos = backend.listar(bucket)
+        # Las variantes (.webp, .avif) siguen a su imagen principal
+        usados = [
+            (bucket, o["ruta"]) in referenciadas or (bucket, ruta_base(o["ruta"])) in referenciadas
+            for o in objetos
+        ]
+        huerfanos = [
+            o for o, usado in zip(objetos, usados)
+            if not usado and (o["creado"] is None or o["creado"] < limite)
+        ]
+
+        eliminados = 0
+        if not dry_run:
+            for inicio in range(0, len(huerfanos), lote):
+                if inicio:
+                    time.sleep(pausa)
+                rutas = [o["ruta"] for o in huerfanos[inicio:inicio + lote]]
+                backend.eliminar(bucket, rutas)
+                olvidar_imagenes(session, bucket, rutas)
+                eliminados += len(rutas)
+
+        reporte["buckets"][bucket] = {
+            "objetos": len(objetos),
+            "referenciados": sum(usados),
+            "huerfanos": len(huerfanos),
+            "bytes_huerfanos": sum(o["tamano"] or 0 for o in huerfanos),
+            "eliminados": eliminados,
+            "muestras": [o["ruta"] for o in huerfanos[:MUESTRAS]],
+        }
+
+    return reporte
+
+
+def main():
+    from db import engine
+
+    parser = argparse.ArgumentParser(description="Recolector de imágenes huérfanas en los buckets")
+    parser.add_argument("--ejecutar", action="store_true", help="borrar de verdad (por defecto solo reporta)")
+    parser.add_argument("--lote", type=int, default=100, help="rutas por llamada de borrado")
+    parser.add_argument("--pausa", type=float, default=1.0, help="segundos entre lotes")
+    parser.add_argument("--gracia", type=int, default=GRACIA_MINUTOS, help="minutos de gracia para subidas recientes")
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        reporte = recolectar_huerfanas(
+            session,
+            dry_run=not args.ejecutar,
+            lote=args.lote,
+            pausa=args.pausa,
+            gracia_minutos=args.gracia,
+        )
+    print(json.dumps(reporte, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
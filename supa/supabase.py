@@ -1,8 +1,14 @@
 import os
+from dataclasses import dataclass, field
 from typing import Optional
 from fastapi import UploadFile
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from supa.almacenamiento import BackendAlmacenamiento, crear_backend
+from ejecutor import en_hilo
+import io
+import json
+import mimetypes
 import re
 import unicodedata
 import uuid
@@ -15,8 +21,35 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET")
 
+# Backend de almacenamiento: "supabase" (defecto), "local" o "memoria"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+
+# Bucket de cada entidad (el de categorías es el bucket por defecto)
+BUCKET_POR_DEFECTO = SUPABASE_BUCKET or "imagenes"
+BUCKETS = {
+    "categoria": BUCKET_POR_DEFECTO,
+    "item": os.getenv("BUCKET_ITEMS") or BUCKET_POR_DEFECTO,
+    "ubicacion": os.getenv("BUCKET_UBICACIONES") or BUCKET_POR_DEFECTO,
+    "interaccion": os.getenv("BUCKET_INTERACCIONES") or BUCKET_POR_DEFECTO,
+}
+
+# Lado máximo (px) de las imágenes procesadas en segundo plano
+IMAGEN_MAX_LADO = int(os.getenv("IMAGEN_MAX_LADO", "1600"))
+
+# Calidad de recompresión (JPEG y WebP con pérdida / AVIF, que rinde igual con menos calidad nominal)
+IMAGEN_CALIDAD = int(os.getenv("IMAGEN_CALIDAD", "85"))
+IMAGEN_CALIDAD_AVIF = int(os.getenv("IMAGEN_CALIDAD_AVIF", "60"))
+
+# PNG desde este peso también se guarda como WebP sin pérdida
+IMAGEN_PNG_GRANDE = int(os.getenv("IMAGEN_PNG_GRANDE", str(256 * 1024)))
+
+# Variantes que se guardan junto a la imagen (en "<ruta>.<formato>"), en orden de preferencia
+VARIANTES = {"avif": "image/avif", "webp": "image/webp"}
+mimetypes.add_type("image/avif", ".avif")
+
 # Cliente cacheado (como en tu ejemplo)
 _supabase_client: Optional[Client] = None
+_storage_backend: Optional[BackendAlmacenamiento] = None
 
 
 def get_supabase_client():
@@ -33,6 +66,26 @@ def get_supabase_client():
 
     return _supabase_client
 
+
+def get_storage_backend() -> BackendAlmacenamiento:
+    """
+    Devuelve el backend de almacenamiento global (se crea una sola vez).
+    Con STORAGE_BACKEND=local o memoria no hace falta tener credenciales de Supabase.
+    """
+    global _storage_backend
+
+    if _storage_backend is None:
+        _storage_backend = crear_backend(STORAGE_BACKEND, get_supabase_client)
+
+    return _storage_backend
+
+
+def set_storage_backend(backend: BackendAlmacenamiento | None):
+    """Reemplaza el backend global (pruebas de carga, scripts)."""
+    global _storage_backend
+    _storage_backend = backend
+
+
 def sanitize_filename(filename: str) -> str:
     # Normalizar para quitar acentos
     filename = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode()
@@ -42,44 +95,261 @@ def sanitize_filename(filename: str) -> str:
 
     return filename
 
-async def upload_to_bucket(file: UploadFile, bucket: str | None = None):
+def ruta_unica(filename: str) -> str:
+    """
+    Ruta dentro del bucket con nombre seguro + UUID, para evitar errores 409 (Duplicate).
+    """
+    # Extraer extensión del archivo
+    ext = filename.split(".")[-1].lower()
+
+    # Nombre seguro + UUID
+    safe_name = sanitize_filename(filename.rsplit(".", 1)[0])
+    unique_name = f"{safe_name}_{uuid.uuid4()}.{ext}"
+
+    # Ruta final en el bucket
+    return f"public/{unique_name}"
+
+
+def ubicar_url(url: str | None) -> tuple[str, str] | None:
+    """
+    Dada una URL pública devuelve (bucket, ruta) si pertenece a alguno de nuestros buckets.
+    URLs externas (placeholders, enlaces a mano) devuelven None.
+    """
+    if not url:
+        return None
+    backend = get_storage_backend()
+    for bucket in set(BUCKETS.values()):
+        ruta = backend.ruta_desde_url(bucket, url)
+        if ruta:
+            return bucket, ruta
+    return None
+
+
+def ruta_variante(ruta: str, formato: str) -> str:
+    return f"{ruta}.{formato}"
+
+
+def ruta_base(ruta: str) -> str:
+    """La ruta de la imagen principal de una variante ("x.png.webp" -> "x.png"); otras rutas quedan igual."""
+    for formato in VARIANTES:
+        sufijo = f".{formato}"
+        if ruta.endswith(sufijo) and "." in ruta[:-len(sufijo)].rsplit("/", 1)[-1]:
+            return ruta[:-len(sufijo)]
+    return ruta
+
+
+@dataclass
+class ImagenProcesada:
+    contenido: bytes
+    content_type: str | None
+    formato: str | None = None
+    ancho: int | None = None
+    alto: int | None = None
+    # formato -> bytes, solo las que pesan menos que la principal
+    variantes: dict[str, bytes] = field(default_factory=dict)
+
+
+def _guardar(img, formato: str, **opciones) -> bytes:
+    # Sin exif= ni xmp=: Pillow no copia los metadatos del original al guardar
+    salida = io.BytesIO()
+    icc = img.info.get("icc_profile")
+    if icc:
+        opciones["icc_profile"] = icc  # el perfil de color sí: sin él cambian los colores
+    img.save(salida, formato, **opciones)
+    return salida.getvalue()
+
+
+def procesar_imagen(contenido: bytes, content_type: str | None = None, max_lado: int = IMAGEN_MAX_LADO) -> ImagenProcesada:
+    """
+    Etapa de ingreso: aplica la orientación EXIF y descarta los metadatos, reduce a
+    `max_lado` px y recomprime en su mismo formato. Además prepara las variantes para
+    negociar por Accept: AVIF y WebP de las fotos (JPEG), y WebP sin pérdida de los PNG
+    grandes. Si Pillow no está disponible o la imagen no se puede abrir, la deja tal cual.
     """
-    Sube un archivo al bucket y devuelve la URL pública.
+    original = ImagenProcesada(contenido, content_type)
+    try:
+        from PIL import Image, ImageOps, features
+    except ImportError:
+        return original
+
+    try:
+        with Image.open(io.BytesIO(contenido)) as abierta:
+            formato = abierta.format
+            original.formato = formato
+            original.ancho, original.alto = abierta.size
+            # Las animaciones se dejan tal cual
+            if getattr(abierta, "is_animated", False) or formato not in ("JPEG", "PNG", "WEBP"):
+                return original
+
+            # Los PNG pueden traer texto en chunks tEXt/iTXt/zTXt (autor, software, rutas locales)
+            # que Pillow no expone con nombres fijos: se recodifican siempre, sin info=
+            metadatos = formato == "PNG" or any(k in abierta.info for k in ("exif", "xmp", "XML:com.adobe.xmp", "comment"))
+            img = ImageOps.exif_transpose(abierta)
+            redimensionar = max(img.size) > max_lado
+            if redimensionar:
+                img.thumbnail((max_lado, max_lado))
+
+            if formato == "JPEG":
+                principal = _guardar(img, "JPEG", quality=IMAGEN_CALIDAD, optimize=True, progressive=True)
+            elif formato == "PNG":
+                principal = _guardar(img, "PNG", optimize=True)
+            else:
+                principal = _guardar(img, "WEBP", quality=IMAGEN_CALIDAD)
+
+            variantes = {}
+            if formato == "JPEG":
+                if features.check("avif"):
+                    variantes["avif"] = _guardar(img, "AVIF", quality=IMAGEN_CALIDAD_AVIF)
+                variantes["webp"] = _guardar(img, "WEBP", quality=IMAGEN_CALIDAD)
+            elif formato == "PNG" and len(contenido) >= IMAGEN_PNG_GRANDE:
+                # AVIF no tiene modo sin pérdida en Pillow: para PNG solo WebP lossless
+                variantes["webp"] = _guardar(img, "WEBP", lossless=True, method=6)
+    except Exception:
+        return original
+
+    # Los metadatos se quitan siempre; sin ellos ni cambio de tamaño, solo si pesa menos
+    if not (redimensionar or metadatos or len(principal) < len(contenido)):
+        principal = contenido
+    return ImagenProcesada(
+        contenido=principal,
+        content_type=Image.MIME[formato],
+        formato=formato,
+        ancho=img.width,
+        alto=img.height,
+        variantes={f: datos for f, datos in variantes.items() if len(datos) < len(principal)},
+    )
+
+
+def ingerir_imagen(contenido: bytes, filename: str, content_type: str | None, bucket: str):
+    """
+    Procesa la imagen, la sube con sus variantes y la registra en la tabla Imagen con
+    los bytes originales y optimizados. Bloqueante: desde rutas async usar en_hilo(..., pool="subidas").
+    Devuelve (fila de Imagen, ruta en el bucket).
+    """
+    from sqlmodel import Session
+
+    from db import engine
+    from models import Imagen
+
+    backend = get_storage_backend()
+    procesada = procesar_imagen(contenido, content_type)
+    ruta = ruta_unica(filename)
+    backend.subir(bucket, ruta, procesada.contenido, procesada.content_type)
+    for formato, datos in procesada.variantes.items():
+        backend.subir(bucket, ruta_variante(ruta, formato), datos, VARIANTES[formato])
+
+    imagen = Imagen(
+        url=backend.url_publica(bucket, ruta),
+        formato=procesada.formato,
+        ancho=procesada.ancho,
+        alto=procesada.alto,
+        bytes_original=len(contenido),
+        bytes_optimizado=len(procesada.contenido),
+        variantes=json.dumps({
+            f: {"url": backend.url_publica(bucket, ruta_variante(ruta, f)), "bytes": len(d)}
+            for f, d in procesada.variantes.items()
+        }) if procesada.variantes else None,
+    )
+    with Session(engine) as session:
+        session.add(imagen)
+        session.commit()
+        session.refresh(imagen)
+        session.expunge(imagen)
+    return imagen, ruta
+
+
+def olvidar_imagenes(session, bucket: str, rutas: list[str]) -> int:
+    """
+    Borra las filas de Imagen de esas rutas del bucket: sin el objeto, /imagenes/{id} y
+    /img/{id} quedarían apuntando a la nada. Las rutas de variantes se ignoran (van en su fila).
+
+    La fila con el id más alto se queda aunque su objeto ya no exista (/img/{id} responde 404):
+    en tablas creadas antes de AUTOINCREMENT, SQLite le daría ese id a la próxima subida y los
+    navegadores, que guardan /img/{id} como immutable, seguirían mostrando la imagen borrada.
+    """
+    from sqlalchemy import delete, func
+    from sqlmodel import select
+
+    from models import Imagen
+    from supa import proxy
+
+    backend = get_storage_backend()
+    urls = [backend.url_publica(bucket, r) for r in rutas if ruta_base(r) == r]
+    if not urls:
+        return 0
+    ids = list(session.exec(select(Imagen.id).where(Imagen.url.in_(urls))))
+    resultado = session.execute(
+        delete(Imagen).where(
+            Imagen.url.in_(urls),
+            Imagen.id < select(func.max(Imagen.id)).scalar_subquery(),
+        )
+    )
+    session.commit()
+    proxy.olvidar(ids, urls)
+    return resultado.rowcount
+
+
+def eliminar_imagen(bucket: str, ruta: str):
+    """Borra la imagen, sus variantes (si no tiene, el borrado de esas rutas no hace nada) y su fila de Imagen."""
+    from sqlmodel import Session
+
+    from db import engine
+
+    get_storage_backend().eliminar(bucket, [ruta, *(ruta_variante(ruta, f) for f in VARIANTES)])
+    with Session(engine) as session:
+        olvidar_imagenes(session, bucket, [ruta])
+
+
+def url_negociada(imagen, accept: str) -> str:
+    """La URL de la mejor variante de `imagen` (fila de Imagen) que acepta el cliente según Accept."""
+    aceptados = set()
+    for parte in accept.split(","):
+        tipo, _, parametros = parte.strip().partition(";")
+        if parametros.replace(" ", "") not in ("q=0", "q=0.0"):
+            aceptados.add(tipo.strip())
+    disponibles = json.loads(imagen.variantes) if imagen.variantes else {}
+    for formato, content_type in VARIANTES.items():
+        if formato in disponibles and content_type in aceptados:
+            return _url_variante(imagen.url, formato, disponibles[formato])
+    return imagen.url
+
+
+def _url_variante(url: str, formato: str, variante) -> str:
+    if isinstance(variante, dict):
+        return variante["url"]
+    # Filas anteriores: solo guardaban los bytes; la URL se arma desde la ruta, no
+    # pegando la extensión a la URL (que puede terminar en "?...")
+    ubicacion = ubicar_url(url)
+    if not ubicacion:
+        return url
+    bucket, ruta = ubicacion
+    return get_storage_backend().url_publica(bucket, ruta_variante(ruta, formato))
+
+
+async def upload_to_bucket(file: UploadFile, bucket: str | None = None, content_type: str | None = None):
+    """
+    Procesa la imagen (ingerir_imagen), la sube al bucket y devuelve la URL pública.
     Genera un nombre único para evitar errores 409 (Duplicate).
 
     Parámetros:
     - file: UploadFile de FastAPI
     - bucket: nombre del bucket en Supabase. Si es None usa SUPABASE_BUCKET (valor por defecto en .env)
+    - content_type: el detectado por subidas.validar_imagen; si es None, el que declaró el cliente
     """
-    client = get_supabase_client()
-
     # usar bucket pasado o el por defecto desde .env
-    target_bucket = bucket or SUPABASE_BUCKET
+    target_bucket = bucket or BUCKET_POR_DEFECTO
 
     try:
         file_content = await file.read()
 
-        # Extraer extensión del archivo
-        ext = file.filename.split(".")[-1].lower()
-
-        # Nombre seguro + UUID
-        safe_name = sanitize_filename(file.filename.rsplit(".", 1)[0])
-        unique_name = f"{safe_name}_{uuid.uuid4()}.{ext}"
-
-        # Ruta final en supabase
-        file_path = f"public/{unique_name}"
-
-        client.storage.from_(target_bucket).upload(
-            path=file_path,
-            file=file_content,
-            file_options={
-                "content-type": file.content_type
-            }
+        # Procesar y subir es bloqueante: se hace en el pool "subidas" para no congelar el event loop
+        imagen, _ = await en_hilo(
+            ingerir_imagen, file_content, file.filename, content_type or file.content_type, target_bucket,
+            pool="subidas",
         )
 
         # URL pública
-        public_url = client.storage.from_(target_bucket).get_public_url(file_path)
-        return public_url
+        return imagen.url
 
     except Exception as e:
         raise e
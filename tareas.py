@@ -0,0 +1,411 @@
+"""
+Cola de tareas en segundo plano (dentro del mismo proceso).
+
+Las tareas se guardan en SQLite: en memoria por defecto, o en el archivo indicado
+por TAREAS_DB para que las pendientes sobrevivan a un reinicio. Un pool de hilos
+las va tomando en orden; las que fallan se reintentan con espera creciente.
+
+Tipos registrados aquí:
+- "procesar_imagen": optimiza una imagen subida, la guarda en el bucket y la asigna a su entidad
+- "borrar_imagen": elimina del bucket una imagen que quedó reemplazada
+- "calentar_cache": ejecuta los calentadores registrados con registrar_calentador()
+- "recolectar_huerfanas": borra en lotes las imágenes de los buckets que ninguna fila usa
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+from fastapi import UploadFile
+
+TAREAS_DB = os.getenv("TAREAS_DB", ":memory:")
+TAREAS_HILOS = int(os.getenv("TAREAS_HILOS", "2"))
+TAREAS_INTENTOS = int(os.getenv("TAREAS_INTENTOS", "3"))
+# Segundos que una tarea tomada es de su worker sin dar señales; vencidos, otro la retoma
+TAREAS_PLAZO_S = float(os.getenv("TAREAS_PLAZO_S", "60"))
+
+# "1" (defecto): las rutas responden sin esperar la subida; "0": se sube dentro de la petición
+IMAGENES_DIFERIDAS = os.getenv("IMAGENES_DIFERIDAS", "1") == "1"
+
+
+class ColaTareas:
+    def __init__(self, ruta: str = ":memory:", hilos: int = 2, intentos: int = 3, plazo_s: float = 60.0):
+        self.ruta = ruta
+        self.hilos = hilos
+        self.intentos = intentos
+        self.plazo_s = plazo_s
+        self._handlers: dict[str, Callable[[dict, bytes | None], dict | None]] = {}
+        self._lock = threading.Lock()
+        self._hay_trabajo = threading.Condition(self._lock)
+        self._latido = threading.Condition(self._lock)
+        self._workers: list[threading.Thread] = []
+        self._corriendo: set[int] = set()
+        self._activa = False
+        self._ultima_purga = 0.0
+        self._ultima_recuperacion = 0.0
+
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        if ruta != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tarea (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo TEXT NOT NULL,
+                clave TEXT,
+                payload TEXT NOT NULL,
+                datos BLOB,
+                estado TEXT NOT NULL DEFAULT 'pendiente',
+                intentos INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                disponible_en REAL NOT NULL,
+                creada REAL NOT NULL,
+                terminada REAL
+            )
+        """)
+        # Columnas agregadas después: las bases creadas antes no las tienen
+        for columna in ("resultado TEXT", "vence REAL"):
+            try:
+                self._conn.execute(f"ALTER TABLE tarea ADD COLUMN {columna}")
+            except sqlite3.OperationalError:
+                pass
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_tarea_estado ON tarea (estado, disponible_en)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_tarea_clave ON tarea (clave, estado)")
+
+    # ---------------------------
+    # REGISTRO Y ENCOLADO
+    # ---------------------------
+    def registrar(self, tipo: str, handler: Callable[[dict, bytes | None], dict | None]):
+        self._handlers[tipo] = handler
+
+    def encolar(self, tipo: str, payload: dict | None = None, datos: bytes | None = None,
+                clave: str | None = None, reemplazar: bool = False) -> int:
+        """
+        Agrega una tarea y despierta a un worker.
+        - clave: agrupa tareas de un mismo recurso (ej: "item:5")
+        - reemplazar: cancela las tareas pendientes con la misma clave
+        """
+        ahora = time.time()
+        with self._lock:
+            if clave and reemplazar:
+                self._conn.execute(
+                    "UPDATE tarea SET estado = 'cancelada', terminada = ? "
+                    "WHERE clave = ? AND estado IN ('pendiente', 'en_curso')",
+                    (ahora, clave)
+                )
+            cur = self._conn.execute(
+                "INSERT INTO tarea (tipo, clave, payload, datos, disponible_en, creada) VALUES (?, ?, ?, ?, ?, ?)",
+                (tipo, clave, json.dumps(payload or {}), datos, ahora, ahora)
+            )
+            self._hay_trabajo.notify()
+            return cur.lastrowid
+
+    def cancelar(self, clave: str) -> int:
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE tarea SET estado = 'cancelada', terminada = ? "
+                "WHERE clave = ? AND estado IN ('pendiente', 'en_curso')",
+                (time.time(), clave)
+            )
+            return cur.rowcount
+
+    # ---------------------------
+    # CONSULTAS
+    # ---------------------------
+    def estado(self, tarea_id: int) -> dict | None:
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT id, tipo, clave, estado, intentos, error, creada, terminada, resultado FROM tarea WHERE id = ?",
+                (tarea_id,)
+            ).fetchone()
+        if not fila:
+            return None
+        campos = ("id", "tipo", "clave", "estado", "intentos", "error", "creada", "terminada", "resultado")
+        tarea = dict(zip(campos, fila))
+        tarea["resultado"] = json.loads(tarea["resultado"]) if tarea["resultado"] else None
+        return tarea
+
+    def sigue_vigente(self, tarea_id: int) -> bool:
+        """False si la tarea fue cancelada mientras corría."""
+        with self._lock:
+            fila = self._conn.execute("SELECT estado FROM tarea WHERE id = ?", (tarea_id,)).fetchone()
+        return bool(fila) and fila[0] == "en_curso"
+
+    def pendientes(self, prefijo_clave: str) -> set[str]:
+        """Claves con tareas pendientes o en curso que empiezan con el prefijo (ej: "item:")."""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT DISTINCT clave FROM tarea WHERE clave LIKE ? AND estado IN ('pendiente', 'en_curso')",
+                (prefijo_clave + "%",)
+            ).fetchall()
+        return {f[0] for f in filas}
+
+    def purgar(self, antiguedad_s: float = 86400):
+        """Borra tareas terminadas hace más de `antiguedad_s` segundos (las fallidas se conservan)."""
+        with self._lock:
+            self._purgar_sin_lock(antiguedad_s)
+
+    def _purgar_sin_lock(self, antiguedad_s: float):
+        self._conn.execute(
+            "DELETE FROM tarea WHERE estado IN ('hecha', 'cancelada') AND terminada < ?",
+            (time.time() - antiguedad_s,)
+        )
+        self._ultima_purga = time.time()
+
+    def metricas(self) -> dict:
+        with self._lock:
+            filas = self._conn.execute("SELECT estado, COUNT(*) FROM tarea GROUP BY estado").fetchall()
+            espera = self._conn.execute(
+                "SELECT MIN(creada) FROM tarea WHERE estado = 'pendiente'"
+            ).fetchone()[0]
+        conteo = dict(filas)
+        return {
+            "hilos": self.hilos,
+            "persistente": self.ruta != ":memory:",
+            "pendientes": conteo.get("pendiente", 0),
+            "en_curso": conteo.get("en_curso", 0),
+            "hechas": conteo.get("hecha", 0),
+            "fallidas": conteo.get("fallida", 0),
+            "canceladas": conteo.get("cancelada", 0),
+            "espera_mas_antigua_s": (time.time() - espera) if espera else 0.0,
+        }
+
+    # ---------------------------
+    # WORKERS
+    # ---------------------------
+    def _tomar(self) -> tuple | None:
+        # Un solo UPDATE: con TAREAS_DB compartido entre procesos, el candado de este no basta
+        # y un SELECT seguido de UPDATE dejaría a dos workers tomar la misma tarea
+        ahora = time.time()
+        fila = self._conn.execute(
+            "UPDATE tarea SET estado = 'en_curso', intentos = intentos + 1, vence = ? "
+            "WHERE id = (SELECT id FROM tarea WHERE estado = 'pendiente' AND disponible_en <= ? "
+            "ORDER BY id LIMIT 1) AND estado = 'pendiente' "
+            "RETURNING id, tipo, payload, datos, intentos - 1",
+            (ahora + self.plazo_s, ahora)
+        ).fetchone()
+        if fila:
+            self._corriendo.add(fila[0])
+        return fila
+
+    def _recuperar_vencidas(self) -> int:
+        # En curso sin latido dentro del plazo: su worker murió (o el proceso se reinició)
+        cur = self._conn.execute(
+            "UPDATE tarea SET estado = 'pendiente' WHERE estado = 'en_curso' AND (vence IS NULL OR vence < ?)",
+            (time.time(),)
+        )
+        self._ultima_recuperacion = time.time()
+        return cur.rowcount
+
+    def _latir(self):
+        # Extiende el plazo de las tareas que corren en este proceso mientras sigan corriendo
+        with self._lock:
+            while self._activa:
+                if self._corriendo:
+                    marcas = ",".join("?" * len(self._corriendo))
+                    self._conn.execute(
+                        f"UPDATE tarea SET vence = ? WHERE estado = 'en_curso' AND id IN ({marcas})",
+                        (time.time() + self.plazo_s, *self._corriendo)
+                    )
+                self._latido.wait(timeout=self.plazo_s / 3)
+
+    def _terminar(self, tarea_id: int, error: str | None, intentos: int, resultado: dict | None = None):
+        with self._lock:
+            self._corriendo.discard(tarea_id)
+            if error is None:
+                self._conn.execute(
+                    "UPDATE tarea SET estado = 'hecha', datos = NULL, resultado = ?, terminada = ? "
+                    "WHERE id = ? AND estado = 'en_curso'",
+                    (json.dumps(resultado, default=str) if resultado is not None else None, time.time(), tarea_id)
+                )
+            elif intentos >= self.intentos:
+                self._conn.execute(
+                    "UPDATE tarea SET estado = 'fallida', error = ?, terminada = ? "
+                    "WHERE id = ? AND estado = 'en_curso'",
+                    (error, time.time(), tarea_id)
+                )
+            else:
+                # Reintento con espera creciente: 2s, 4s, 8s...
+                self._conn.execute(
+                    "UPDATE tarea SET estado = 'pendiente', error = ?, disponible_en = ? "
+                    "WHERE id = ? AND estado = 'en_curso'",
+                    (error, time.time() + 2 ** intentos, tarea_id)
+                )
+                self._hay_trabajo.notify()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while self._activa:
+                    fila = self._tomar()
+                    if fila:
+                        break
+                    # Sin trabajo disponible: dormir hasta que encolen o venza un reintento
+                    self._hay_trabajo.wait(timeout=1.0)
+                    if time.time() - self._ultima_purga > 3600:
+                        self._purgar_sin_lock(86400)
+                    if time.time() - self._ultima_recuperacion > self.plazo_s:
+                        self._recuperar_vencidas()
+                else:
+                    return
+
+            tarea_id, tipo, payload, datos, intentos = fila
+            handler = self._handlers.get(tipo)
+            try:
+                if handler is None:
+                    raise LookupError(f"Tipo de tarea sin handler: {tipo}")
+                payload = json.loads(payload)
+                payload["_tarea_id"] = tarea_id
+                resultado = handler(payload, datos)
+                self._terminar(tarea_id, None, intentos + 1, resultado)
+            except Exception as e:
+                self._terminar(tarea_id, f"{type(e).__name__}: {e}", intentos + 1)
+
+    def iniciar(self):
+        with self._lock:
+            if self._activa:
+                return
+            self._activa = True
+            # Lo que quedó "en_curso" de un proceso caído se vuelve a intentar; lo que otro
+            # proceso vivo con el mismo TAREAS_DB está corriendo sigue siendo suyo
+            self._recuperar_vencidas()
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"tareas-{n}", daemon=True)
+            for n in range(self.hilos)
+        ]
+        self._workers.append(threading.Thread(target=self._latir, name="tareas-latido", daemon=True))
+        for w in self._workers:
+            w.start()
+
+    def detener(self, timeout: float = 10.0):
+        with self._lock:
+            self._activa = False
+            self._hay_trabajo.notify_all()
+            self._latido.notify_all()
+        for w in self._workers:
+            w.join(timeout=timeout)
+        self._workers = []
+
+
+cola = ColaTareas(TAREAS_DB, hilos=TAREAS_HILOS, intentos=TAREAS_INTENTOS, plazo_s=TAREAS_PLAZO_S)
+
+# Funciones que recalculan cachés (se registran desde los módulos que tengan caché)
+_calentadores: list[Callable[[], None]] = []
+
+
+def registrar_calentador(fn: Callable[[], None]):
+    _calentadores.append(fn)
+    return fn
+
+
+# ---------------------------
+# HANDLERS
+# ---------------------------
+def _procesar_imagen(payload: dict, datos: bytes | None):
+    import crud
+    from db import engine
+    from sqlmodel import Session
+    from supa.supabase import eliminar_imagen, ingerir_imagen
+
+    bucket = payload["bucket"]
+    imagen, ruta = ingerir_imagen(datos or b"", payload["filename"], payload.get("content_type"), bucket)
+
+    # Si mientras tanto se subió otra imagen o se borró la actual, esta ya no sirve
+    if not cola.sigue_vigente(payload["_tarea_id"]):
+        eliminar_imagen(bucket, ruta)
+        return
+
+    with Session(engine) as session:
+        crud.asignar_imagen(session, payload["entidad"], payload["entidad_id"], imagen.url)
+
+
+def _borrar_imagen(payload: dict, datos: bytes | None):
+    from supa.supabase import eliminar_imagen, ubicar_url
+
+    ubicacion = ubicar_url(payload["url"])
+    if ubicacion:
+        eliminar_imagen(*ubicacion)
+
+
+def _calentar_cache(payload: dict, datos: bytes | None):
+    for calentador in list(_calentadores):
+        calentador()
+
+
+def _recolectar_huerfanas(payload: dict, datos: bytes | None):
+    from db import engine
+    from sqlmodel import Session
+    from supa.recolector import recolectar_huerfanas
+
+    with Session(engine) as session:
+        return recolectar_huerfanas(
+            session,
+            dry_run=payload.get("dry_run", True),
+            lote=payload.get("lote", 100),
+            pausa=payload.get("pausa", 1.0),
+        )
+
+
+cola.registrar("procesar_imagen", _procesar_imagen)
+cola.registrar("borrar_imagen", _borrar_imagen)
+cola.registrar("calentar_cache", _calentar_cache)
+cola.registrar("recolectar_huerfanas", _recolectar_huerfanas)
+
+
+# ---------------------------
+# AYUDAS PARA LAS RUTAS
+# ---------------------------
+async def leer_imagen(imagen: UploadFile, content_type: str | None = None) -> dict:
+    """Lee el archivo subido para dejarlo en la cola (la petición termina antes de procesarlo)."""
+    return {
+        "filename": imagen.filename,
+        "content_type": content_type or imagen.content_type,
+        "datos": await imagen.read(),
+    }
+
+
+def encolar_imagen(entidad: str, entidad_id: int, imagen: dict, bucket: str | None) -> int:
+    """
+    Encola el procesamiento de una imagen para la entidad. Cancela cualquier imagen
+    anterior de la misma entidad que todavía no se haya terminado de procesar.
+    """
+    from supa.supabase import BUCKETS
+
+    return cola.encolar(
+        "procesar_imagen",
+        {
+            "entidad": entidad,
+            "entidad_id": entidad_id,
+            "bucket": bucket or BUCKETS[entidad],
+            "filename": imagen["filename"],
+            "content_type": imagen["content_type"],
+        },
+        datos=imagen["datos"],
+        clave=f"{entidad}:{entidad_id}",
+        reemplazar=True,
+    )
+
+
+def imagen_pendiente(entidad: str, entidad_id: int) -> bool:
+    return f"{entidad}:{entidad_id}" in cola.pendientes(f"{entidad}:{entidad_id}")
+
+
+def ids_con_imagen_pendiente(entidad: str) -> set[int]:
+    return {int(c.split(":", 1)[1]) for c in cola.pendientes(f"{entidad}:")}
+
+
+async def preparar_imagen(imagen: UploadFile, bucket: str | None) -> tuple[str | None, dict | None]:
+    """
+    Paso común de las rutas de creación/actualización. Devuelve (imagen_url, pendiente):
+    - con IMAGENES_DIFERIDAS: (None, imagen leída) → llamar encolar_imagen() cuando exista la entidad
+    - sin IMAGENES_DIFERIDAS: (url ya subida, None)
+    Lanza subidas.ImagenInvalida si el archivo no es una imagen aceptable.
+    """
+    from subidas import validar_imagen
+    from supa.supabase import upload_to_bucket
+
+    info = await validar_imagen(imagen)
+    if IMAGENES_DIFERIDAS:
+        return None, await leer_imagen(imagen, info.content_type)
+    return await upload_to_bucket(imagen, bucket=bucket, content_type=info.content_type), None
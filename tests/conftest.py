@@ -0,0 +1,87 @@
+"""
+Configuración común de las pruebas.
+
+Base SQLite temporal, storage en memoria, caché compartida en un directorio temporal y el
+modo guardia contra N+1 (DB_SIN_LAZY=1): una ruta o plantilla que cargue una relación sin
+pedirla falla aquí. Los módulos leen las variables al importarse, así que se fijan antes
+de importar la app.
+
+Uso:
+    python -m pytest -q
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+DIRECTORIO = tempfile.mkdtemp(prefix="blasphemous-pruebas-")
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(DIRECTORIO, 'pruebas.db')}",
+    "DB_ECHO": "0",
+    "DB_SIN_LAZY": "1",
+    "STORAGE_BACKEND": "memoria",
+    "CACHE_BACKEND": "compartida",
+    "CACHE_RUTA": os.path.join(DIRECTORIO, "cache.db"),
+    "INSTANTANEA_RUTA": os.path.join(DIRECTORIO, "instantanea.bin"),
+    "IMG_CACHE_DIR": os.path.join(DIRECTORIO, "img"),
+    # Las pruebas hacen muchas escrituras seguidas desde el mismo cliente
+    "ADMISION_SUBIDAS_TASA": "10000",
+    "ADMISION_SUBIDAS_RAFAGA": "10000",
+    "ADMISION_ESCRITURAS_TASA": "10000",
+    "ADMISION_ESCRITURAS_RAFAGA": "10000",
+})
+
+# crud antes que archivo: importar archivo primero cierra un ciclo de imports
+import main  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlmodel import Session  # noqa: E402
+
+import crud  # noqa: E402
+from db import engine  # noqa: E402
+from schemas import ItemCreate  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DIRECTORIO, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def cliente():
+    # Con el lifespan: tablas, índices en memoria, instantánea y cola de tareas
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def session(cliente):
+    with Session(engine) as s:
+        s.info["sin_lazy"] = True
+        yield s
+
+
+@pytest.fixture
+def catalogo(session):
+    """Una categoría, una ubicación, una interacción y dos ítems enlazados a ellas."""
+    cat = crud.create_categoria(session, "Reliquias", "de prueba")
+    ubi = crud.create_ubicacion(session, "Albero", "pueblo", "de prueba")
+    inter = crud.create_interaccion(session, "Rezar")
+    items = [
+        crud.crear_item(session, ItemCreate(
+            nombre=nombre,
+            descripcion="de prueba",
+            costo=costo,
+            indispensable=indispensable,
+            categoria_ids=[cat.id],
+            ubicacion_ids=[ubi.id],
+            interaccion_ids=[inter.id],
+        ))
+        for nombre, costo, indispensable in (("Cuenta de rosario", 100, True), ("Corazón de espadas", 250, False))
+    ]
+    return {"categoria": cat, "ubicacion": ubi, "interaccion": inter, "items": items}
@@ -0,0 +1,99 @@
+"""Control de admisión: clase de cada ruta, cubetas por cliente y compuerta de concurrencia."""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+import admision
+from admision import ClaseAdmision, Compuerta, Cubetas, Rechazo, clase_de
+
+
+def test_clase_de_cada_ruta():
+    subidas, escrituras = admision.CLASES["subidas"], admision.CLASES["escrituras"]
+    assert clase_de("GET", "/items/") is None
+    assert clase_de("HEAD", "/imagenes/upload") is None
+    assert clase_de("POST", "/imagenes/upload") is subidas
+    # Los formularios de alta y edición reciben la imagen: cuentan como subidas
+    assert clase_de("POST", "/items/") is subidas
+    assert clase_de("POST", "/categorias") is subidas
+    assert clase_de("PUT", "/ubicaciones/3") is subidas
+    assert clase_de("PUT", "/interacciones/3/") is subidas
+    assert clase_de("PUT", "/items/3/restaurar") is escrituras
+    assert clase_de("DELETE", "/items/3") is escrituras
+    assert clase_de("POST", "/imagenes/huerfanas/recolectar") is escrituras
+
+
+def test_cubeta_por_cliente():
+    cubetas = Cubetas(tasa=1, rafaga=2)
+    assert cubetas.tomar("a") == 0
+    assert cubetas.tomar("a") == 0
+    assert cubetas.tomar("a") > 0
+    # Otro cliente tiene su propia cubeta
+    assert cubetas.tomar("b") == 0
+
+
+def test_cubetas_olvidan_a_los_menos_recientes():
+    cubetas = Cubetas(tasa=1, rafaga=1, max_clientes=2)
+    for cliente in ("a", "b", "c"):
+        cubetas.tomar(cliente)
+    assert cubetas.clientes == 2
+    assert cubetas.tomar("a") == 0  # volvió con la cubeta llena
+
+
+def test_compuerta_descartar():
+    async def probar():
+        compuerta = Compuerta(concurrentes=1, cola_max=10, espera_max=1, modo="descartar")
+        await compuerta.entrar()
+        with pytest.raises(Rechazo) as error:
+            await compuerta.entrar()
+        assert error.value.estado == 503
+        compuerta.salir()
+        await compuerta.entrar()
+        assert compuerta.activas == 1
+
+    asyncio.run(probar())
+
+
+def test_compuerta_cola_cede_el_cupo():
+    async def probar():
+        compuerta = Compuerta(concurrentes=1, cola_max=1, espera_max=1, modo="cola")
+        await compuerta.entrar()
+        esperando = asyncio.create_task(compuerta.entrar())
+        await asyncio.sleep(0)
+        assert compuerta.en_cola == 1
+        # La cola está llena: el tercero se rechaza enseguida
+        with pytest.raises(Rechazo):
+            await compuerta.entrar()
+        compuerta.salir()
+        await esperando
+        assert compuerta.activas == 1 and compuerta.en_cola == 0
+
+    asyncio.run(probar())
+
+
+def test_compuerta_cola_vence():
+    async def probar():
+        compuerta = Compuerta(concurrentes=1, cola_max=1, espera_max=0.05, modo="cola")
+        await compuerta.entrar()
+        with pytest.raises(Rechazo) as error:
+            await compuerta.entrar()
+        assert error.value.estado == 503
+        assert compuerta.en_cola == 0
+
+    asyncio.run(probar())
+
+
+def test_middleware_responde_429(monkeypatch):
+    monkeypatch.setitem(admision.CLASES, "escrituras", ClaseAdmision(
+        "escrituras", tasa=0.01, rafaga=1, concurrentes=1, cola_max=0, espera_max=0.1, modo="cola",
+    ))
+    cliente = TestClient(admision.Admision(PlainTextResponse("ok")))
+
+    assert cliente.delete("/items/1").status_code == 200
+    respuesta = cliente.delete("/items/1")
+    assert respuesta.status_code == 429
+    assert int(respuesta.headers["retry-after"]) >= 1
+    # Las lecturas no pasan por la admisión
+    assert cliente.get("/items/1").status_code == 200
+    assert admision.CLASES["escrituras"].metricas()["limitadas"] == 1
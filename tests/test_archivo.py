@@ -0,0 +1,60 @@
+"""Archivado de filas eliminadas: ida y vuelta, y ids que no se reutilizan."""
+from sqlmodel import select
+
+import archivo
+import crud
+from models import Archivado, Item
+from schemas import ItemCreate
+
+
+def _archivar(session):
+    return archivo.archivar(session, retencion_dias=0, dry_run=False)
+
+
+def test_archivar_y_restaurar(catalogo, session):
+    # archivar() desprende los objetos de la sesión: se guardan los valores antes
+    item_id, nombre = catalogo["items"][0].id, catalogo["items"][0].nombre
+    cat_id, ubi_id = catalogo["categoria"].id, catalogo["ubicacion"].id
+    crud.delete_item(session, item_id)
+
+    reporte = _archivar(session)
+    assert reporte["entidades"]["item"]["archivadas"] >= 1
+    assert session.get(Item, item_id) is None
+    assert session.exec(select(Archivado).where(Archivado.entidad == "item", Archivado.entidad_id == item_id)).first()
+
+    # Sigue en la lista de eliminados, con sus enlaces
+    eliminados = {f.id: f for f in crud.listar_items_eliminados(session)}
+    assert eliminados[item_id].categoria_ids == [cat_id]
+
+    assert crud.restaurar_item(session, item_id)
+    fila = crud.get_item(session, item_id)
+    assert fila["nombre"] == nombre
+    assert fila["categoria_ids"] == [cat_id]
+    assert fila["ubicacion_ids"] == [ubi_id]
+
+
+def test_restaurar_por_http(catalogo, session, cliente):
+    item_id, nombre = catalogo["items"][0].id, catalogo["items"][0].nombre
+    crud.delete_item(session, item_id)
+    _archivar(session)
+
+    assert cliente.put(f"/items/{item_id}/restaurar").status_code == 200
+    respuesta = cliente.get(f"/items/{item_id}")
+    assert respuesta.status_code == 200
+    assert nombre in respuesta.text
+
+
+def test_ids_archivados_no_se_reutilizan(catalogo, session):
+    anterior_id, ultimo_id = catalogo["items"][0].id, catalogo["items"][-1].id
+    crud.delete_item(session, ultimo_id)
+    _archivar(session)
+    # La fila con el id más alto no se archiva: SQLite sin AUTOINCREMENT daría max(id) + 1
+    assert session.get(Item, ultimo_id) is not None
+
+    crud.delete_item(session, anterior_id)
+    _archivar(session)
+    assert session.get(Item, anterior_id) is None
+
+    nuevo = crud.crear_item(session, ItemCreate(nombre="Nuevo tras archivar"))
+    assert nuevo.id > ultimo_id
+    assert nuevo.id not in {a.entidad_id for a in session.exec(select(Archivado).where(Archivado.entidad == "item"))}
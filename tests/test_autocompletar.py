@@ -0,0 +1,18 @@
+"""Autocompletar con el índice de prefijos."""
+import crud
+from indices.prefijos import TOP_POR_NODO
+from schemas import ItemCreate
+
+
+def test_autocompletar_filtra_por_tipo(session, cliente):
+    # Más ítems que TOP_POR_NODO con el mismo prefijo: la categoría no debe quedar tapada
+    for i in range(TOP_POR_NODO + 10):
+        crud.crear_item(session, ItemCreate(nombre=f"Zafiro {i:03d}"))
+    categoria = crud.create_categoria(session, "Zafiros sagrados")
+
+    sugerencias = cliente.get("/busqueda/autocompletar", params={"q": "zaf", "tipos": "categoria"}).json()
+    assert [(s["tipo"], s["id"]) for s in sugerencias] == [("categoria", categoria.id)]
+
+    sugerencias = cliente.get("/busqueda/autocompletar", params={"q": "zaf", "tipos": "item", "limite": TOP_POR_NODO}).json()
+    assert len(sugerencias) == TOP_POR_NODO
+    assert {s["tipo"] for s in sugerencias} == {"item"}
@@ -0,0 +1,74 @@
+"""Índice de bitmaps: mismos resultados que SQL, también con escrituras de otros workers."""
+from sqlmodel import select
+
+import crud
+from cache import Vigencia, cache
+from indices.bitmap import indice_bitmap
+from models import Item, ItemCategoriaLink
+
+
+def _ids(filas):
+    return sorted(f.id for f in filas)
+
+
+def _por_bitmap_y_sql(session, **filtros):
+    # orden="id" usa el índice de bitmaps; cualquier otro orden va directo a SQL
+    return _ids(crud.buscar_items(session, **filtros)), _ids(crud.buscar_items(session, orden="nombre", **filtros))
+
+
+def test_bitmap_igual_a_sql(catalogo, session):
+    cat_id = catalogo["categoria"].id
+    activo, eliminado = catalogo["items"][0].id, catalogo["items"][1].id
+    crud.delete_item(session, eliminado)
+    assert indice_bitmap.listo and indice_bitmap.al_dia()
+
+    for filtros in (
+        {"categoria_id": cat_id},
+        {"categoria_id": cat_id, "indispensable": True},
+        {"ubicacion_id": catalogo["ubicacion"].id, "costo_min": 50, "costo_max": 150},
+        {"interaccion_id": catalogo["interaccion"].id, "nombre": "rosario"},
+    ):
+        por_bitmap, por_sql = _por_bitmap_y_sql(session, **filtros)
+        assert por_bitmap == por_sql, filtros
+        assert eliminado not in por_bitmap
+    assert _por_bitmap_y_sql(session, categoria_id=cat_id)[0] == [activo]
+    assert crud.contar_items(session, categoria_id=cat_id) == 1
+
+
+def test_bitmap_ve_escrituras_de_otro_worker(catalogo, session):
+    cat_id = catalogo["categoria"].id
+    # Otro worker: escribe en la base y sube la generación compartida, sin eventos en este proceso
+    item = Item(nombre="Escrito por otro worker")
+    session.add(item)
+    session.flush()
+    session.add(ItemCategoriaLink(item_id=item.id, categoria_id=cat_id))
+    session.commit()
+    cache.backend.invalidar("item")
+
+    assert not indice_bitmap.al_dia()
+    por_bitmap, por_sql = _por_bitmap_y_sql(session, categoria_id=cat_id)
+    assert item.id in por_bitmap
+    assert por_bitmap == por_sql
+
+    # Y si otro worker elimina, el ítem no aparece aunque el índice no se haya enterado
+    session.exec(select(Item).where(Item.id == item.id)).one().activo = False
+    session.commit()
+    assert item.id not in _por_bitmap_y_sql(session, categoria_id=cat_id)[0]
+
+
+def test_vigencia_distingue_escrituras_propias_de_ajenas(cliente):
+    vigencia = Vigencia(("categoria",))
+    vigencia.fijar(vigencia.marcar())
+    assert vigencia.vigente()
+
+    cache.invalidar("categoria")  # escritura de este proceso: el índice ya la aplicó por evento
+    assert vigencia.vigente()
+
+    cache.backend.invalidar("categoria")  # otro worker
+    assert not vigencia.vigente()
+
+    # Hasta que el índice nuevo reemplaza al anterior, sigue sin estar vigente
+    marca = vigencia.marcar()
+    assert not vigencia.vigente()
+    vigencia.fijar(marca)
+    assert vigencia.vigente()
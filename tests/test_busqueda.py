@@ -0,0 +1,15 @@
+"""Filtros de /items/search."""
+
+
+def test_filtros_enteros(catalogo, cliente):
+    assert cliente.get("/items/search?costo_min=1.5").status_code == 422
+    assert cliente.get("/items/search?categoria_id=abc").status_code == 422
+
+    # Los campos vacíos del formulario son "sin filtro"; sin formato=json responde HTML
+    respuesta = cliente.get("/items/search?categoria_id=&costo_min=&costo_max=&nombre=rosario")
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"].startswith("text/html")
+
+    respuesta = cliente.get(f"/items/search?categoria_id={catalogo['categoria'].id}&formato=json")
+    assert respuesta.headers["content-type"].startswith("application/json")
+    assert catalogo["items"][0].id in {f["id"] for f in respuesta.json()["items"]}
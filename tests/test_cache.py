@@ -0,0 +1,47 @@
+"""Caché compartida: directorio privado y lecturas de réplicas."""
+import os
+import stat
+
+import pytest
+from sqlalchemy import create_engine
+from sqlmodel import Session
+
+import crud
+from cache import directorio_privado
+from db import engine
+
+
+def test_directorio_privado(tmp_path):
+    ruta = directorio_privado(str(tmp_path))
+    assert stat.S_IMODE(os.lstat(ruta).st_mode) == 0o700
+    assert directorio_privado(str(tmp_path)) == ruta
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="sin permisos POSIX")
+def test_directorio_privado_rechaza_abierto_o_enlace(tmp_path):
+    ruta = tmp_path / f"blasphemous-{os.getuid()}"
+    ruta.mkdir(mode=0o777)
+    os.chmod(ruta, 0o777)
+    with pytest.raises(RuntimeError):
+        directorio_privado(str(tmp_path))
+
+    otro = tmp_path / "otro"
+    otro.mkdir()
+    (otro / f"blasphemous-{os.getuid()}").symlink_to(tmp_path / "destino")
+    (tmp_path / "destino").mkdir(mode=0o700)
+    with pytest.raises(RuntimeError):
+        directorio_privado(str(otro))
+
+
+def test_lo_leido_de_una_replica_no_se_sirve_desde_la_primaria(cliente, session, tmp_path):
+    # Réplica atrasada: copia de la base antes de la escritura
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    with engine.connect() as origen, replica.connect() as destino:
+        origen.connection.driver_connection.backup(destino.connection.driver_connection)
+
+    crud.create_categoria(session, "Escrita en la primaria")
+    with Session(replica) as en_replica:
+        assert "Escrita en la primaria" not in {c.nombre for c in crud.list_categorias(en_replica)}
+    # Misma función, mismos argumentos y misma generación: no debe tocarle lo de la réplica
+    assert "Escrita en la primaria" in {c.nombre for c in crud.list_categorias(session)}
+    replica.dispose()
@@ -0,0 +1,75 @@
+"""Pool acotado para llamadas bloqueantes: cupos, rechazos y cancelaciones."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ejecutor import Ejecutor, EjecutorSaturado
+
+
+@pytest.fixture
+def ejecutor():
+    e = Ejecutor("prueba", hilos=1, cola_max=0, espera_max=0.05)
+    yield e
+    e.cerrar()
+
+
+def test_rechaza_cuando_no_hay_cupo(ejecutor):
+    async def probar():
+        lenta = asyncio.create_task(ejecutor.ejecutar(time.sleep, 0.2))
+        await asyncio.sleep(0.01)
+        with pytest.raises(EjecutorSaturado):
+            await ejecutor.ejecutar(time.sleep, 0)
+        await lenta
+        # Terminada la lenta, el cupo volvió
+        assert await ejecutor.ejecutar(lambda: "ok") == "ok"
+
+    asyncio.run(probar())
+    metricas = ejecutor.metricas()
+    assert metricas["rechazadas"] == 1
+    assert metricas["completadas"] == 2
+    assert metricas["esperando_cupo"] == 0
+
+
+def test_espera_turno_sin_ocupar_hilos():
+    ejecutor = Ejecutor("prueba", hilos=1, cola_max=0, espera_max=2)
+    hilos = set()
+
+    def anotar():
+        hilos.add(threading.current_thread().name)
+        time.sleep(0.05)
+
+    async def probar():
+        await asyncio.gather(*(ejecutor.ejecutar(anotar) for _ in range(4)))
+
+    try:
+        asyncio.run(probar())
+    finally:
+        ejecutor.cerrar()
+    # Todo corrió en el único hilo del pool, de a una
+    assert len(hilos) == 1 and next(iter(hilos)).startswith("ejecutor-prueba")
+    assert ejecutor.metricas()["completadas"] == 4
+
+
+def test_cancelar_la_espera_devuelve_el_cupo():
+    ejecutor = Ejecutor("prueba", hilos=1, cola_max=0, espera_max=2)
+
+    async def probar():
+        lenta = asyncio.create_task(ejecutor.ejecutar(time.sleep, 0.1))
+        await asyncio.sleep(0.01)
+        esperando = asyncio.create_task(ejecutor.ejecutar(time.sleep, 0))
+        await asyncio.sleep(0.01)
+        assert ejecutor.metricas()["esperando_cupo"] == 1
+        esperando.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await esperando
+        await lenta
+        # Si el cupo se hubiera perdido, esta esperaría hasta vencer
+        assert await asyncio.wait_for(ejecutor.ejecutar(lambda: 1), 1) == 1
+
+    try:
+        asyncio.run(probar())
+    finally:
+        ejecutor.cerrar()
+    assert ejecutor.metricas()["esperando_cupo"] == 0
@@ -0,0 +1,178 @@
+"""Ingreso de imágenes, variantes por Accept y recolector de huérfanas (con su ruta de administración)."""
+import datetime
+import io
+import json
+
+import pytest
+from PIL import Image, PngImagePlugin
+from sqlmodel import select
+
+import admin
+import crud
+from models import Imagen
+from supa import supabase
+from supa.almacenamiento import AlmacenamientoMemoria
+from supa.recolector import GRACIA_MINUTOS, recolectar_huerfanas
+
+BUCKET = supabase.BUCKET_POR_DEFECTO
+
+
+def _jpeg() -> bytes:
+    salida = io.BytesIO()
+    Image.new("RGB", (400, 300), (200, 40, 40)).save(salida, "JPEG", quality=98)
+    return salida.getvalue()
+
+
+class MemoriaConQuery(AlmacenamientoMemoria):
+    """Como get_public_url de Supabase, que puede dejar un query string al final."""
+
+    def url_publica(self, bucket, ruta):
+        return super().url_publica(bucket, ruta) + "?v=1"
+
+    def ruta_desde_url(self, bucket, url):
+        base = self.url_publica(bucket, "").split("?", 1)[0]
+        if not url or not url.startswith(base):
+            return None
+        return url[len(base):].split("?", 1)[0] or None
+
+
+@pytest.fixture
+def backend_con_query(cliente):
+    anterior = supabase.get_storage_backend()
+    backend = MemoriaConQuery()
+    supabase.set_storage_backend(backend)
+    yield backend
+    supabase.set_storage_backend(anterior)
+
+
+# ---------------------------
+# INGRESO Y VARIANTES
+# ---------------------------
+def test_variantes_con_query_string(backend_con_query):
+    imagen, ruta = supabase.ingerir_imagen(_jpeg(), "foto.jpg", "image/jpeg", BUCKET)
+    variantes = json.loads(imagen.variantes)
+    assert "webp" in variantes
+
+    url = supabase.url_negociada(imagen, "image/webp,*/*")
+    assert url == variantes["webp"]["url"]
+    assert url.endswith(".webp?v=1") and url.count("?") == 1
+    assert backend_con_query.leer(BUCKET, supabase.ruta_variante(ruta, "webp"))
+    assert supabase.url_negociada(imagen, "image/jpeg") == imagen.url
+
+
+def test_variantes_de_filas_viejas(backend_con_query):
+    # Antes solo se guardaban los bytes de cada variante
+    url = backend_con_query.url_publica(BUCKET, "public/vieja.jpg")
+    vieja = Imagen(url=url, variantes=json.dumps({"webp": 100}))
+    assert supabase.url_negociada(vieja, "image/webp") == backend_con_query.url_publica(BUCKET, "public/vieja.jpg.webp")
+
+
+def test_negociacion_por_accept(cliente):
+    respuesta = cliente.post("/imagenes/upload", files={"file": ("foto.jpg", _jpeg(), "image/jpeg")})
+    imagen_id = respuesta.json()["id"]
+
+    redireccion = cliente.get(f"/imagenes/{imagen_id}", headers={"Accept": "image/webp"}, follow_redirects=False)
+    assert redireccion.status_code == 307
+    assert redireccion.headers["location"].endswith(".webp")
+    assert redireccion.headers["vary"] == "Accept"
+    sin_variante = cliente.get(f"/imagenes/{imagen_id}", headers={"Accept": "image/jpeg"}, follow_redirects=False)
+    assert sin_variante.headers["location"] == respuesta.json()["url"]
+
+
+def test_png_sin_chunks_de_texto():
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Author", "nombre-secreto")
+    info.add_itxt("Comment", "ruta-privada", zip=True)
+    salida = io.BytesIO()
+    Image.new("RGB", (40, 40)).save(salida, "PNG", pnginfo=info)
+
+    procesada = supabase.procesar_imagen(salida.getvalue(), "image/png")
+    assert procesada.formato == "PNG"
+    with Image.open(io.BytesIO(procesada.contenido)) as img:
+        assert "Author" not in img.info and "Comment" not in img.info
+    assert b"nombre-secreto" not in procesada.contenido
+
+
+def test_jpeg_sin_exif():
+    exif = Image.Exif()
+    exif[0x010F] = "Fabricante"
+    salida = io.BytesIO()
+    Image.new("RGB", (40, 40)).save(salida, "JPEG", exif=exif)
+
+    procesada = supabase.procesar_imagen(salida.getvalue(), "image/jpeg")
+    with Image.open(io.BytesIO(procesada.contenido)) as img:
+        assert "exif" not in img.info
+
+
+# ---------------------------
+# RECOLECTOR Y BORRADO
+# ---------------------------
+def _fila(session, imagen_id):
+    session.expire_all()
+    return session.exec(select(Imagen).where(Imagen.id == imagen_id)).first()
+
+
+def test_recolector_borra_huerfanas_con_su_fila(session):
+    backend = supabase.get_storage_backend()
+    usada, ruta_usada = supabase.ingerir_imagen(_jpeg(), "usada.jpg", "image/jpeg", BUCKET)
+    huerfana, ruta_huerfana = supabase.ingerir_imagen(_jpeg(), "huerfana.jpg", "image/jpeg", BUCKET)
+    crud.create_categoria(session, "Con imagen", imagen_url=usada.url)
+    # La fila con el id más alto no se borra (ver olvidar_imagenes): que no sea la huérfana
+    posterior, _ = supabase.ingerir_imagen(_jpeg(), "posterior.jpg", "image/jpeg", BUCKET)
+    crud.create_categoria(session, "Con la posterior", imagen_url=posterior.url)
+
+    reporte = recolectar_huerfanas(session, dry_run=False, pausa=0, gracia_minutos=-1)
+    assert reporte["buckets"][BUCKET]["eliminados"] >= 1
+
+    # La referenciada sigue, con sus variantes y su fila (/imagenes/{id} y /img/{id} la usan)
+    assert backend.leer(BUCKET, ruta_usada)
+    assert backend.leer(BUCKET, supabase.ruta_variante(ruta_usada, "webp"))
+    assert _fila(session, usada.id) is not None
+    # La huérfana se fue del bucket y de la tabla
+    assert backend.leer(BUCKET, ruta_huerfana) is None
+    assert backend.leer(BUCKET, supabase.ruta_variante(ruta_huerfana, "webp")) is None
+    assert _fila(session, huerfana.id) is None
+
+
+def test_recolector_dry_run_no_borra(session):
+    imagen, ruta = supabase.ingerir_imagen(_jpeg(), "sola.jpg", "image/jpeg", BUCKET)
+    reporte = recolectar_huerfanas(session, dry_run=True, gracia_minutos=-1)
+    assert ruta in reporte["buckets"][BUCKET]["muestras"]
+    assert supabase.get_storage_backend().leer(BUCKET, ruta)
+    assert _fila(session, imagen.id) is not None
+
+
+def test_eliminar_imagen_borra_su_fila(session):
+    imagen, ruta = supabase.ingerir_imagen(_jpeg(), "borrar.jpg", "image/jpeg", BUCKET)
+    supabase.eliminar_imagen(BUCKET, ruta)
+    assert supabase.get_storage_backend().leer(BUCKET, ruta) is None
+    # Es la fila más alta: se queda para que su id no se reutilice
+    assert _fila(session, imagen.id) is not None
+
+    posterior, _ = supabase.ingerir_imagen(_jpeg(), "posterior.jpg", "image/jpeg", BUCKET)
+    supabase.eliminar_imagen(BUCKET, ruta)
+    assert _fila(session, imagen.id) is None
+    assert posterior.id > imagen.id
+
+
+def test_recolectar_por_http_pide_token(cliente, monkeypatch):
+    ruta = "/imagenes/huerfanas/recolectar"
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "")
+    assert cliente.post(ruta).status_code == 403
+    assert cliente.get("/imagenes/huerfanas").status_code == 403
+
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secreto")
+    assert cliente.post(ruta).status_code == 401
+    assert cliente.post(ruta, headers={"X-Admin-Token": "otro"}).status_code == 401
+    assert cliente.get("/imagenes/huerfanas", headers={"X-Admin-Token": "secreto"}).status_code == 200
+    # pausa=0 y reemplazar: la tarea no deja nada esperando para las otras pruebas
+    respuesta = cliente.post(ruta + "?pausa=0", headers={"X-Admin-Token": "secreto"})
+    assert respuesta.status_code == 202
+    assert respuesta.json()["tarea_id"]
+
+
+def test_subida_dice_cuando_expira(cliente):
+    subida = cliente.post("/imagenes/upload", files={"file": ("foto.jpg", _jpeg(), "image/jpeg")}).json()
+    expira = datetime.datetime.fromisoformat(subida["expira"].replace("Z", "+00:00"))
+    faltan = expira - datetime.datetime.now(datetime.timezone.utc)
+    assert datetime.timedelta(minutes=GRACIA_MINUTOS - 1) < faltan <= datetime.timedelta(minutes=GRACIA_MINUTOS)
@@ -0,0 +1,69 @@
+"""Lecturas de crud y páginas HTML con el modo guardia contra N+1 (DB_SIN_LAZY=1)."""
+import pytest
+import sqlalchemy.exc
+from sqlmodel import select
+
+import crud
+from db import DB_SIN_LAZY
+from models import Item
+
+
+def test_guardia_activa(catalogo, session):
+    # Sin carga explícita, recorrer una relación lanza en vez de hacer una consulta por fila
+    assert DB_SIN_LAZY
+    item = session.exec(select(Item).where(Item.id == catalogo["items"][0].id)).one()
+    with pytest.raises(sqlalchemy.exc.InvalidRequestError):
+        item.categorias
+
+
+def test_lecturas_crud(catalogo, session):
+    cat, ubi, inter = catalogo["categoria"], catalogo["ubicacion"], catalogo["interaccion"]
+    item = catalogo["items"][0]
+
+    assert cat.id in {c.id for c in crud.list_categorias(session)}
+    assert crud.get_categoria(session, cat.id).nombre == "Reliquias"
+    assert ubi.id in {u.id for u in crud.list_ubicaciones(session)}
+    assert crud.get_ubicacion(session, ubi.id).nombre == "Albero"
+    assert inter.id in {i.id for i in crud.list_interacciones(session)}
+    assert crud.get_interaccion(session, inter.id).descripcion == "Rezar"
+
+    fila = crud.get_item(session, item.id)
+    assert fila["categoria_ids"] == [cat.id]
+    assert fila["ubicacion_ids"] == [ubi.id]
+    assert fila["interaccion_ids"] == [inter.id]
+    assert item.id in {f.id for f in crud.listar_items(session)}
+    assert crud.get_item_detallado(session, item.id) is not None
+
+    crud.delete_item(session, item.id)
+    eliminados = {f.id: f for f in crud.listar_items_eliminados(session)}
+    assert eliminados[item.id].categoria_ids == [cat.id]
+    crud.delete_categoria(session, cat.id)
+    assert cat.id in {c.id for c in crud.listar_categorias_eliminadas(session)}
+
+
+def test_paginas_html(catalogo, session, cliente):
+    cat, ubi, inter = catalogo["categoria"], catalogo["ubicacion"], catalogo["interaccion"]
+    item = catalogo["items"][0]
+    crud.delete_item(session, catalogo["items"][1].id)
+
+    rutas = [
+        "/",
+        "/categorias",
+        f"/categorias/id/{cat.id}",
+        "/categorias/eliminadas",
+        "/ubicaciones/",
+        f"/ubicaciones/id/{ubi.id}",
+        "/ubicaciones/eliminadas",
+        "/interacciones/",
+        f"/interacciones/id/{inter.id}",
+        "/interacciones/eliminadas",
+        "/items/",
+        f"/items/{item.id}/detalles",
+        "/items/estado/eliminados",
+        f"/items/search?categoria_id={cat.id}",
+        "/imagenes/dashboard",
+    ]
+    for ruta in rutas:
+        respuesta = cliente.get(ruta, headers={"Accept": "text/html"})
+        assert respuesta.status_code == 200, ruta
+        assert respuesta.headers["content-type"].startswith("text/html"), ruta
@@ -0,0 +1,95 @@
+"""Proxy /img: candado por imagen, filtro |img de solo lectura, reducción y borrado."""
+import io
+import os
+import threading
+import time
+
+from PIL import Image
+from sqlmodel import select
+
+import crud
+from db import engine
+from models import Imagen
+from supa import proxy
+from supa import supabase
+
+BUCKET = supabase.BUCKET_POR_DEFECTO
+
+
+def _jpeg() -> bytes:
+    salida = io.BytesIO()
+    Image.new("RGB", (400, 300), (200, 40, 40)).save(salida, "JPEG", quality=98)
+    return salida.getvalue()
+
+
+def test_candado_unico_por_imagen(monkeypatch):
+    monkeypatch.setattr(proxy.cache_disco, "leer", lambda nombre: None)
+    monkeypatch.setattr(proxy.cache_disco, "escribir", lambda nombre, datos: None)
+    en_curso, maximo, llamadas = [0], [0], [0]
+
+    def calcular():
+        en_curso[0] += 1
+        llamadas[0] += 1
+        maximo[0] = max(maximo[0], en_curso[0])
+        time.sleep(0.1)
+        en_curso[0] -= 1
+        return b"datos"
+
+    # El primero calcula mientras el segundo espera; el tercero llega cuando el primero ya
+    # soltó el candado y no debe crear uno nuevo mientras el segundo sigue adentro
+    hilos = [threading.Thread(target=proxy._en_cache, args=("prueba-candado", calcular)) for _ in range(3)]
+    for hilo, pausa in zip(hilos, (0.03, 0.1, 0)):
+        hilo.start()
+        time.sleep(pausa)
+    for hilo in hilos:
+        hilo.join()
+    assert maximo[0] == 1
+    assert llamadas[0] == 3
+    assert "prueba-candado" not in proxy._candados
+
+
+def test_filtro_img_solo_lee(session, cliente):
+    backend = supabase.get_storage_backend()
+    url = backend.url_publica(BUCKET, "public/anterior_al_registro.png")
+    backend.subir(BUCKET, "public/anterior_al_registro.png", Image.new("RGB", (10, 10)).tobytes(), "image/png")
+    crud.create_categoria(session, "Imagen vieja", imagen_url=url)
+    proxy._ids.clear()
+
+    antes = len(session.exec(select(Imagen.id)).all())
+    assert proxy.url_img(url) == url  # sin fila: la URL tal cual, sin escribir
+    assert len(session.exec(select(Imagen.id)).all()) == antes
+
+    assert proxy.registrar_urls_existentes(session) >= 1
+    assert proxy.registrar_urls_existentes(session) == 0
+    proxy._ids.clear()
+    assert proxy.url_img(url, 300).startswith("/img/")
+    assert proxy.url_img("https://example.com/x.png") == "https://example.com/x.png"
+    assert proxy.url_img(None, 300) == "/img/vacio/300x200"
+
+
+def test_proxy_reduce(cliente):
+    subida = cliente.post("/imagenes/upload", files={"file": ("grande.jpg", _jpeg(), "image/jpeg")}).json()
+    respuesta = cliente.get(f"/img/{subida['id']}/150", headers={"Accept": "image/webp"})
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"] == "image/webp"
+    with Image.open(io.BytesIO(respuesta.content)) as img:
+        assert img.width == 150
+
+
+def test_imagen_borrada_sale_de_la_cache(cliente):
+    subida = cliente.post("/imagenes/upload", files={"file": ("borrar.jpg", _jpeg(), "image/jpeg")}).json()
+    # Otra subida después: la fila con el id más alto no se borra (ver olvidar_imagenes)
+    cliente.post("/imagenes/upload", files={"file": ("posterior.jpg", _jpeg(), "image/jpeg")})
+    assert cliente.get(f"/img/{subida['id']}/100").status_code == 200
+    assert proxy.url_img(subida["url"]) == f"/img/{subida['id']}/600"
+    assert any(n.startswith(f"{subida['id']}-") for n in os.listdir(proxy.cache_disco.directorio))
+
+    supabase.eliminar_imagen(*supabase.ubicar_url(subida["url"]))
+    assert not any(n.startswith(f"{subida['id']}-") for n in os.listdir(proxy.cache_disco.directorio))
+    assert subida["url"] not in proxy._ids
+    assert proxy.servir(subida["id"], 100, False) is None
+
+    # Y SQLite no reutiliza ids borrados
+    with engine.connect() as conexion:
+        tabla = conexion.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'imagen'").scalar()
+    assert "AUTOINCREMENT" in tabla
@@ -0,0 +1,23 @@
+"""Clave de la caché de páginas HTML."""
+import respuestas
+from db import COOKIE_PRIMARIA
+
+
+def _scope(query: str = "", cookie: str = "") -> dict:
+    cabeceras = [(b"cookie", cookie.encode("latin-1"))] if cookie else []
+    return {"path": "/items/", "query_string": query.encode("latin-1"), "headers": cabeceras}
+
+
+def test_clave_ordena_y_descarta_vacios():
+    assert respuestas._clave(_scope("b=2&a=1&c="), True) == respuestas._clave(_scope("a=1&b=2"), True)
+    assert respuestas._clave(_scope(), True) != respuestas._clave(_scope(), False)
+
+
+def test_clave_separa_la_cookie_de_primaria(monkeypatch):
+    con_cookie = _scope(cookie=f"otra=1; {COOKIE_PRIMARIA}=1")
+    # Sin réplicas la cookie no cambia de dónde se lee
+    monkeypatch.setattr(respuestas, "replicas", [])
+    assert respuestas._clave(con_cookie, True) == respuestas._clave(_scope(), True)
+
+    monkeypatch.setattr(respuestas, "replicas", [object()])
+    assert respuestas._clave(con_cookie, True) != respuestas._clave(_scope(), True)
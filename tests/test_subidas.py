@@ -0,0 +1,72 @@
+"""Validación de imágenes subidas: formato por bytes mágicos y límites de tamaño."""
+import io
+import struct
+import zlib
+
+from PIL import Image
+
+import subidas
+
+
+def _png(ancho: int = 20, alto: int = 20) -> bytes:
+    salida = io.BytesIO()
+    Image.new("RGB", (ancho, alto), (10, 20, 30)).save(salida, "PNG")
+    return salida.getvalue()
+
+
+def _png_declarando(ancho: int, alto: int) -> bytes:
+    """Un PNG chico cuya cabecera (IHDR) dice medir ancho x alto."""
+    datos = bytearray(_png())
+    ihdr = struct.pack(">II", ancho, alto) + bytes(datos[24:29])
+    datos[16:29] = ihdr
+    datos[29:33] = struct.pack(">I", zlib.crc32(b"IHDR" + ihdr))
+    return bytes(datos)
+
+
+def _subir(cliente, contenido: bytes, nombre: str = "foto.png", tipo: str = "image/png"):
+    return cliente.post("/imagenes/upload", files={"file": (nombre, contenido, tipo)})
+
+
+def test_subida_valida(cliente):
+    respuesta = _subir(cliente, _png())
+    assert respuesta.status_code == 201
+    assert respuesta.json()["id"]
+
+
+def test_rechaza_lo_que_no_es_imagen(cliente):
+    # El content_type declarado no cuenta: deciden los bytes
+    respuesta = _subir(cliente, b"<?php echo 1; ?>" * 10, "foto.png", "image/png")
+    assert respuesta.status_code == 415
+
+
+def test_rechaza_imagen_declarada_enorme(cliente):
+    lado = subidas.IMAGEN_MAX_LADO_ENTRADA + 1
+    respuesta = _subir(cliente, _png_declarando(lado, 10))
+    assert respuesta.status_code == 413
+    assert "px" in respuesta.json()["detail"]
+
+
+def test_rechaza_archivo_pesado(cliente, monkeypatch):
+    monkeypatch.setattr(subidas, "IMAGEN_MAX_BYTES", 1024)
+    respuesta = _subir(cliente, _png(400, 400) + b"\0" * 4096)
+    assert respuesta.status_code == 413
+
+
+def test_rechaza_por_content_length_sin_leer(cliente):
+    cuerpo = b"--x\r\n"
+    respuesta = cliente.post(
+        "/imagenes/upload",
+        content=cuerpo,
+        headers={
+            "Content-Type": "multipart/form-data; boundary=x",
+            "Content-Length": str(subidas.IMAGEN_MAX_BYTES + subidas.FORMULARIO_MAX_BYTES + 1),
+        },
+    )
+    assert respuesta.status_code == 413
+
+
+def test_inspeccionar_espera_mas_bytes():
+    png = _png()
+    assert subidas.inspeccionar(png[:4], completo=False) is None
+    info = subidas.inspeccionar(png, completo=True)
+    assert (info.formato, info.content_type, info.ancho, info.alto) == ("PNG", "image/png", 20, 20)
@@ -0,0 +1,77 @@
+"""Cola de tareas compartida entre procesos: toma atómica y plazos de las tareas en curso."""
+import threading
+import time
+
+from tareas import ColaTareas
+
+
+def _estado(cola, tarea_id):
+    return cola.estado(tarea_id)["estado"]
+
+
+def test_cada_tarea_se_toma_una_vez(tmp_path):
+    # Dos colas sobre el mismo archivo: como dos workers de uvicorn con el mismo TAREAS_DB
+    ruta = str(tmp_path / "tareas.db")
+    colas = [ColaTareas(ruta), ColaTareas(ruta)]
+    ids = {colas[0].encolar("prueba", {"n": n}) for n in range(50)}
+    tomadas = []
+
+    def tomar(cola):
+        while True:
+            with cola._lock:
+                fila = cola._tomar()
+            if fila is None:
+                return
+            tomadas.append(fila[0])
+
+    hilos = [threading.Thread(target=tomar, args=(c,)) for c in colas for _ in range(2)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(tomadas) == sorted(ids)
+    assert all(colas[1].estado(i)["intentos"] == 1 for i in ids)
+
+
+def test_iniciar_solo_retoma_tareas_vencidas(tmp_path):
+    ruta = str(tmp_path / "tareas.db")
+    viva, caida = ColaTareas(ruta, plazo_s=60), ColaTareas(ruta, plazo_s=0.05)
+    de_la_viva = viva.encolar("prueba")
+    with viva._lock:
+        viva._tomar()
+    de_la_caida = caida.encolar("prueba")
+    with caida._lock:
+        caida._tomar()
+    time.sleep(0.1)  # la caída no late: su plazo vence
+
+    hechas = []
+    otra = ColaTareas(ruta, hilos=1)
+    otra.registrar("prueba", lambda payload, datos: hechas.append(payload["_tarea_id"]))
+    otra.iniciar()
+    try:
+        for _ in range(100):
+            if hechas:
+                break
+            time.sleep(0.01)
+    finally:
+        otra.detener()
+    assert hechas == [de_la_caida]
+    assert _estado(otra, de_la_caida) == "hecha"
+    assert _estado(otra, de_la_viva) == "en_curso"
+
+
+def test_el_latido_extiende_el_plazo(tmp_path):
+    cola = ColaTareas(str(tmp_path / "tareas.db"), hilos=1, plazo_s=0.1)
+    liberar = threading.Event()
+    cola.registrar("lenta", lambda payload, datos: liberar.wait(2))
+    tarea_id = cola.encolar("lenta")
+    cola.iniciar()
+    try:
+        time.sleep(0.3)  # más que el plazo: sin latido ya estaría vencida
+        with cola._lock:
+            assert cola._recuperar_vencidas() == 0
+        assert _estado(cola, tarea_id) == "en_curso"
+        liberar.set()
+    finally:
+        cola.detener()
+    assert _estado(cola, tarea_id) == "hecha"
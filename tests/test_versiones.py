@@ -0,0 +1,39 @@
+"""Control de concurrencia optimista: la columna version y el UPDATE compare-and-swap."""
+import pytest
+from sqlmodel import Session
+
+import crud
+from db import engine
+
+
+def test_asignar_imagen_sube_la_version(catalogo, session):
+    cat = catalogo["categoria"]
+    vista = cat.version
+    assert crud.asignar_imagen(session, "categoria", cat.id, "https://example.com/nueva.png")
+    actual = crud.get_categoria(session, cat.id)
+    assert actual.imagen_url == "https://example.com/nueva.png"
+    assert actual.version == vista + 1
+
+    # Una edición con la versión de antes de la asignación ya no pisa la imagen
+    with pytest.raises(crud.ConflictoVersion):
+        crud.update_categoria(session, cat.id, nombre="Editada", version=vista)
+
+
+def test_asignar_imagen_reintenta_tras_un_conflicto(catalogo, session, monkeypatch):
+    cat = catalogo["categoria"]
+    guardar = crud._guardar_con_version
+    llamadas = []
+
+    def con_edicion_en_medio(session, entidad, obj, version=None):
+        # La primera vez, otra edición (con su propia sesión) llega entre la lectura y el UPDATE
+        llamadas.append(entidad)
+        if len(llamadas) == 1:
+            with Session(engine) as otra:
+                crud.update_categoria(otra, cat.id, descripcion="editada en paralelo")
+        return guardar(session, entidad, obj, version)
+
+    monkeypatch.setattr(crud, "_guardar_con_version", con_edicion_en_medio)
+    assert crud.asignar_imagen(session, "categoria", cat.id, "https://example.com/otra.png")
+    assert len(llamadas) == 3  # la edición, el intento que chocó y el que entró
+    actual = crud.get_categoria(session, cat.id)
+    assert (actual.imagen_url, actual.descripcion) == ("https://example.com/otra.png", "editada en paralelo")